@@ -0,0 +1,10 @@
+"""
+Benchmarks reprodutíveis do encurtador.
+
+    python -m bench dataset   --db var/bench.db --links 100000 --clicks 1000000
+    python -m bench http      --db var/bench.db --driver server --out var/http.json
+    python -m bench analytics --sizes 10000,100000,1000000 --out var/analytics.json
+    python -m bench compare   var/antes.json var/depois.json
+
+Os dados são gerados com semente fixa (--seed) e popularidade Zipf dos slugs.
+"""
@@ -0,0 +1,79 @@
+from __future__ import annotations
+import argparse, json, sys
+from . import stats
+
+def _csv(value: str | None):
+    return [v for v in value.split(",") if v] if value else None
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Benchmarks do encurtador")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("dataset", help="gera um banco sintético (Zipf)")
+    p.add_argument("--db", required=True)
+    p.add_argument("--links", type=int, default=100_000)
+    p.add_argument("--clicks", type=int, default=1_000_000)
+    p.add_argument("--days", type=int, default=90)
+    p.add_argument("--zipf", type=float, default=1.1)
+    p.add_argument("--seed", type=int, default=42)
+
+    p = sub.add_parser("http", help="carga nos endpoints (test client, servidor local ou URL)")
+    p.add_argument("--db", required=True, help="banco gerado por `dataset`")
+    p.add_argument("--driver", choices=("testclient", "wsgi", "asgi", "server", "url"), default="testclient")
+    p.add_argument("--url", help="base URL quando --driver url (ex.: gunicorn já rodando)")
+    p.add_argument("--requests", type=int, default=2000)
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--only", help="cenários separados por vírgula")
+    p.add_argument("--out")
+
+    p = sub.add_parser("analytics", help="micro-benchmarks das funções de analytics")
+    p.add_argument("--sizes", default="10000,100000,1000000", help="nº de cliques por banco")
+    p.add_argument("--repeat", type=int, default=50)
+    p.add_argument("--workdir", help="reaproveita bancos gerados entre execuções")
+    p.add_argument("--only", help="funções separadas por vírgula")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--out")
+
+    p = sub.add_parser("compare", help="compara dois JSONs de resultado")
+    p.add_argument("old")
+    p.add_argument("new")
+
+    args = parser.parse_args(argv)
+
+    if args.cmd == "dataset":
+        from .dataset import generate
+        meta = generate(args.db, links=args.links, clicks=args.clicks, days=args.days,
+                        seed=args.seed, zipf_s=args.zipf)
+        print(json.dumps(meta, indent=2))
+        return 0
+
+    if args.cmd == "http":
+        if args.driver == "url" and not args.url:
+            parser.error("--driver url exige --url")
+        from . import load
+        results = load.run(args.db, driver=args.driver, requests=args.requests,
+                           concurrency=args.concurrency, only=_csv(args.only), url=args.url)
+        stats.save(args.out, {"meta": stats.metadata(**{k: v for k, v in vars(args).items() if k != "out"}),
+                              "results": results})
+        return 0
+
+    if args.cmd == "analytics":
+        from . import micro
+        sizes = [int(s) for s in _csv(args.sizes)]
+        results = micro.run(sizes, repeat=args.repeat, seed=args.seed, workdir=args.workdir, only=_csv(args.only))
+        stats.save(args.out, {"meta": stats.metadata(**{k: v for k, v in vars(args).items() if k != "out"}),
+                              "results": results})
+        return 0
+
+    if args.cmd == "compare":
+        with open(args.old, encoding="utf-8") as f:
+            old = json.load(f)
+        with open(args.new, encoding="utf-8") as f:
+            new = json.load(f)
+        for line in stats.compare(old, new):
+            print(line)
+        return 0
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
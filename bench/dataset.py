@@ -0,0 +1,109 @@
+from __future__ import annotations
+import json, random, sqlite3, time
+from itertools import accumulate
+from urlshort.db import connect
+from urlshort.clicks import insert_clicks
+from urlshort.migrate import run_migrations
+from urlshort.slugs import encode_base62
+
+# Slugs do dataset têm 7 dígitos: não colidem com os do alocador (SLUG_LEN=6)
+DATASET_SLUG_LEN = 7
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 14_5) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.5 Safari/605.1.15",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148",
+    "Mozilla/5.0 (Linux; Android 14) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Mobile Safari/537.36",
+    "curl/8.5.0",
+    "Googlebot/2.1 (+http://www.google.com/bot.html)",
+]
+REFERRERS = [None, "https://www.google.com/", "https://t.co/", "https://www.facebook.com/", "https://news.ycombinator.com/"]
+
+class Zipf:
+    """
+    Amostrador Zipf(s) sobre n itens (rank 0 é o mais popular), só com stdlib.
+    """
+
+    def __init__(self, n: int, s: float = 1.1, rng: random.Random | None = None):
+        self.n = n
+        self.rng = rng or random.Random(0)
+        self.cum = list(accumulate(1.0 / (k ** s) for k in range(1, n + 1)))
+        self._ranks = range(n)
+
+    def sample(self, k: int = 1) -> list[int]:
+        return self.rng.choices(self._ranks, cum_weights=self.cum, k=k)
+
+def slug_for(link_id: int) -> str:
+    return encode_base62(link_id, DATASET_SLUG_LEN)
+
+def popularity(links: int, seed: int) -> list[int]:
+    """
+    rank -> link_id: a mesma semente gera o mesmo ranking (usado pelo gerador e pelos drivers).
+    """
+    order = list(range(1, links + 1))
+    random.Random(seed).shuffle(order)
+    return order
+
+def generate(db_path: str, links: int, clicks: int, days: int = 90, seed: int = 42,
+             zipf_s: float = 1.1, chunk: int = 50_000, progress=print) -> dict:
+    """
+    Gera `links` links e `clicks` cliques (Zipf por link, uniformes nos últimos `days`
+    dias) num banco novo, já com schema/migrações e rollup. Grava <db>.meta.json.
+    """
+    conn = connect(db_path)
+    run_migrations(conn, progress=lambda msg: None)
+    conn.execute("PRAGMA synchronous = OFF")
+    if conn.execute("SELECT 1 FROM links LIMIT 1").fetchone():
+        raise SystemExit(f"{db_path} já tem dados; use um arquivo novo")
+
+    rng = random.Random(seed)
+    now = int(time.time())
+    span = days * 86400
+    t0 = time.monotonic()
+
+    for lo in range(1, links + 1, chunk):
+        hi = min(links, lo + chunk - 1)
+        rows = [
+            (i, slug_for(i), f"https://example.com/{i}/{rng.randrange(10**6)}",
+             1 if rng.random() < 0.7 else 0,
+             time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(now - span + (span * i) // max(1, links))))
+            for i in range(lo, hi + 1)
+        ]
+        with conn:
+            conn.executemany(
+                "INSERT INTO links (id, slug, target_url, is_permanent, created_at) VALUES (?,?,?,?,?)", rows
+            )
+        progress(f"links: {hi}/{links}")
+
+    rank_to_id = popularity(links, seed)
+    zipf = Zipf(links, zipf_s, rng)
+    ips = [f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}" for _ in range(50_000)]
+    done = 0
+    while done < clicks:
+        n = min(chunk, clicks - done)
+        rows = []
+        for rank in zipf.sample(n):
+            ts = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(now - rng.randrange(span)))
+            rows.append((rank_to_id[rank], ts, rng.choice(ips), rng.choice(USER_AGENTS), rng.choice(REFERRERS)))
+        insert_clicks(conn, rows)
+        done += n
+        progress(f"clicks: {done}/{clicks}")
+
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("ANALYZE")
+    conn.close()
+    meta = {"links": links, "clicks": clicks, "days": days, "seed": seed, "zipf_s": zipf_s,
+            "elapsed_s": round(time.monotonic() - t0, 2)}
+    with open(db_path + ".meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+def load_meta(db_path: str) -> dict:
+    try:
+        with open(db_path + ".meta.json", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        conn = sqlite3.connect(db_path)
+        n = conn.execute("SELECT COUNT(*) FROM links").fetchone()[0]
+        conn.close()
+        return {"links": n, "seed": 42, "zipf_s": 1.1}
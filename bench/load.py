@@ -0,0 +1,279 @@
+from __future__ import annotations
+import os, json, random, asyncio, threading, time
+import http.client
+from urllib.parse import urlparse
+from .dataset import Zipf, popularity, slug_for, load_meta
+from .stats import summarize
+
+API_TOKEN = "bench-token"
+
+def make_app(db_path: str, **overrides):
+    """
+    App configurado para benchmark: sem rate limit efetivo e com logs em WARNING.
+    """
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    from urlshort.app import create_app
+    config = {
+        "DB_PATH": db_path,
+        "API_TOKEN": API_TOKEN,
+        "RATE_LIMIT_MAX": 10**9,
+        "MAX_FORM_BYTES": 1 << 20,
+    }
+    config.update(overrides)
+    return create_app(config)
+
+def scenarios(db_path: str, seed: int = 1):
+    """
+    Cenário -> gerador de (método, caminho, corpo JSON ou None).
+    Slugs seguem a mesma popularidade Zipf do dataset.
+    """
+    meta = load_meta(db_path)
+    rng = random.Random(seed)
+    rank_to_id = popularity(meta["links"], meta.get("seed", 42))
+    zipf = Zipf(meta["links"], meta.get("zipf_s", 1.1), rng)
+    hot = slug_for(rank_to_id[0])
+
+    def hot_slug():
+        return slug_for(rank_to_id[zipf.sample(1)[0]])
+
+    return {
+        "redirect": lambda: ("GET", "/" + hot_slug(), None),
+        "redirect_miss": lambda: ("GET", "/zz" + str(rng.randrange(10**6)), None),
+        "api_get": lambda: ("GET", "/api/links/" + hot_slug(), None),
+        "api_get_day": lambda: ("GET", "/api/links/" + hot_slug() + "?aggregate=day", None),
+        "api_create": lambda: ("POST", "/api/links", {"target_url": f"https://bench.example/{rng.randrange(10**9)}"}),
+        "api_list": lambda: ("GET", "/api/links?limit=20", None),
+        "admin_home": lambda: ("GET", "/admin/", None),
+        "admin_search": lambda: ("GET", "/admin/?q=example.com/1", None),
+        "admin_detail": lambda: ("GET", "/admin/" + hot, None),
+    }
+
+def make_asgi_app(db_path: str, **overrides):
+    """
+    Mesmo app de make_app, servido pelo modo ASGI (urlshort.asgi).
+    """
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    from urlshort.asgi import create_asgi_app
+    config = {
+        "DB_PATH": db_path,
+        "API_TOKEN": API_TOKEN,
+        "RATE_LIMIT_MAX": 10**9,
+        "MAX_FORM_BYTES": 1 << 20,
+    }
+    config.update(overrides)
+    return create_asgi_app(config)
+
+def _headers(body):
+    h = {"Authorization": f"Bearer {API_TOKEN}"}
+    if body is not None:
+        h["Content-Type"] = "application/json"
+    return h
+
+def run_testclient(app, make_request, requests: int) -> dict:
+    """
+    Executa `requests` chamadas sequenciais pelo test client do Flask (sem rede).
+    """
+    client = app.test_client()
+    latencies, errors = [], 0
+    t0 = time.perf_counter()
+    for _ in range(requests):
+        method, path, body = make_request()
+        s = time.perf_counter()
+        resp = client.open(path, method=method, json=body, headers=_headers(body))
+        latencies.append(time.perf_counter() - s)
+        if resp.status_code >= 500:
+            errors += 1
+    return summarize(latencies, time.perf_counter() - t0, errors)
+
+def run_http(base_url: str, make_request, requests: int, concurrency: int = 8) -> dict:
+    """
+    Executa `requests` chamadas HTTP reais com `concurrency` conexões keep-alive.
+    """
+    u = urlparse(base_url)
+    lock = threading.Lock()
+    latencies, errors = [], [0]
+    remaining = [requests]
+
+    def worker():
+        conn = http.client.HTTPConnection(u.hostname, u.port or 80, timeout=30)
+        local = []
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+                method, path, body = make_request()
+            data = json.dumps(body).encode() if body is not None else None
+            s = time.perf_counter()
+            try:
+                conn.request(method, path, body=data, headers=_headers(body))
+                resp = conn.getresponse()
+                resp.read()
+                status = resp.status
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(u.hostname, u.port or 80, timeout=30)
+                status = 599
+            local.append(time.perf_counter() - s)
+            if status >= 500:
+                with lock:
+                    errors[0] += 1
+        conn.close()
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(latencies, time.perf_counter() - t0, errors[0])
+
+def run_wsgi(app, make_request, requests: int, concurrency: int = 8) -> dict:
+    """
+    Chama o callable WSGI em processo (sem rede) a partir de `concurrency` threads.
+    """
+    from werkzeug.test import EnvironBuilder
+    lock = threading.Lock()
+    latencies, errors = [], [0]
+    remaining = [requests]
+
+    def worker():
+        local = []
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+                method, path, body = make_request()
+            environ = EnvironBuilder(path=path, method=method, json=body, headers=_headers(body)).get_environ()
+            status = []
+            s = time.perf_counter()
+            result = app(environ, lambda st, h, exc=None: status.append(int(st[:3])))
+            for _ in result:
+                pass
+            getattr(result, "close", lambda: None)()
+            local.append(time.perf_counter() - s)
+            if status[0] >= 500:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(latencies, time.perf_counter() - t0, errors[0])
+
+def run_asgi(asgi_app, make_request, requests: int, concurrency: int = 8) -> dict:
+    """
+    Chama o app ASGI em processo (sem rede) com `concurrency` tarefas no event loop.
+    """
+    latencies, errors = [], [0]
+    remaining = [requests]
+
+    async def one(method, path, body):
+        data = json.dumps(body).encode() if body is not None else b""
+        raw_path, _, qs = path.partition("?")
+        headers = [(k.lower().encode(), v.encode()) for k, v in _headers(body).items()]
+        scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+                 "scheme": "http", "path": raw_path, "raw_path": raw_path.encode(), "root_path": "",
+                 "query_string": qs.encode(), "headers": headers,
+                 "client": ("127.0.0.1", 50000), "server": ("127.0.0.1", 80)}
+        sent = [False]
+        status = [0]
+
+        async def receive():
+            if not sent[0]:
+                sent[0] = True
+                return {"type": "http.request", "body": data, "more_body": False}
+            await asyncio.sleep(3600)
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+
+        await asgi_app(scope, receive, send)
+        return status[0]
+
+    async def worker():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            s = time.perf_counter()
+            status = await one(*make_request())
+            latencies.append(time.perf_counter() - s)
+            if status >= 500:
+                errors[0] += 1
+
+    async def main():
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    t0 = time.perf_counter()
+    asyncio.run(main())
+    return summarize(latencies, time.perf_counter() - t0, errors[0])
+
+class LocalServer:
+    """
+    Servidor WSGI real (werkzeug, multi-thread) numa porta livre de 127.0.0.1.
+    """
+
+    def __init__(self, app):
+        from werkzeug.serving import make_server
+        self.server = make_server("127.0.0.1", 0, app, threaded=True)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.thread.join(5)
+
+def run(db_path: str, driver: str = "testclient", requests: int = 2000, concurrency: int = 8,
+        only: list[str] | None = None, url: str | None = None, warmup: int = 50) -> dict:
+    """
+    Roda os cenários e devolve {cenário: resumo}.
+    driver: testclient | wsgi | asgi | server | url. `wsgi` e `asgi` chamam o app em
+    processo com `concurrency` threads/tarefas, para comparar os dois caminhos.
+    """
+    gens = scenarios(db_path)
+    names = [n for n in gens if not only or n in only]
+    results = {}
+    if driver == "asgi":
+        app = make_asgi_app(db_path)
+    elif driver == "wsgi":
+        # Mesmo buffer de cliques do modo ASGI, para comparar só o caminho do request
+        app = make_app(db_path, CLICK_BUFFER=True)
+    else:
+        app = make_app(db_path) if driver != "url" else None
+    server = LocalServer(app) if driver == "server" else None
+    if server:
+        server.__enter__()
+    try:
+        for name in names:
+            if driver == "testclient":
+                run_testclient(app, gens[name], warmup)
+                results[name] = run_testclient(app, gens[name], requests)
+            elif driver == "wsgi":
+                run_wsgi(app, gens[name], warmup, concurrency)
+                results[name] = run_wsgi(app, gens[name], requests, concurrency)
+            elif driver == "asgi":
+                run_asgi(app, gens[name], warmup, concurrency)
+                results[name] = run_asgi(app, gens[name], requests, concurrency)
+            else:
+                base = server.url if server else url
+                run_http(base, gens[name], warmup, concurrency)
+                results[name] = run_http(base, gens[name], requests, concurrency)
+            r = results[name]
+            print(f"{name:14s} {r['throughput_rps']:>10.1f} rps  p50 {r['p50_ms']:.2f}ms  "
+                  f"p95 {r['p95_ms']:.2f}ms  p99 {r['p99_ms']:.2f}ms  err {r['errors']}", flush=True)
+    finally:
+        if server:
+            server.__exit__(None, None, None)
+    return results
@@ -0,0 +1,63 @@
+from __future__ import annotations
+import os, time, tempfile
+from urlshort import analytics as an
+from urlshort.db import connect
+from .dataset import generate, popularity, slug_for
+from .stats import summarize
+
+def _time(fn, repeat: int) -> dict:
+    fn()  # aquece cache de páginas/statements
+    latencies = []
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        s = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - s)
+    return summarize(latencies, time.perf_counter() - t0)
+
+def cases(db, links: int, seed: int):
+    """
+    Funções do módulo analytics com argumentos representativos do admin/API.
+    """
+    hot_id = popularity(links, seed)[0]
+    deep = an.totals_by_link(db, limit=1, offset=max(0, links - 21))
+    deep_after = (deep[0]["created_at"], deep[0]["id"]) if deep else None
+    return {
+        "totals_by_link": lambda: an.totals_by_link(db, limit=20),
+        "totals_by_link_range": lambda: an.totals_by_link(db, start="2000-01-01", end="2100-01-01", limit=20),
+        "totals_by_link_q": lambda: an.totals_by_link(db, q="example.com/1", limit=20),
+        "totals_by_link_deep": lambda: an.totals_by_link(db, limit=20, after=deep_after),
+        "count_links": lambda: an.count_links(db),
+        "count_links_q": lambda: an.count_links(db, q="example.com/1"),
+        "clicks_per_day": lambda: an.clicks_per_day(db, link_id=hot_id),
+        "count_clicks": lambda: an.count_clicks(db, link_id=hot_id),
+        "recent_clicks": lambda: an.recent_clicks(db, link_id=hot_id, limit=100),
+        "get_link_by_slug": lambda: an.get_link_by_slug(db, slug_for(hot_id)),
+    }
+
+def run(sizes: list[int], repeat: int = 50, links_ratio: int = 20, seed: int = 42,
+        workdir: str | None = None, only: list[str] | None = None) -> dict:
+    """
+    Para cada tamanho (nº de cliques), gera um banco com clicks/links_ratio links e
+    mede cada função de analytics. Chaves do resultado: "<função>@<tamanho>".
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix="urlshort-bench-")
+    results = {}
+    for size in sizes:
+        links = max(100, size // links_ratio)
+        db_path = os.path.join(workdir, f"analytics-{size}.db")
+        if not os.path.exists(db_path):
+            print(f"gerando {db_path}: {links} links, {size} cliques", flush=True)
+            generate(db_path, links=links, clicks=size, seed=seed, progress=lambda msg: None)
+        db = connect(db_path)
+        try:
+            for name, fn in cases(db, links, seed).items():
+                if only and name not in only:
+                    continue
+                r = _time(fn, repeat)
+                results[f"{name}@{size}"] = r
+                print(f"{name + '@' + str(size):32s} p50 {r['p50_ms']:.3f}ms  p95 {r['p95_ms']:.3f}ms  "
+                      f"p99 {r['p99_ms']:.3f}ms", flush=True)
+        finally:
+            db.close()
+    return results
@@ -0,0 +1,71 @@
+from __future__ import annotations
+import json, math, os, platform, sqlite3, subprocess, time
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """
+    Percentil por nearest-rank (p em 0..100) de uma lista já ordenada.
+    """
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(p / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+def summarize(latencies: list[float], elapsed: float, errors: int = 0) -> dict:
+    """
+    latencies em segundos -> contagem, throughput e p50/p95/p99 em ms.
+    """
+    lat = sorted(latencies)
+    n = len(lat)
+    return {
+        "requests": n,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 4),
+        "throughput_rps": round(n / elapsed, 2) if elapsed > 0 else 0.0,
+        "mean_ms": round(sum(lat) / n * 1000, 3) if n else 0.0,
+        "p50_ms": round(percentile(lat, 50) * 1000, 3),
+        "p95_ms": round(percentile(lat, 95) * 1000, 3),
+        "p99_ms": round(percentile(lat, 99) * 1000, 3),
+        "max_ms": round(lat[-1] * 1000, 3) if n else 0.0,
+    }
+
+def _git_rev() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def metadata(**params) -> dict:
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_rev": _git_rev(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "params": params,
+    }
+
+def save(path: str | None, payload: dict) -> None:
+    text = json.dumps(payload, indent=2, sort_keys=True)
+    if path:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+def compare(old: dict, new: dict) -> list[str]:
+    """
+    Linhas comparando throughput/p50/p95/p99 de dois resultados com os mesmos cenários.
+    """
+    lines = []
+    keys = ("throughput_rps", "p50_ms", "p95_ms", "p99_ms")
+    for name in sorted(set(old.get("results", {})) & set(new.get("results", {}))):
+        a, b = old["results"][name], new["results"][name]
+        parts = []
+        for k in keys:
+            if k in a and k in b and a[k]:
+                delta = (b[k] - a[k]) / a[k] * 100
+                parts.append(f"{k} {a[k]:.2f} -> {b[k]:.2f} ({delta:+.1f}%)")
+        lines.append(f"{name}: " + "; ".join(parts))
+    return lines
@@ -0,0 +1,38 @@
+from __future__ import annotations
+import sqlite3
+import pytest
+from urlshort.app import create_app
+from urlshort.db import init_db, get_db
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """
+    App com banco novo em tmp_path (schema + migrações), sem config/config.json.
+    """
+    monkeypatch.setenv("APP_CONFIG", str(tmp_path / "missing.json"))
+    app = create_app({
+        "TESTING": True,
+        "DB_PATH": str(tmp_path / "data.db"),
+        "TEMPLATE_CACHE_DIR": "",
+        "TEMPLATE_PRELOAD": False,
+        "TRENDING_ENABLED": False,
+        "LOG_LEVEL": "WARNING",
+    })
+    with app.app_context():
+        init_db()
+    return app
+
+@pytest.fixture
+def db(app):
+    with app.app_context():
+        yield get_db()
+
+@pytest.fixture
+def raw_db(tmp_path):
+    """
+    Conexão sqlite3 crua num arquivo vazio (sem app).
+    """
+    conn = sqlite3.connect(tmp_path / "raw.db")
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
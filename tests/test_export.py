@@ -0,0 +1,26 @@
+from __future__ import annotations
+from urlshort import analytics as an
+from urlshort.export import iter_link_totals
+from urlshort.memo import get_result_cache
+
+def test_link_export_bypasses_the_result_cache(app, db):
+    db.executemany("INSERT INTO links (slug, target_url) VALUES (?, 'https://example.com')",
+                   [(f"s{i}",) for i in range(2500)])
+    db.commit()
+    cache = get_result_cache()
+    an.totals_by_link(db, limit=20)  # entrada "quente" de dashboard
+    before = cache.stats()
+    assert before["entries"] == 1
+
+    assert len(list(iter_link_totals(db, chunk=1000))) == 2500
+    assert cache.stats()["entries"] == before["entries"]
+    assert cache.stats()["bytes"] == before["bytes"]
+
+    app.config["API_TOKEN"] = "t"
+    resp = app.test_client().get("/api/export/links?format=ndjson", headers={"Authorization": "Bearer t"})
+    assert resp.status_code == 200
+    assert len(resp.data.splitlines()) == 2500
+    assert cache.stats()["entries"] == before["entries"]
+    # A entrada quente continua lá
+    an.totals_by_link(db, limit=20)
+    assert cache.stats()["hits"] == before["hits"] + 1
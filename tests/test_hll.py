@@ -0,0 +1,72 @@
+from __future__ import annotations
+import pytest
+from urlshort import hll
+from urlshort.clicks import insert_clicks
+
+def ips(start, stop):
+    return [f"10.{i >> 16}.{(i >> 8) & 255}.{i & 255}" for i in range(start, stop)]
+
+def test_empty_and_duplicates():
+    assert hll.estimate(None) == 0
+    assert hll.estimate(hll.sketch_of([])) == 0
+    assert hll.estimate(hll.sketch_of(["1.1.1.1"] * 1000 + [None, ""])) == 1
+
+@pytest.mark.parametrize("n", [10, 100, 1000, 5000, 20000, 100000])
+def test_estimate_within_error_bounds(n):
+    estimate = hll.estimate(hll.sketch_of(ips(0, n)))
+    # 3 erros padrão (~9,75%): falha com probabilidade ~0,3% para um conjunto aleatório
+    assert abs(estimate - n) <= 3 * hll.ERROR * n
+
+def test_small_cardinalities_are_exact_enough():
+    for n in range(1, 60):
+        assert abs(hll.estimate(hll.sketch_of(ips(0, n))) - n) <= 1
+
+def test_merge_is_the_union():
+    a, b = hll.sketch_of(ips(0, 6000)), hll.sketch_of(ips(4000, 10000))
+    union = hll.merge(a, b)
+    assert union == bytes(hll.sketch_of(ips(0, 10000)))
+    assert abs(hll.estimate(union) - 10000) <= 3 * hll.ERROR * 10000
+    assert hll.merge(b, a) == union
+    assert hll.merge(union, a) == union
+    assert hll.merge(None, a) == bytes(a) and hll.merge(a, None) == bytes(a)
+
+def test_merge_all_matches_pairwise_merge():
+    parts = [hll.sketch_of(ips(i * 1000, i * 1000 + 1500)) for i in range(5)]
+    pairwise = parts[0]
+    for p in parts[1:]:
+        pairwise = hll.merge(pairwise, p)
+    assert hll.merge_all(parts) == pairwise
+    assert hll.merge_all(parts[:1]) == bytes(parts[0])
+    assert hll.merge_all([]) is None
+
+def test_batched_updates_match_a_sketch_of_all_clicks(db):
+    db.execute("INSERT INTO links (slug, target_url) VALUES ('a', 'https://a.example')")
+    db.commit()
+    addrs = ips(0, 3000) + ips(0, 500)
+    rows = [(1, "2024-05-01 12:00:00", ip, "ua", None) for ip in addrs]
+    # Lotes de tamanhos diferentes, incluindo o caminho de um clique por transação
+    for start, stop in [(0, 1), (1, 2), (2, 700), (700, 701), (701, 3500)]:
+        insert_clicks(db, rows[start:stop])
+    stored = db.execute("SELECT sketch FROM clicks_hll WHERE link_id = 1 AND day = '2024-05-01'").fetchone()[0]
+    assert stored == bytes(hll.sketch_of(addrs))
+    assert hll.unique_visitors(db, 1) == hll.estimate(stored)
+
+def test_repeated_visitor_does_not_rewrite_the_sketch(db):
+    db.execute("INSERT INTO links (slug, target_url) VALUES ('a', 'https://a.example')")
+    db.commit()
+    insert_clicks(db, [(1, "2024-05-01 12:00:00", "1.2.3.4", None, None)])
+    before = db.total_changes
+    hll.update_sketches(db, [(1, "2024-05-01 13:00:00", "1.2.3.4", None, None)])
+    assert db.total_changes == before
+    db.rollback()
+
+def test_unique_visitors_per_day_counts_returning_visitors_once(db):
+    db.execute("INSERT INTO links (slug, target_url) VALUES ('a', 'https://a.example')")
+    db.commit()
+    insert_clicks(db, [(1, "2024-05-01 10:00:00", ip, None, None) for ip in ips(0, 40)])
+    insert_clicks(db, [(1, "2024-05-02 10:00:00", ip, None, None) for ip in ips(20, 60)])
+    total, per_day = hll.unique_visitors_per_day(db, 1)
+    assert sorted(per_day) == ["2024-05-01", "2024-05-02"]
+    assert all(abs(n - 40) <= 1 for n in per_day.values())
+    assert abs(total - 60) <= 1
+    assert hll.unique_visitors(db, 1, start="2024-05-02") == per_day["2024-05-02"]
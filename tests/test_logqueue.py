@@ -0,0 +1,58 @@
+from __future__ import annotations
+import io, logging, logging.handlers
+from urlshort.logqueue import LogPipeline
+
+class CountingStream(io.StringIO):
+    flushes = 0
+
+    def flush(self):
+        self.flushes += 1
+        super().flush()
+
+def record(name, msg):
+    return logging.LogRecord(name, logging.INFO, __file__, 1, msg, None, None)
+
+def test_batch_flushes_each_handler_once_without_touching_it():
+    stream = CountingStream()
+    h = logging.StreamHandler(stream)
+    pipeline = LogPipeline({"app": [h], "access": [h]})
+    pipeline._write([record("app" if i % 2 else "access", f"m{i}") for i in range(100)])
+    assert stream.getvalue().splitlines() == [f"m{i}" for i in range(100)]
+    assert stream.flushes == 1
+    assert "flush" not in vars(h)
+    # O mesmo handler usado direto (root, outros loggers) continua com flush por registro
+    h.handle(record("other", "direct"))
+    assert stream.flushes == 2
+
+def test_handler_with_flush_as_instance_attribute():
+    stream = CountingStream()
+    h = logging.StreamHandler(stream)
+    calls = []
+    h.flush = lambda: calls.append(1)
+    LogPipeline({"app": [h]})._write([record("app", "a"), record("app", "b")])
+    assert stream.getvalue() == "a\nb\n"
+    assert calls == [1]
+
+def test_rotating_file_handler_still_rotates(tmp_path):
+    path = tmp_path / "app.log"
+    h = logging.handlers.RotatingFileHandler(path, maxBytes=50, backupCount=2, delay=True)
+    try:
+        LogPipeline({"app": [h]})._write([record("app", "x" * 20) for _ in range(6)])
+    finally:
+        h.close()
+    assert (tmp_path / "app.log.1").exists()
+    lines = sum(len(p.read_text().splitlines()) for p in tmp_path.glob("app.log*"))
+    assert lines == 6
+
+def test_custom_handler_gets_handle():
+    seen = []
+
+    class ListHandler(logging.Handler):
+        def emit(self, r):
+            seen.append(r.getMessage())
+
+    h = ListHandler(level=logging.WARNING)
+    pipeline = LogPipeline({"app": [h]})
+    pipeline._write([record("app", "info"), logging.LogRecord("app", logging.ERROR, __file__, 1, "err", None, None)])
+    assert seen == ["err"]
+    assert pipeline.stats()["written"] == 2
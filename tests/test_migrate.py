@@ -0,0 +1,115 @@
+from __future__ import annotations
+import pytest
+from urlshort import migrate
+from urlshort.migrate import (
+    list_migrations, latest_version, current_version, pending_migrations, apply_migration, run_migrations,
+)
+
+# Schema de antes da 0001/0002: clicks com user_agent/referrer em texto
+LEGACY_SQL = """
+CREATE TABLE links (
+  id INTEGER PRIMARY KEY AUTOINCREMENT, slug TEXT NOT NULL, target_url TEXT NOT NULL,
+  is_permanent INTEGER NOT NULL DEFAULT 1, created_at DATETIME NOT NULL DEFAULT (CURRENT_TIMESTAMP),
+  created_ip TEXT, note TEXT
+);
+CREATE UNIQUE INDEX idx_links_slug ON links(slug);
+CREATE TABLE clicks (
+  id INTEGER PRIMARY KEY AUTOINCREMENT, link_id INTEGER NOT NULL,
+  ts DATETIME NOT NULL DEFAULT (CURRENT_TIMESTAMP), ip TEXT, user_agent TEXT, referrer TEXT,
+  FOREIGN KEY (link_id) REFERENCES links(id) ON DELETE CASCADE
+);
+CREATE INDEX idx_clicks_link_id ON clicks(link_id);
+CREATE INDEX idx_clicks_ts ON clicks(ts);
+"""
+
+def quiet(msg):
+    pass
+
+def schema(db):
+    return sorted(tuple(r) for r in db.execute("SELECT type, name, sql FROM sqlite_master"))
+
+def test_bundled_migrations_are_consecutive():
+    versions = [v for v, _, _ in list_migrations()]
+    assert versions == list(range(1, len(versions) + 1))
+    assert latest_version() == versions[-1]
+
+def test_list_migrations_orders_by_version_and_ignores_other_files(tmp_path, monkeypatch):
+    for name in ("0010_c.sql", "0002_b.py", "0001_a.sql", "notes.txt", "__init__.py"):
+        (tmp_path / name).write_text("")
+    monkeypatch.setattr(migrate, "MIGRATIONS_DIR", tmp_path)
+    assert [(v, n) for v, n, _ in list_migrations()] == [(1, "a"), (2, "b"), (10, "c")]
+
+def test_duplicate_versions_are_rejected(tmp_path, monkeypatch):
+    (tmp_path / "0001_a.sql").write_text("")
+    (tmp_path / "0001_b.sql").write_text("")
+    monkeypatch.setattr(migrate, "MIGRATIONS_DIR", tmp_path)
+    with pytest.raises(RuntimeError):
+        list_migrations()
+
+def test_sql_migrations_apply_in_order_and_stop_at_target(tmp_path, monkeypatch, raw_db):
+    (tmp_path / "0001_create.sql").write_text("CREATE TABLE t (a INTEGER);")
+    (tmp_path / "0002_add_column.sql").write_text("ALTER TABLE t ADD COLUMN b TEXT;")
+    (tmp_path / "0003_fill.sql").write_text("INSERT INTO t (a, b) VALUES (1, 'x');")
+    monkeypatch.setattr(migrate, "MIGRATIONS_DIR", tmp_path)
+
+    for m in pending_migrations(raw_db, target=2):
+        apply_migration(raw_db, *m, quiet)
+    assert current_version(raw_db) == 2
+    assert [r[1] for r in raw_db.execute("PRAGMA table_info(t)")] == ["a", "b"]
+    assert raw_db.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+
+    for m in pending_migrations(raw_db):
+        apply_migration(raw_db, *m, quiet)
+    assert current_version(raw_db) == 3
+    assert pending_migrations(raw_db) == []
+
+def test_failed_migration_keeps_previous_version(tmp_path, monkeypatch, raw_db):
+    (tmp_path / "0001_create.sql").write_text("CREATE TABLE t (a INTEGER);")
+    (tmp_path / "0002_broken.sql").write_text("INSERT INTO t VALUES (1); INSERT INTO missing VALUES (1);")
+    monkeypatch.setattr(migrate, "MIGRATIONS_DIR", tmp_path)
+    versions = pending_migrations(raw_db)
+    apply_migration(raw_db, *versions[0], quiet)
+    with pytest.raises(Exception):
+        apply_migration(raw_db, *versions[1], quiet)
+    assert current_version(raw_db) == 1
+    assert raw_db.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+
+def test_run_migrations_is_idempotent(raw_db):
+    assert run_migrations(raw_db, progress=quiet) == [v for v, _, _ in list_migrations()]
+    before = schema(raw_db)
+    assert run_migrations(raw_db, progress=quiet) == []
+    assert current_version(raw_db) == latest_version()
+    assert schema(raw_db) == before
+
+def test_0002_converts_existing_clicks(raw_db):
+    raw_db.executescript(LEGACY_SQL)
+    raw_db.execute("INSERT INTO links (slug, target_url) VALUES ('a', 'https://a.example'), ('b', 'https://b.example')")
+    clicks = [
+        (1, "2024-01-01 10:00:00", "1.1.1.1", "Mozilla/5.0", "https://ref.example/"),
+        (1, "2024-01-01 11:00:00", "1.1.1.2", "Mozilla/5.0", None),
+        (2, "2024-01-02 09:00:00", None, None, "https://ref.example/"),
+        (2, "2024-01-03 09:00:00", "1.1.1.3", "curl/8.0", "https://other.example/"),
+    ]
+    raw_db.executemany("INSERT INTO clicks (link_id, ts, ip, user_agent, referrer) VALUES (?,?,?,?,?)", clicks)
+    raw_db.commit()
+
+    assert run_migrations(raw_db, progress=quiet) == [1, 2]
+
+    cols = [r[1] for r in raw_db.execute("PRAGMA table_info(clicks)")]
+    assert "user_agent_id" in cols and "user_agent" not in cols
+    rows = raw_db.execute("""
+        SELECT c.link_id, c.ts, c.ip, ua.value, rf.value FROM clicks c
+        LEFT JOIN user_agents ua ON ua.id = c.user_agent_id
+        LEFT JOIN referrers rf ON rf.id = c.referrer_id
+        ORDER BY c.id
+    """).fetchall()
+    assert [tuple(r) for r in rows] == clicks
+    assert raw_db.execute("SELECT COUNT(*) FROM user_agents").fetchone()[0] == 2
+    assert raw_db.execute("SELECT COUNT(*) FROM referrers").fetchone()[0] == 2
+    indexes = {r[0] for r in raw_db.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'clicks'")}
+    assert indexes == {"idx_clicks_link_ts"}
+    # Novos ids continuam depois dos antigos (AUTOINCREMENT preservado)
+    raw_db.execute("INSERT INTO clicks (link_id, ts) VALUES (1, '2024-01-04 00:00:00')")
+    assert raw_db.execute("SELECT MAX(id) FROM clicks").fetchone()[0] == len(clicks) + 1
+
+    assert run_migrations(raw_db, progress=quiet) == []
@@ -0,0 +1,65 @@
+from __future__ import annotations
+import pytest
+from urlshort import analytics as an
+from urlshort.pagination import NEXT, PREV, encode_cursor, decode_cursor
+
+@pytest.fixture
+def links(db):
+    # 23 links em 8 horários: vários empates em created_at, desempatados pelo id
+    rows = [(f"s{i:02d}", f"https://example.com/{i}", f"2024-01-01 00:00:{i // 3:02d}") for i in range(23)]
+    db.executemany("INSERT INTO links (slug, target_url, created_at) VALUES (?,?,?)", rows)
+    db.commit()
+    ordered = db.execute("SELECT id FROM links ORDER BY created_at DESC, id DESC").fetchall()
+    return [r["id"] for r in ordered]
+
+def test_cursor_round_trip():
+    for direction in (NEXT, PREV):
+        cursor = encode_cursor(direction, "2024-01-01 00:00:07", 42)
+        assert "=" not in cursor
+        assert decode_cursor(cursor) == (direction, "2024-01-01 00:00:07", 42)
+
+@pytest.mark.parametrize("cursor", [None, "", "not-base64!", encode_cursor(NEXT, "x", 1)[:-3], "WyJ4IiwiYSIsMV0"])
+def test_invalid_cursors_decode_to_none(cursor):
+    assert decode_cursor(cursor) is None
+
+def walk_forward(db, limit, **kw):
+    pages, cursor = [], None
+    while True:
+        rows, next_cursor, prev_cursor = an.links_page(db, limit=limit, cursor=cursor, **kw)
+        pages.append(([r["id"] for r in rows], next_cursor, prev_cursor))
+        if next_cursor is None:
+            return pages
+        cursor = next_cursor
+
+def test_forward_walk_visits_every_link_once_in_order(db, links):
+    pages = walk_forward(db, limit=5)
+    assert [i for ids, _, _ in pages for i in ids] == links
+    assert [len(ids) for ids, _, _ in pages] == [5, 5, 5, 5, 3]
+    assert pages[0][2] is None
+    assert all(prev is not None for _, _, prev in pages[1:])
+
+def test_backward_walk_returns_the_same_pages(db, links):
+    pages = walk_forward(db, limit=5)
+    cursor = pages[-1][2]
+    for expected_ids, expected_next, _ in reversed(pages[:-1]):
+        rows, next_cursor, prev_cursor = an.links_page(db, limit=5, cursor=cursor)
+        assert [r["id"] for r in rows] == expected_ids
+        assert next_cursor is not None
+        cursor = prev_cursor
+    assert cursor is None
+
+def test_invalid_cursor_returns_first_page(db, links):
+    rows, _, prev_cursor = an.links_page(db, limit=5, cursor="garbage")
+    assert [r["id"] for r in rows] == links[:5]
+    assert prev_cursor is None
+
+def test_filtered_walk(db, links):
+    pages = walk_forward(db, limit=2, q="example.com/1")
+    ids = [i for p, _, _ in pages for i in p]
+    expected = [r["id"] for r in db.execute(
+        "SELECT id FROM links WHERE target_url LIKE '%example.com/1%' ORDER BY created_at DESC, id DESC"
+    )]
+    assert ids == expected and len(ids) > 2
+
+def test_empty_table(db):
+    assert an.links_page(db, limit=5) == ([], None, None)
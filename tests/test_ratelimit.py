@@ -0,0 +1,70 @@
+from __future__ import annotations
+import time
+import pytest
+from urlshort import security
+from urlshort.security import MemoryRateLimiter, SQLiteRateLimiter, _gcra
+
+def test_gcra_allows_limit_then_denies_with_retry_after():
+    tat, now = None, 1000.0
+    for _ in range(5):
+        tat, retry = _gcra(tat, now, limit=5, window=10)
+        assert retry is None
+    same, retry = _gcra(tat, now, limit=5, window=10)
+    assert same == tat
+    assert retry == pytest.approx(2.0)  # window / limit
+    _, retry = _gcra(tat, now + 2.0, limit=5, window=10)
+    assert retry is None
+
+def test_gcra_refills_at_a_constant_rate():
+    tat, now = None, 0.0
+    for _ in range(5):
+        tat, _ = _gcra(tat, now, 5, 10)
+    # Meio intervalo depois ainda falta a outra metade
+    _, retry = _gcra(tat, 1.0, 5, 10)
+    assert retry == pytest.approx(1.0)
+    # Depois de uma janela inteira ociosa o crédito volta ao máximo, sem acumular além
+    tat2 = tat
+    for _ in range(5):
+        tat2, retry = _gcra(tat2, 100.0, 5, 10)
+        assert retry is None
+    assert _gcra(tat2, 100.0, 5, 10)[1] is not None
+
+@pytest.fixture(params=["memory", "sqlite"])
+def limiter(request, tmp_path):
+    if request.param == "memory":
+        return MemoryRateLimiter(sweep_interval=60)
+    return SQLiteRateLimiter(str(tmp_path / "rl.db"), sweep_interval=60)
+
+def test_limiter_counts_keys_independently(limiter):
+    assert [limiter.hit("a", 3, 60, 0.0) for _ in range(3)] == [None] * 3
+    assert limiter.hit("a", 3, 60, 0.0) == pytest.approx(20.0)
+    assert limiter.hit("b", 3, 60, 0.0) is None
+    assert limiter.hit("a", 3, 60, 20.0) is None
+    assert limiter.stats()["rejected"] == 1
+
+def test_sweep_drops_idle_keys(limiter):
+    t = time.time()
+    limiter.hit("a", 3, 60, t)
+    limiter.hit("b", 3, 60, t)
+    assert limiter.stats()["keys"] == 2
+    limiter.hit("c", 3, 60, t + 1000)
+    assert limiter.stats()["keys"] == 1
+
+def test_sqlite_limiter_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "rl.db")
+    w1, w2 = SQLiteRateLimiter(path), SQLiteRateLimiter(path)
+    assert w1.hit("k", 2, 60, 0.0) is None
+    assert w2.hit("k", 2, 60, 0.0) is None
+    assert w1.hit("k", 2, 60, 0.0) is not None
+
+def test_429_carries_retry_after(app, monkeypatch):
+    app.config.update(API_TOKEN="t", RATE_LIMIT_MAX=2, RATE_LIMIT_WINDOW=60)
+    monkeypatch.setattr(security, "_now", lambda: 5000.0)
+    client = app.test_client()
+    headers = {"Authorization": "Bearer t"}
+    codes = [client.post("/api/links", json={"target_url": "https://example.com"}, headers=headers).status_code
+             for _ in range(2)]
+    assert codes == [201, 201]
+    resp = client.post("/api/links", json={"target_url": "https://example.com"}, headers=headers)
+    assert resp.status_code == 429
+    assert resp.headers["Retry-After"] == "30"
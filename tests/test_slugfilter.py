@@ -0,0 +1,106 @@
+from __future__ import annotations
+import sqlite3
+import pytest
+from urlshort.slugfilter import BloomFilter, SlugFilter, MIN_CAPACITY
+
+def test_bloom_has_no_false_negatives_and_meets_fp_target():
+    bloom = BloomFilter(20000, 0.01)
+    items = [f"slug{i}" for i in range(20000)]
+    for s in items:
+        bloom.add(s)
+    assert all(s in bloom for s in items)
+    fp = sum(f"other{i}" in bloom for i in range(20000)) / 20000
+    assert fp < 0.02
+    assert bloom.expected_fp_rate() == pytest.approx(0.01, rel=0.2)
+
+def test_bloom_minimum_capacity():
+    assert BloomFilter(0).capacity == MIN_CAPACITY
+
+@pytest.fixture
+def other_process(app):
+    # Outra conexão no mesmo arquivo: CLI, carga do bench, SQL manual, outro host
+    conn = sqlite3.connect(app.config["DB_PATH"])
+    yield conn
+    conn.close()
+
+def insert(conn, slug, link_id=None):
+    conn.execute("INSERT INTO links (id, slug, target_url) VALUES (?, ?, 'https://example.com')", (link_id, slug))
+    conn.commit()
+
+def test_no_false_negative_after_external_inserts(db, other_process):
+    f = SlugFilter(None, check_interval=0)
+    f.build(db)
+    assert f.definitely_missing("late", lambda: db)
+    for i in range(50):
+        insert(other_process, f"ext{i}")
+    insert(other_process, "late")
+    # Nenhum aviso ao processo: a geração em watermarks basta
+    assert not f.definitely_missing("late", lambda: db)
+    assert all(not f.definitely_missing(f"ext{i}", lambda: db) for i in range(50))
+    assert f.stats()["syncs"] == 1
+    assert f.definitely_missing("never-created", lambda: db)
+
+def test_insert_below_max_id_forces_a_rebuild(db, other_process):
+    insert(other_process, "a", 100)
+    f = SlugFilter(None, check_interval=0)
+    f.build(db)
+    insert(other_process, "old", 5)
+    rebuilds = f.stats()["rebuilds"]
+    assert not f.definitely_missing("old", lambda: db)
+    assert f.stats()["rebuilds"] == rebuilds + 1
+
+def test_filter_grows_past_its_capacity(db, other_process):
+    f = SlugFilter(None, check_interval=0)
+    f.build(db)
+    other_process.executemany(
+        "INSERT INTO links (slug, target_url) VALUES (?, 'https://example.com')",
+        [(f"s{i}",) for i in range(MIN_CAPACITY + 10)],
+    )
+    other_process.commit()
+    assert not f.definitely_missing("s0", lambda: db)
+    assert f.bloom.capacity >= 2 * (MIN_CAPACITY + 10)
+    assert all(not f.definitely_missing(f"s{i}", lambda: db) for i in range(MIN_CAPACITY + 10))
+
+def test_unbuilt_filter_says_maybe_on_db_error():
+    f = SlugFilter(None)
+    broken = sqlite3.connect(":memory:")
+    assert not f.definitely_missing("x", lambda: broken)
+    # Sem get_db, um filtro ainda não construído também só pode dizer "talvez"
+    assert not f.definitely_missing("x")
+
+def test_negatives_within_the_interval_skip_the_database(db, other_process, monkeypatch):
+    from urlshort import slugfilter
+    now = [1000.0]
+    monkeypatch.setattr(slugfilter.time, "monotonic", lambda: now[0])
+    f = SlugFilter(None, check_interval=1.0)
+    f.build(db)
+    calls = []
+    def get_db():
+        calls.append(1)
+        return db
+    assert all(f.definitely_missing(f"nope{i}", get_db) for i in range(100))
+    assert calls == []
+    # Janela de defasagem: um link de outro processo ainda é "não" até o intervalo vencer
+    insert(other_process, "fresh")
+    assert f.definitely_missing("fresh", get_db)
+    now[0] += 1.0
+    assert not f.definitely_missing("fresh", get_db)
+    assert len(calls) == 1
+    assert f.stats()["checks"] == 1
+
+def test_link_created_is_seen_without_a_check(db):
+    f = SlugFilter(None, check_interval=3600)
+    f.build(db)
+    f.add("mine")  # o que link_created faz no filtro do processo
+    assert not f.definitely_missing("mine")
+
+def test_redirect_sees_link_created_by_another_process(app, other_process):
+    app.config["SLUG_FILTER"] = True
+    app.config["SLUG_FILTER_CHECK_INTERVAL"] = 0
+    from urlshort import slugfilter
+    slugfilter.init_app(app)
+    client = app.test_client()
+    assert client.get("/abc123").status_code == 404
+    insert(other_process, "abc123")
+    assert client.get("/abc123").status_code == 301
+    assert app.extensions["slug_filter"].stats()["negatives"] == 1
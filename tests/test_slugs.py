@@ -0,0 +1,92 @@
+from __future__ import annotations
+import pytest
+from urlshort.slugs import ALPHABET, BASE, Permutation, CounterAllocator, encode_base62
+
+@pytest.mark.parametrize("domain", [2, 62, 1000, BASE ** 2, 5000])
+def test_permutation_is_a_bijection(domain):
+    p = Permutation(domain, b"k" * 32)
+    assert sorted(p(x) for x in range(domain)) == list(range(domain))
+
+def test_permutation_depends_on_key():
+    a, b = Permutation(BASE ** 2, b"a" * 32), Permutation(BASE ** 2, b"b" * 32)
+    assert [a(x) for x in range(100)] != [b(x) for x in range(100)]
+    # Sequenciais não ficam sequenciais
+    assert [a(x) for x in range(10)] != sorted(a(x) for x in range(10))
+
+def test_permutation_rejects_out_of_domain():
+    p = Permutation(100, b"k")
+    with pytest.raises(ValueError):
+        p(100)
+    with pytest.raises(ValueError):
+        p(-1)
+
+def test_encode_base62():
+    assert encode_base62(0, 3) == "000"
+    assert encode_base62(BASE ** 3 - 1, 3) == ALPHABET[-1] * 3
+    assert len({encode_base62(v, 2) for v in range(BASE ** 2)}) == BASE ** 2
+    with pytest.raises(ValueError):
+        encode_base62(BASE ** 3, 3)
+
+def take(alloc, db, n):
+    return [next(alloc.candidates(db)) for _ in range(n)]
+
+def test_counter_blocks_of_two_workers_do_not_overlap(db):
+    w1 = CounterAllocator(slug_len=4, block_size=7)
+    w2 = CounterAllocator(slug_len=4, block_size=7)
+    slugs = []
+    for _ in range(10):
+        slugs += take(w1, db, 3) + take(w2, db, 2)
+    assert len(slugs) == len(set(slugs)) == 50
+    # Sem permutação, os ids saem de blocos contíguos reservados em slug_counter
+    ids = sorted(sum(ALPHABET.index(ch) * BASE ** i for i, ch in enumerate(reversed(s))) for s in slugs)
+    reserved = db.execute("SELECT next FROM slug_counter WHERE name = 'base62:4'").fetchone()[0]
+    assert ids[-1] < reserved
+    assert reserved == 7 * (w1.stats()["blocks_reserved"] + w2.stats()["blocks_reserved"])
+
+def test_permuted_counter_never_repeats(db):
+    alloc = CounterAllocator(slug_len=2, block_size=50, key=b"secret")
+    slugs = take(alloc, db, BASE ** 2)
+    assert len(set(slugs)) == BASE ** 2
+    with pytest.raises(RuntimeError):
+        take(alloc, db, 1)
+
+def test_block_inherited_through_fork_is_discarded(db):
+    alloc = CounterAllocator(slug_len=4, block_size=10)
+    first = take(alloc, db, 2)
+    alloc._pid = -1  # como se fosse o filho depois do fork
+    after = take(alloc, db, 2)
+    assert not set(first) & set(after)
+    assert alloc.stats()["blocks_reserved"] == 2
+
+def test_prefetch_inside_a_transaction_joins_it(db):
+    alloc = CounterAllocator(slug_len=4, block_size=5)
+    db.execute("INSERT INTO links (slug, target_url) VALUES ('x', 'https://x.example')")
+    assert db.in_transaction
+    alloc.prefetch(db, 20)
+    assert db.in_transaction
+    db.commit()
+    assert db.execute("SELECT next FROM slug_counter WHERE name = 'base62:4'").fetchone()[0] == 20
+    assert alloc.stats()["ids_left_in_block"] == 20
+
+def test_block_reserved_in_a_rolled_back_transaction_is_not_reused(db):
+    alloc = CounterAllocator(slug_len=4, block_size=5)
+    db.execute("INSERT INTO links (slug, target_url) VALUES ('x', 'https://x.example')")
+    inside = take(alloc, db, 2)
+    db.rollback()
+    assert db.execute("SELECT next FROM slug_counter WHERE name = 'base62:4'").fetchone() is None
+    # Outro worker reserva os mesmos ids que o rollback devolveu ao contador
+    other = take(CounterAllocator(slug_len=4, block_size=5), db, 5)
+    after = take(alloc, db, 5)
+    assert not set(after) & set(other)
+    assert not set(after) & set(inside)
+    assert alloc.stats()["blocks_discarded"] == 1
+
+def test_provisional_block_is_used_within_its_transaction(db):
+    alloc = CounterAllocator(slug_len=4, block_size=5)
+    db.execute("INSERT INTO links (slug, target_url) VALUES ('x', 'https://x.example')")
+    take(alloc, db, 4)
+    assert alloc.stats()["blocks_reserved"] == 1
+    db.commit()
+    take(alloc, db, 1)
+    # Depois do commit o resto do bloco provisório é descartado: um bloco novo
+    assert alloc.stats()["blocks_reserved"] == 2
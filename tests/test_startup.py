@@ -0,0 +1,24 @@
+from __future__ import annotations
+import sqlite3
+from urlshort.startup import startup_bench_command
+
+TABLES = ("links", "clicks", "clicks_daily", "watermarks", "slug_counter", "clicks_hll")
+
+def snapshot(path):
+    conn = sqlite3.connect(path)
+    try:
+        out = {t: conn.execute(f"SELECT * FROM {t} ORDER BY 1").fetchall() for t in TABLES}
+        out["user_version"] = conn.execute("PRAGMA user_version").fetchone()
+        return out
+    finally:
+        conn.close()
+
+def test_startup_bench_leaves_the_database_untouched(app, db, tmp_path, monkeypatch):
+    db.execute("INSERT INTO links (slug, target_url) VALUES ('probe1', 'https://example.com')")
+    db.commit()
+    monkeypatch.setenv("TEMPLATE_CACHE_DIR", str(tmp_path / "jinja"))
+    before = snapshot(app.config["DB_PATH"])
+    result = app.test_cli_runner().invoke(startup_bench_command, ["--runs", "2"])
+    assert result.exit_code == 0, result.output
+    assert result.output.count("status=301") == 2
+    assert snapshot(app.config["DB_PATH"]) == before
@@ -1,9 +1,13 @@
 from __future__ import annotations
 from datetime import datetime, timedelta
 from urllib.parse import urlencode
-from flask import Blueprint, render_template, request, redirect, url_for, current_app, abort
-from .db import get_db
+from flask import Blueprint, render_template, request, redirect, url_for, current_app, abort, make_response
+from .db import get_analytics_db
 from . import analytics as an
+from . import export
+from . import httpcache
+from . import hll
+from . import trending
 
 bp = Blueprint("admin", __name__)
 
@@ -19,48 +23,67 @@ def _parse_date(s: str | None):
 def admin_home():
     """
     Lista links com total de cliques.
-    Filtros GET: ?q=...&start=YYYY-MM-DD&end=YYYY-MM-DD&page=1
+    Filtros GET: ?q=...&start=YYYY-MM-DD&end=YYYY-MM-DD&cursor=...
+    Paginação por cursor (created_at, id); o total vem de um cache com TTL.
+    Responde 304 (ETag/Last-Modified) enquanto nenhum link ou clique novo chegou.
     """
-    db = get_db()
+    db = get_analytics_db()
     start = _parse_date(request.args.get("start"))
     end = _parse_date(request.args.get("end"))
     q = (request.args.get("q") or "").strip() or None
+    cursor = request.args.get("cursor") or None
 
     page_size = int(current_app.config.get("PAGE_SIZE", 20))
-    try:
-        page = max(1, int(request.args.get("page", "1")))
-    except ValueError:
-        page = 1
-    offset = (page - 1) * page_size
-
-    rows = an.totals_by_link(db, start=start, end=end, q=q, limit=page_size, offset=offset)
-    total = an.count_links(db, q=q)
-    total_pages = max(1, (total + page_size - 1) // page_size)
+    not_modified, apply = httpcache.conditional(
+        db, ["links", "clicks", "maint"], (q, start, end, cursor, page_size),
+        httpcache.admin_cache_control(),
+    )
+    if not_modified is not None:
+        return not_modified
+    rows, next_cursor, prev_cursor = an.links_page(
+        db, start=start, end=end, q=q, limit=page_size, cursor=cursor
+    )
+    total = an.count_links_cached(db, q=q)
 
     args = {}
     if q: args["q"] = q
     if start: args["start"] = start
     if end: args["end"] = end
-    has_prev = page > 1
-    has_next = page < total_pages
-    prev_url = url_for("admin.admin_home") + "?" + urlencode({**args, "page": page - 1}) if has_prev else None
-    next_url = url_for("admin.admin_home") + "?" + urlencode({**args, "page": page + 1}) if has_next else None
+    has_prev = prev_cursor is not None
+    has_next = next_cursor is not None
+    prev_url = url_for("admin.admin_home") + "?" + urlencode({**args, "cursor": prev_cursor}) if has_prev else None
+    next_url = url_for("admin.admin_home") + "?" + urlencode({**args, "cursor": next_cursor}) if has_next else None
 
-    return render_template(
+    return apply(make_response(render_template(
         "admin/index.html",
         rows=rows, start=start, end=end, q=q,
-        page=page, total_pages=total_pages,
+        total=total,
         has_prev=has_prev, has_next=has_next,
         prev_url=prev_url, next_url=next_url,
-    )
+    )))
+
+@bp.get("/_top")
+def admin_top():
+    """
+    Links mais clicados nas janelas de 5 min, 1 h e 24 h (contador em memória).
+    """
+    tracker = trending.get_trending()
+    if tracker is None:
+        abort(404)
+    db = get_analytics_db()
+    tops = {w: trending.top_links(db, w, 20) for w in trending.WINDOWS}
+    resp = make_response(render_template("admin/top.html", tops=tops, capacity=tracker.capacity))
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
 
 @bp.get("/<slug>")
 def admin_detail(slug: str):
     """
     Detalhe de um link: cliques por dia + tabela de cliques recentes.
     Filtros GET: ?start=YYYY-MM-DD&end=YYYY-MM-DD
+    Responde 304 (ETag/Last-Modified) enquanto o link não recebeu cliques.
     """
-    db = get_db()
+    db = get_analytics_db()
     link = an.get_link_by_slug(db, slug)
     if not link:
         abort(404)
@@ -71,14 +94,40 @@ def admin_detail(slug: str):
         end_dt = datetime.utcnow().date()
         start_dt = end_dt - timedelta(days=30)
         start, end = start_dt.isoformat(), end_dt.isoformat()
+    not_modified, apply = httpcache.conditional(
+        db, [f"link:{link['id']}", "maint"], (link["slug"], link["target_url"], start, end),
+        httpcache.admin_cache_control(),
+    )
+    if not_modified is not None:
+        return not_modified
 
     per_day = an.clicks_per_day(db, link_id=link["id"], start=start, end=end)
+    unique_visitors, unique_per_day = hll.unique_visitors_per_day(db, link["id"], start, end)
     recent = an.recent_clicks(db, link_id=link["id"], start=start, end=end, limit=100)
     total_clicks = sum(r["clicks"] for r in per_day) if per_day else 0
 
-    return render_template(
+    return apply(make_response(render_template(
         "admin/detail.html",
         link=link, per_day=per_day, recent=recent,
         start=start, end=end, total_clicks=total_clicks,
+        unique_visitors=unique_visitors, unique_per_day=unique_per_day, unique_error=hll.ERROR,
         base_url=current_app.config.get("BASE_URL", "http://localhost:5000"),
-    )
+    )))
+
+@bp.get("/<slug>/export")
+def admin_export(slug: str):
+    """
+    Baixa os cliques do link no intervalo. Filtros GET: ?start=&end=&format=csv|ndjson&after=
+    """
+    db = get_analytics_db(time_limit=False)
+    link = an.get_link_by_slug(db, slug)
+    if not link:
+        abort(404)
+    try:
+        return export.export_response(
+            "clicks", db, request.args.get("format", "csv"), f"clicks-{slug}",
+            start=_parse_date(request.args.get("start")), end=_parse_date(request.args.get("end")),
+            link_id=link["id"], after=request.args.get("after", type=int),
+        )
+    except export.ExportError:
+        abort(400)
@@ -1,7 +1,48 @@
 from __future__ import annotations
 from typing import Optional
 from sqlite3 import Connection
+from .cache import get_link_cache, get_count_cache
+from .pagination import NEXT, PREV, encode_cursor, decode_cursor
+from .search import search_filter
+from .archive import get_archive_dir, archived_clicks
+from .partitions import click_tables, today_table
+from . import strings
+from .memo import memoize, get_result_cache
 
+# Marcas d'água (httpcache.py) que invalidam os resultados memoizados
+_ALL_LINKS = lambda a: ["links", "clicks", "maint"]
+_LINKS = lambda a: ["links", "maint"]
+_ONE_LINK = lambda a: [f"link:{a['link_id']}", "maint"]
+
+def _rollup_filter(start: Optional[str], end: Optional[str], p: str = ""):
+    """
+    Filtro para clicks_daily: só dias fechados (antes de hoje, UTC) dentro do intervalo.
+    """
+    where = [f"{p}day < date('now')"]
+    params = []
+    if start:
+        where.append(f"{p}day >= ?")
+        params.append(start)
+    if end:
+        where.append(f"{p}day <= ?")
+        params.append(end)
+    return " AND ".join(where), params
+
+def _today_filter(start: Optional[str], end: Optional[str], p: str = ""):
+    """
+    Filtro para clicks brutos: só o bucket parcial de hoje dentro do intervalo.
+    """
+    where = [f"{p}ts >= date('now')"]
+    params = []
+    if start:
+        where.append(f"{p}ts >= ?")
+        params.append(start + " 00:00:00")
+    if end:
+        where.append(f"{p}ts < date(?, '+1 day')")
+        params.append(end)
+    return " AND ".join(where), params
+
+@memoize(_ALL_LINKS)
 def totals_by_link(
     db: Connection,
     start: Optional[str] = None,
@@ -9,45 +50,96 @@ def totals_by_link(
     q: Optional[str] = None,
     limit: int = 20,
     offset: int = 0,
+    after: Optional[tuple] = None,
+    before: Optional[tuple] = None,
 ):
     """
     Retorna links com total de cliques no intervalo (opcional).
-    Inclui links sem cliques. Busca por q em slug/target_url.
+    Inclui links sem cliques. Busca por q em slug/target_url (índice FTS5 se houver).
+    Dias fechados vêm de clicks_daily; só o dia de hoje conta clicks brutos
+    (com partições, só a do mês atual é lida).
+    Paginação por chave: after/before = (created_at, id) do último/primeiro item
+    da página atual (ordem created_at DESC, id DESC); sem eles usa offset.
     """
-    join_extra = []
-    join_params = []
-    if start:
-        join_extra.append("c.ts >= ?")
-        join_params.append(start + " 00:00:00")
-    if end:
-        join_extra.append("c.ts < date(?, '+1 day')")
-        join_params.append(end)
-    join_sql = (" AND " + " AND ".join(join_extra)) if join_extra else ""
+    rollup_sql, rollup_params = _rollup_filter(start, end, "d.")
+    today_sql, today_params = _today_filter(start, end, "c.")
 
     where = []
     where_params = []
     if q:
-        where.append("(l.slug LIKE ? OR l.target_url LIKE ?)")
-        like = f"%{q}%"
-        where_params.extend([like, like])
+        q_sql, q_params = search_filter(db, q, id_col="l.id", like_cols=("l.slug", "l.target_url"))
+        where.append(q_sql)
+        where_params.extend(q_params)
+
+    order = "DESC"
+    if after is not None:
+        where.append("(l.created_at, l.id) < (?, ?)")
+        where_params.extend(after)
+        offset = 0
+    elif before is not None:
+        where.append("(l.created_at, l.id) > (?, ?)")
+        where_params.extend(before)
+        order, offset = "ASC", 0
 
     where_sql = ("WHERE " + " AND ".join(where)) if where else ""
 
     sql = f"""
     SELECT
       l.id, l.slug, l.target_url, l.is_permanent, l.created_at,
-      COALESCE(COUNT(c.id), 0) AS clicks
+      COALESCE((SELECT SUM(d.clicks) FROM clicks_daily d
+                WHERE d.link_id = l.id AND {rollup_sql}), 0)
+      + (SELECT COUNT(*) FROM {today_table(db)} c
+         WHERE c.link_id = l.id AND {today_sql}) AS clicks
     FROM links l
-    LEFT JOIN clicks c
-      ON c.link_id = l.id {join_sql}
     {where_sql}
-    GROUP BY l.id
-    ORDER BY l.created_at DESC
+    ORDER BY l.created_at {order}, l.id {order}
     LIMIT ? OFFSET ?
     """
-    params = (*join_params, *where_params, limit, offset)
-    return db.execute(sql, params).fetchall()
+    params = (*rollup_params, *today_params, *where_params, limit, offset)
+    rows = db.execute(sql, params).fetchall()
+    if order == "ASC":
+        rows.reverse()
+    return rows
 
+def links_page(
+    db: Connection,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    q: Optional[str] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+):
+    """
+    Uma página de totals_by_link por cursor opaco.
+    Retorna (rows, next_cursor, prev_cursor); o custo não depende da profundidade.
+    """
+    cur = decode_cursor(cursor)
+    after = before = None
+    if cur is not None:
+        direction, created_at, link_id = cur
+        if direction == NEXT:
+            after = (created_at, link_id)
+        else:
+            before = (created_at, link_id)
+
+    # Busca um item a mais para saber se existe página seguinte na direção pedida
+    rows = totals_by_link(db, start=start, end=end, q=q, limit=limit + 1, after=after, before=before)
+    more = len(rows) > limit
+    if before is not None:
+        rows = rows[1:] if more else rows
+        has_prev, has_next = more, True
+    else:
+        rows = rows[:limit]
+        has_prev, has_next = after is not None, more
+
+    if not rows:
+        return rows, None, None
+    first, last = rows[0], rows[-1]
+    next_cursor = encode_cursor(NEXT, last["created_at"], last["id"]) if has_next else None
+    prev_cursor = encode_cursor(PREV, first["created_at"], first["id"]) if has_prev else None
+    return rows, next_cursor, prev_cursor
+
+@memoize(_LINKS)
 def count_links(db: Connection, q: Optional[str] = None) -> int:
     """
     Conta quantos links existem (para paginação), filtrando por q (slug/target_url).
@@ -56,51 +148,124 @@ def count_links(db: Connection, q: Optional[str] = None) -> int:
     where = []
     params = []
     if q:
-        where.append("(slug LIKE ? OR target_url LIKE ?)")
-        like = f"%{q}%"
-        params.extend([like, like])
+        q_sql, q_params = search_filter(db, q)
+        where.append(q_sql)
+        params.extend(q_params)
     where_sql = ("WHERE " + " AND ".join(where)) if where else ""
     row = db.execute(f"SELECT COUNT(*) AS n FROM links {where_sql}", params).fetchone()
     return int(row["n"]) if row else 0
 
+def count_links_cached(db: Connection, q: Optional[str] = None) -> int:
+    """
+    count_links com cache TTL (COUNT_CACHE_TTL): o total exato não precisa ser
+    recalculado a cada página. Com o cache de resultados ativo, count_links já é
+    memoizado (invalidado por link novo, sem TTL).
+    """
+    if get_result_cache() is not None:
+        return count_links(db, q=q)
+    cache = get_count_cache()
+    key = q or ""
+    if cache is not None:
+        hit = cache.get(key)
+        if hit is not None:
+            return hit
+    n = count_links(db, q=q)
+    if cache is not None:
+        cache.put(key, n)
+    return n
+
+@memoize(_ONE_LINK)
 def clicks_per_day(db: Connection, link_id: int, start: Optional[str] = None, end: Optional[str] = None):
-    where = ["link_id = ?"]
-    params = [link_id]
-    if start:
-        where.append("ts >= ?")
-        params.append(start + " 00:00:00")
-    if end:
-        where.append("ts < date(?, '+1 day')")
-        params.append(end)
+    """
+    Cliques por dia: dias fechados do rollup + bucket parcial de hoje dos clicks brutos.
+    """
+    rollup_sql, rollup_params = _rollup_filter(start, end)
+    today_sql, today_params = _today_filter(start, end)
     sql = f"""
+    SELECT day, clicks
+    FROM clicks_daily
+    WHERE link_id = ? AND {rollup_sql}
+    UNION ALL
     SELECT date(ts) AS day, COUNT(*) AS clicks
-    FROM clicks
-    WHERE {" AND ".join(where)}
+    FROM {today_table(db)}
+    WHERE link_id = ? AND {today_sql}
     GROUP BY day
     ORDER BY day
     """
-    return db.execute(sql, params).fetchall()
+    return db.execute(sql, (link_id, *rollup_params, link_id, *today_params)).fetchall()
 
+@memoize(_ONE_LINK)
+def count_clicks(db: Connection, link_id: int, start: Optional[str] = None, end: Optional[str] = None) -> int:
+    """
+    Total de cliques do link no intervalo (rollup + hoje).
+    """
+    rollup_sql, rollup_params = _rollup_filter(start, end)
+    today_sql, today_params = _today_filter(start, end)
+    row = db.execute(
+        f"""
+        SELECT
+          COALESCE((SELECT SUM(clicks) FROM clicks_daily WHERE link_id = ? AND {rollup_sql}), 0)
+          + (SELECT COUNT(*) FROM {today_table(db)} WHERE link_id = ? AND {today_sql}) AS n
+        """,
+        (link_id, *rollup_params, link_id, *today_params),
+    ).fetchone()
+    return int(row["n"]) if row else 0
+
+@memoize(_ONE_LINK)
 def recent_clicks(db: Connection, link_id: int, start: Optional[str] = None, end: Optional[str] = None, limit: int = 100):
-    where = ["link_id = ?"]
+    """
+    Últimos cliques do link no intervalo; completa com os arquivados (archive.py)
+    quando o banco não tem `limit` cliques. Com partições, lê só os meses do
+    intervalo, do mais recente para o mais antigo, até juntar `limit`.
+    user_agent/referrer voltam como texto (JOIN com os dicionários).
+    """
+    where = ["c.link_id = ?"]
     params = [link_id]
     if start:
-        where.append("ts >= ?")
+        where.append("c.ts >= ?")
         params.append(start + " 00:00:00")
     if end:
-        where.append("ts < date(?, '+1 day')")
+        where.append("c.ts < date(?, '+1 day')")
         params.append(end)
-    sql = f"""
-    SELECT ts, ip, user_agent, referrer
-    FROM clicks
-    WHERE {" AND ".join(where)}
-    ORDER BY ts DESC
-    LIMIT ?
-    """
-    return db.execute(sql, (*params, limit)).fetchall()
+    rows = []
+    for _, table in click_tables(db, start, end, newest_first=True):
+        sql = f"""
+        SELECT c.ts, c.ip, {strings.SELECT_COLUMNS}
+        FROM {table} c {strings.join_sql("c")}
+        WHERE {" AND ".join(where)}
+        ORDER BY c.ts DESC
+        LIMIT ?
+        """
+        rows.extend(db.execute(sql, (*params, limit - len(rows))).fetchall())
+        if len(rows) >= limit:
+            break
+    archive_dir = get_archive_dir()
+    if len(rows) < limit and archive_dir:
+        # Arquivados são sempre mais antigos que os cliques que ficaram no banco
+        rows = rows + archived_clicks(archive_dir, link_id, start, end, limit - len(rows))
+    return rows
 
 def get_link_by_slug(db: Connection, slug: str):
-    return db.execute(
+    """
+    Busca o link pelo slug, passando pelo cache LRU/TTL quando ativo.
+    Retorna dict (ou None).
+    """
+    cache = get_link_cache()
+    if cache is not None:
+        hit = cache.get(slug)
+        if hit is not None:
+            return hit
+    link = fetch_link_by_slug(db, slug)
+    if link is not None and cache is not None:
+        cache.put(slug, link)
+    return link
+
+def fetch_link_by_slug(db: Connection, slug: str):
+    """
+    Busca o link direto no banco (sem cache). Retorna dict (ou None).
+    """
+    row = db.execute(
         "SELECT id, slug, target_url, is_permanent, created_at FROM links WHERE slug = ?",
         (slug,),
-    ).fetchone()
\ No newline at end of file
+    ).fetchone()
+    return dict(row) if row is not None else None
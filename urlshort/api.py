@@ -1,38 +1,78 @@
 from __future__ import annotations
-import sqlite3, secrets, logging
+import logging, json
 from typing import Optional
 from urllib.parse import urlparse
-from flask import Blueprint, request, jsonify, current_app, url_for, abort, make_response
-from .db import get_db
-from .security import check_rate_limit
+from flask import Blueprint, request, jsonify, current_app, url_for, abort, make_response, Response, stream_with_context
+from .db import get_db, get_pool, get_analytics_db, get_analytics_pool
+from .security import check_rate_limit, get_rate_limiter
 from . import analytics as an
+from . import export
+from . import httpcache
+from . import hll
+from . import trending
+from .clicks import get_recorder
+from .cache import get_link_cache
+from .links import insert_link
+from .slugfilter import get_slug_filter
+from .slugs import ALPHABET, RESERVED_SLUGS, get_allocator
+from .pagination import decode_cursor
 
 bp = Blueprint("api", __name__)
 log = logging.getLogger("app")
-ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
 
-def _auth_or_401():
+def token_challenge(got: str) -> str | None:
+    """
+    Valida o header Authorization; retorna o WWW-Authenticate do 401 ou None se ok.
+    """
     want = current_app.config.get("API_TOKEN")
-    got = request.headers.get("Authorization", "")
     if not want or not got.startswith("Bearer "):
-        resp = make_response(jsonify({"error": "unauthorized"}), 401)
-        resp.headers["WWW-Authenticate"] = 'Bearer realm="api"'
-        return resp
+        return 'Bearer realm="api"'
     token = got.split(" ", 1)[1]
     if token != want:
-        resp = make_response(jsonify({"error": "unauthorized"}), 401)
-        resp.headers["WWW-Authenticate"] = 'Bearer error="invalid_token"'
-        return resp
+        return 'Bearer error="invalid_token"'
     return None
 
+def _auth_or_401():
+    challenge = token_challenge(request.headers.get("Authorization", ""))
+    if challenge is None:
+        return None
+    resp = make_response(jsonify({"error": "unauthorized"}), 401)
+    resp.headers["WWW-Authenticate"] = challenge
+    return resp
+
 def _is_valid_http_url(u: str) -> bool:
     if not u or len(u) > 2048:
         return False
     p = urlparse(u)
     return p.scheme in ("http", "https") and bool(p.netloc)
 
-def _base62_slug(n: int = 6) -> str:
-    return "".join(secrets.choice(ALPHABET) for _ in range(n))
+def _parse_link_spec(data):
+    """
+    Valida um pedido de criação de link.
+    Retorna ((target_url, is_permanent, slug_req), None) ou (None, erro).
+    """
+    if not isinstance(data, dict):
+        return None, "expected object"
+    target_url = data.get("target_url") or ""
+    if not isinstance(target_url, str):
+        return None, "invalid url"
+    target_url = target_url.strip()
+    is_permanent = 1 if bool(data.get("is_permanent", True)) else 0
+
+    if not _is_valid_http_url(target_url):
+        return None, "invalid url"
+
+    slug_req = data.get("slug")
+    if slug_req:
+        if not isinstance(slug_req, str):
+            return None, "slug must be base62"
+        if not (1 <= len(slug_req) <= int(current_app.config.get("SLUG_LEN", 6)) * 2):
+            return None, "invalid slug length"
+        if any(ch not in ALPHABET for ch in slug_req):
+            return None, "slug must be base62"
+        if slug_req in RESERVED_SLUGS:
+            return None, "slug reserved"
+    return (target_url, is_permanent, slug_req or None), None
 
 @bp.post("/links")
 def api_create_link():
@@ -44,48 +84,17 @@ def api_create_link():
     if not request.is_json:
         return jsonify({"error": "expected application/json"}), 400
     data = request.get_json(silent=True) or {}
-    target_url = (data.get("target_url") or "").strip()
-    is_permanent = 1 if bool(data.get("is_permanent", True)) else 0
-
-    if not _is_valid_http_url(target_url):
-        return jsonify({"error": "invalid url"}), 400
-
-    slug_req = data.get("slug")
-    if slug_req:
-        if not (1 <= len(slug_req) <= int(current_app.config.get("SLUG_LEN", 6)) * 2):
-            return jsonify({"error": "invalid slug length"}), 400
-        if any(ch not in ALPHABET for ch in slug_req):
-            return jsonify({"error": "slug must be base62"}), 400
+    spec, error = _parse_link_spec(data)
+    if error:
+        return jsonify({"error": error}), 400
+    target_url, is_permanent, slug_req = spec
 
     db = get_db()
-    slug_len = int(current_app.config.get("SLUG_LEN", 6))
-    slug = None
-
-    if slug_req:
-        try:
-            db.execute(
-                "INSERT INTO links (slug, target_url, is_permanent) VALUES (?,?,?)",
-                (slug_req, target_url, is_permanent),
-            )
-            db.commit()
-            slug = slug_req
-        except sqlite3.IntegrityError:
+    slug = insert_link(db, target_url, is_permanent, slug=slug_req)
+    if not slug:
+        if slug_req:
             return jsonify({"error": "slug conflict"}), 409
-    else:
-        for _ in range(10):
-            cand = _base62_slug(slug_len)
-            try:
-                db.execute(
-                    "INSERT INTO links (slug, target_url, is_permanent) VALUES (?,?,?)",
-                    (cand, target_url, is_permanent),
-                )
-                db.commit()
-                slug = cand
-                break
-            except sqlite3.IntegrityError:
-                continue
-        if not slug:
-            return jsonify({"error": "failed to allocate slug"}), 500
+        return jsonify({"error": "failed to allocate slug"}), 500
 
     short_url = f"{current_app.config.get('BASE_URL', '').rstrip('/')}/{slug}"
     log.info("api.create slug=%s is_perm=%s target=%s", slug, is_permanent, target_url)
@@ -96,6 +105,168 @@ def api_create_link():
         "is_permanent": bool(is_permanent)
     }), 201, {"Location": short_url}
 
+NDJSON_MIMETYPES = ("application/x-ndjson", "application/jsonl", "application/x-jsonlines")
+_INVALID_JSON = object()
+
+def _iter_batch_specs():
+    """
+    Itera os itens do corpo do batch: array JSON ou NDJSON (uma spec por linha,
+    lida em streaming). Linhas inválidas viram o erro "invalid json".
+    """
+    if request.mimetype in NDJSON_MIMETYPES:
+        for raw in request.stream:
+            line = raw.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield _INVALID_JSON
+        return
+    data = request.get_json(silent=True)
+    if isinstance(data, list):
+        yield from data
+
+def _insert_batch_chunk(db, chunk, base_url: str):
+    """
+    Insere um bloco de specs numa única transação; retorna os resultados por item.
+    """
+    alloc = get_allocator()
+    if hasattr(alloc, "prefetch"):
+        # Reserva os ids do bloco antes de abrir a transação do lote
+        alloc.prefetch(db, sum(1 for _, spec, error in chunk if not error and not spec[2]))
+    results = []
+    for index, spec, error in chunk:
+        if error:
+            results.append({"index": index, "error": error})
+            continue
+        target_url, is_permanent, slug_req = spec
+        slug = insert_link(db, target_url, is_permanent, slug=slug_req, commit=False)
+        if slug:
+            results.append({"index": index, "slug": slug, "short_url": f"{base_url}/{slug}"})
+        else:
+            results.append({"index": index, "error": "slug conflict" if slug_req else "failed to allocate slug"})
+    db.commit()
+    return results
+
+@bp.post("/links/batch")
+def api_create_links_batch():
+    """
+    Cria links em lote. Corpo: array JSON ou NDJSON (Content-Type application/x-ndjson).
+    Insere em transações de BATCH_CHUNK_SIZE itens e devolve NDJSON com um
+    resultado por item, na ordem de entrada: {"index", "slug", "short_url"} ou {"index", "error"}.
+    """
+    unauth = _auth_or_401()
+    if unauth is not None:
+        return unauth
+    check_rate_limit(scope="api-batch")
+
+    if not (request.is_json or request.mimetype in NDJSON_MIMETYPES):
+        return jsonify({"error": "expected application/json or application/x-ndjson"}), 400
+    if request.is_json and not isinstance(request.get_json(silent=True), list):
+        return jsonify({"error": "expected json array"}), 400
+
+    chunk_size = max(1, int(current_app.config.get("BATCH_CHUNK_SIZE", 500)))
+    base_url = current_app.config.get("BASE_URL", "").rstrip("/")
+
+    def generate():
+        db = get_db()
+        counts = {"created": 0, "failed": 0}
+        chunk = []
+
+        def flush():
+            for r in _insert_batch_chunk(db, chunk, base_url):
+                counts["created" if "slug" in r else "failed"] += 1
+                yield json.dumps(r) + "\n"
+            chunk.clear()
+
+        for index, data in enumerate(_iter_batch_specs()):
+            if data is _INVALID_JSON:
+                chunk.append((index, None, "invalid json"))
+            else:
+                spec, error = _parse_link_spec(data)
+                chunk.append((index, spec, error))
+            if len(chunk) >= chunk_size:
+                yield from flush()
+        if chunk:
+            yield from flush()
+        log.info("api.batch created=%d failed=%d", counts["created"], counts["failed"])
+
+    return Response(stream_with_context(generate()), status=200, mimetype="application/x-ndjson")
+
+@bp.get("/links")
+def api_list_links():
+    """
+    Lista links com totais de cliques, paginada por cursor opaco.
+    Query: ?limit=&cursor=&q=&start=&end=&count=1 (total exato, cacheado)
+    """
+    unauth = _auth_or_401()
+    if unauth is not None:
+        return unauth
+    check_rate_limit(scope="api-list")
+
+    try:
+        limit = int(request.args.get("limit", current_app.config.get("PAGE_SIZE", 20)))
+    except ValueError:
+        return jsonify({"error": "invalid limit"}), 400
+    limit = max(1, min(limit, 100))
+    cursor = request.args.get("cursor") or None
+    if cursor and decode_cursor(cursor) is None:
+        return jsonify({"error": "invalid cursor"}), 400
+    q = (request.args.get("q") or "").strip() or None
+    start = request.args.get("start")
+    end = request.args.get("end")
+
+    db = get_analytics_db()
+    rows, next_cursor, prev_cursor = an.links_page(db, start=start, end=end, q=q, limit=limit, cursor=cursor)
+    base_url = current_app.config.get("BASE_URL", "").rstrip("/")
+    out = {
+        "items": [{
+            "slug": r["slug"],
+            "short_url": f"{base_url}/{r['slug']}",
+            "target_url": r["target_url"],
+            "is_permanent": bool(r["is_permanent"]),
+            "created_at": r["created_at"],
+            "clicks": r["clicks"],
+        } for r in rows],
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor,
+    }
+    if request.args.get("count") == "1":
+        out["total"] = an.count_links_cached(db, q=q)
+    return jsonify(out)
+
+@bp.get("/links/top")
+def api_top_links():
+    """
+    Links mais clicados na janela, do contador em memória (sem consultar clicks).
+    Query: ?window=5m|1h|24h&limit= (até TRENDING_CAPACITY)
+    """
+    unauth = _auth_or_401()
+    if unauth is not None:
+        return unauth
+    check_rate_limit(scope="api-get")
+
+    tracker = trending.get_trending()
+    if tracker is None:
+        return jsonify({"error": "trending disabled"}), 404
+    window = request.args.get("window", trending.DEFAULT_WINDOW)
+    if window not in trending.WINDOWS:
+        return jsonify({"error": "invalid window", "windows": list(trending.WINDOWS)}), 400
+    try:
+        limit = int(request.args.get("limit", 10))
+    except ValueError:
+        return jsonify({"error": "invalid limit"}), 400
+    limit = max(1, min(limit, tracker.capacity))
+
+    result = trending.top_links(get_analytics_db(), window, limit)
+    base_url = current_app.config.get("BASE_URL", "").rstrip("/")
+    for item in result["items"]:
+        item["short_url"] = f"{base_url}/{item['slug']}"
+    resp = jsonify(result)
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
 @bp.get("/links/<slug>")
 def api_get_link(slug: str):
     unauth = _auth_or_401()
@@ -103,45 +274,130 @@ def api_get_link(slug: str):
         return unauth
     check_rate_limit(scope="api-get")
 
-    db = get_db()
+    db = get_analytics_db()
     link = an.get_link_by_slug(db, slug)
     if not link:
         return jsonify({"error": "not found"}), 404
 
-    start = request.args.get("start")
-    end = request.args.get("end")
-    aggregate = request.args.get("aggregate")
+    start, end, aggregate = request.args.get("start"), request.args.get("end"), request.args.get("aggregate")
+    not_modified, apply = httpcache.conditional(
+        db, link_marks(link), link_parts(link, start, end, aggregate),
+        httpcache.API_CACHE_CONTROL, vary="Authorization",
+    )
+    if not_modified is not None:
+        return not_modified
+    return apply(jsonify(link_payload(db, link, start, end, aggregate)))
 
-    if aggregate == "day":
-        per_day = an.clicks_per_day(db, link_id=link["id"], start=start, end=end)
-        clicks_total = sum(r["clicks"] for r in per_day) if per_day else 0
-        return jsonify({
-            "slug": link["slug"],
-            "target_url": link["target_url"],
-            "is_permanent": bool(link["is_permanent"]),
-            "created_at": link["created_at"],
-            "clicks_total": clicks_total,
-            "clicks_per_day": [{"day": r["day"], "clicks": r["clicks"]} for r in per_day],
-            "short_url": f"{current_app.config.get('BASE_URL', '').rstrip('/')}/{link['slug']}"
-        })
-
-    row = db.execute(
-        """
-        SELECT COUNT(*) AS n
-        FROM clicks
-        WHERE link_id = ?
-          AND (? IS NULL OR ts >= ? || ' 00:00:00')
-          AND (? IS NULL OR ts <  date(?,'+1 day'))
-        """,
-        (link["id"], start, start, end, end)
-    ).fetchone()
-    clicks_total = int(row["n"]) if row else 0
+def link_marks(link: dict) -> list[str]:
+    """
+    Marcas d'água (httpcache.py) de que GET /api/links/<slug> depende.
+    """
+    return [f"link:{link['id']}", "maint"]
 
-    return jsonify({
+def link_parts(link: dict, start: str | None, end: str | None, aggregate: str | None) -> tuple:
+    return (link["slug"], link["target_url"], start, end, aggregate, current_app.config.get("BASE_URL", ""))
+
+def link_payload(db, link: dict, start: str | None, end: str | None, aggregate: str | None) -> dict:
+    """
+    Corpo de GET /api/links/<slug> (compartilhado com o modo ASGI).
+    """
+    payload = {
         "slug": link["slug"],
         "target_url": link["target_url"],
         "is_permanent": bool(link["is_permanent"]),
         "created_at": link["created_at"],
-        "clicks_total": clicks_total,
-        "short_url": f"{current_app.config.get('BASE_URL', '').rstrip('/')}/{link['slug']}"
+    }
+    if aggregate == "day":
+        per_day = an.clicks_per_day(db, link_id=link["id"], start=start, end=end)
+        unique, unique_per_day = hll.unique_visitors_per_day(db, link["id"], start, end)
+        payload["clicks_total"] = sum(r["clicks"] for r in per_day) if per_day else 0
+        payload["unique_visitors"] = unique
+        payload["clicks_per_day"] = [
+            {"day": r["day"], "clicks": r["clicks"], "unique_visitors": unique_per_day.get(r["day"], 0)}
+            for r in per_day
+        ]
+    else:
+        payload["clicks_total"] = an.count_clicks(db, link_id=link["id"], start=start, end=end)
+        payload["unique_visitors"] = hll.unique_visitors(db, link["id"], start, end)
+    # Erro padrão relativo da estimativa de únicos (HyperLogLog)
+    payload["unique_visitors_error"] = round(hll.ERROR, 4)
+    payload["short_url"] = f"{current_app.config.get('BASE_URL', '').rstrip('/')}/{link['slug']}"
+    return payload
+
+@bp.get("/export/clicks")
+def api_export_clicks():
+    """
+    Exporta cliques em streaming. Query: ?start=&end=&slug=&format=csv|ndjson
+    &after=<id do último clique recebido>&gzip=1 (ou Accept-Encoding: gzip)
+    """
+    unauth = _auth_or_401()
+    if unauth is not None:
+        return unauth
+    check_rate_limit(scope="api-export")
+
+    db = get_analytics_db(time_limit=False)
+    link_id = None
+    slug = request.args.get("slug")
+    if slug:
+        link = an.get_link_by_slug(db, slug)
+        if not link:
+            return jsonify({"error": "not found"}), 404
+        link_id = link["id"]
+    try:
+        return export.export_response(
+            "clicks", db, request.args.get("format", "csv"), f"clicks-{slug}" if slug else "clicks",
+            start=export.parse_day(request.args.get("start")), end=export.parse_day(request.args.get("end")),
+            link_id=link_id, after=request.args.get("after", type=int),
+        )
+    except export.ExportError as e:
+        return jsonify({"error": str(e)}), 400
+
+@bp.get("/export/links")
+def api_export_links():
+    """
+    Exporta links com total de cliques no intervalo. Query: ?start=&end=&q=
+    &format=csv|ndjson&after=<id do último link recebido>&gzip=1
+    """
+    unauth = _auth_or_401()
+    if unauth is not None:
+        return unauth
+    check_rate_limit(scope="api-export")
+
+    try:
+        return export.export_response(
+            "links", get_analytics_db(time_limit=False), request.args.get("format", "csv"), "links",
+            start=export.parse_day(request.args.get("start")), end=export.parse_day(request.args.get("end")),
+            q=(request.args.get("q") or "").strip() or None, after=request.args.get("after", type=int),
+        )
+    except export.ExportError as e:
+        return jsonify({"error": str(e)}), 400
+
+@bp.get("/stats")
+def api_stats():
+    unauth = _auth_or_401()
+    if unauth is not None:
+        return unauth
+
+    rec = get_recorder()
+    cache = get_link_cache()
+    pool = get_pool()
+    analytics_pool = get_analytics_pool()
+    logs = current_app.extensions.get("log_pipeline")
+    strings = current_app.extensions.get("click_strings")
+    tracker = trending.get_trending()
+    results = current_app.extensions.get("analytics_cache")
+    slug_filter = get_slug_filter()
+    return jsonify({
+        "db_pool": pool.stats() if pool is not None else None,
+        "analytics_pool": analytics_pool.stats() if analytics_pool is not None else None,
+        "slug_allocator": get_allocator().stats(),
+        "rate_limiter": get_rate_limiter().stats(),
+        "click_buffer": rec.stats() if rec is not None else None,
+        "slug_cache": cache.stats() if cache is not None else None,
+        "log_queue": logs.stats() if logs is not None else None,
+        "string_cache": strings.stats() if strings is not None else None,
+        "trending": tracker.stats() if tracker is not None else None,
+        "analytics_cache": results.stats() if results is not None else None,
+        "slug_filter": slug_filter.stats() if slug_filter is not None else None,
+        "startup": current_app.extensions.get("startup"),
     })
@@ -1,8 +1,16 @@
-import os, json, time, logging, logging.config
+import os, json, time, importlib, logging, logging.config
 from pathlib import Path
 from flask import Flask, request, g
 from datetime import timedelta
 
+SECURITY_HEADERS = {
+    "X-Content-Type-Options": "nosniff",
+    "X-Frame-Options": "DENY",
+    "Referrer-Policy": "strict-origin-when-cross-origin",
+    "Content-Security-Policy":
+        "default-src 'self'; img-src 'self' data:; style-src 'self' 'unsafe-inline'; script-src 'self';",
+}
+
 def _boolenv(v: str) -> bool:
     return str(v).lower() in ("1", "true", "yes", "on")
 
@@ -10,7 +18,31 @@ def _apply_env_overrides(app: Flask):
     env_specs = {
         "BASE_URL": str, "DB_PATH": str, "PAGE_SIZE": int, "SLUG_LEN": int,
         "REDIRECT_CACHE": int, "RATE_LIMIT_MAX": int, "RATE_LIMIT_WINDOW": int,
-        "MAX_FORM_BYTES": int, "LOG_LEVEL": str, "DEBUG": _boolenv
+        "RATE_LIMIT_BACKEND": str, "RATE_LIMIT_DB": str, "RATE_LIMIT_SWEEP": float,
+        "MAX_FORM_BYTES": int, "LOG_LEVEL": str, "DEBUG": _boolenv,
+        "BATCH_MAX_BYTES": int, "BATCH_CHUNK_SIZE": int,
+        "CLICK_BUFFER": _boolenv, "CLICK_BUFFER_SIZE": int, "CLICK_FLUSH_BATCH": int,
+        "CLICK_FLUSH_INTERVAL": float, "CLICK_BUFFER_OVERFLOW": str,
+        "SLUG_STRATEGY": str, "SLUG_BLOCK_SIZE": int, "SLUG_PERMUTE": _boolenv, "SLUG_SECRET": str,
+        "SLUG_CACHE_SIZE": int, "SLUG_CACHE_TTL": float, "COUNT_CACHE_TTL": float,
+        "DB_POOL": _boolenv, "DB_POOL_MAX_AGE": float, "DB_POOL_HEALTH_INTERVAL": float,
+        "DB_SYNCHRONOUS": str, "DB_CACHE_SIZE": int, "DB_MMAP_SIZE": int,
+        "DB_BUSY_TIMEOUT": int, "DB_STATEMENT_CACHE": int,
+        "METRICS_ENABLED": _boolenv, "METRICS_TOKEN": str, "METRICS_DIR": str,
+        "METRICS_FLUSH_INTERVAL": float,
+        "LOG_QUEUE": _boolenv, "LOG_QUEUE_SIZE": int, "LOG_QUEUE_BATCH": int,
+        "LOG_ACCESS_FORMAT": str, "LOG_REDIRECT_SAMPLE": float,
+        "ASGI_DB_THREADS": int, "ASGI_WSGI_THREADS": int,
+        "ARCHIVE_DIR": str, "ARCHIVE_AFTER_DAYS": int, "ARCHIVE_COMPRESSION": str,
+        "CLICK_PARTITIONS": _boolenv, "CLICK_PARTITION_DIR": str,
+        "ADMIN_CACHE_MAX_AGE": int, "STRING_CACHE_SIZE": int,
+        "TRENDING_ENABLED": _boolenv, "TRENDING_CAPACITY": int, "TRENDING_DIR": str,
+        "TRENDING_FLUSH_INTERVAL": float,
+        "TEMPLATE_CACHE_DIR": str, "TEMPLATE_PRELOAD": _boolenv, "SLUG_CACHE_PREWARM": int,
+        "ANALYTICS_READONLY": _boolenv, "ANALYTICS_QUERY_TIMEOUT": float, "ANALYTICS_DB_CACHE_SIZE": int,
+        "ANALYTICS_DB_MMAP_SIZE": int, "ANALYTICS_DB_BUSY_TIMEOUT": int,
+        "ANALYTICS_CACHE_SIZE": int, "ANALYTICS_CACHE_BYTES": int,
+        "SLUG_FILTER": _boolenv, "SLUG_FILTER_FP_RATE": float, "SLUG_FILTER_CHECK_INTERVAL": float,
     }
     for k, caster in env_specs.items():
         if k in os.environ:
@@ -28,11 +60,69 @@ def _load_config_and_logging(app: Flask):
         DB_PATH="var/data.db",
         PAGE_SIZE=20,
         SLUG_LEN=6,
+        SLUG_STRATEGY="counter",
+        SLUG_BLOCK_SIZE=1000,
+        SLUG_PERMUTE=True,
         REDIRECT_CACHE=3600,
         RATE_LIMIT_MAX=10,
         RATE_LIMIT_WINDOW=60,
+        RATE_LIMIT_BACKEND="memory",
+        RATE_LIMIT_DB="var/ratelimit.db",
+        RATE_LIMIT_SWEEP=60,
         MAX_FORM_BYTES=4096,
+        BATCH_MAX_BYTES=64 * 1024 * 1024,
+        BATCH_CHUNK_SIZE=500,
         LOG_LEVEL="INFO",
+        LOG_QUEUE=False,
+        LOG_QUEUE_SIZE=10000,
+        LOG_QUEUE_BATCH=256,
+        LOG_ACCESS_FORMAT="text",
+        LOG_REDIRECT_SAMPLE=1.0,
+        CLICK_BUFFER=False,
+        CLICK_BUFFER_SIZE=10000,
+        CLICK_FLUSH_BATCH=500,
+        CLICK_FLUSH_INTERVAL=1.0,
+        CLICK_BUFFER_OVERFLOW="drop",
+        SLUG_CACHE_SIZE=10000,
+        SLUG_CACHE_TTL=60,
+        COUNT_CACHE_TTL=30,
+        DB_POOL=True,
+        DB_POOL_MAX_AGE=3600,
+        DB_POOL_HEALTH_INTERVAL=30,
+        DB_SYNCHRONOUS="NORMAL",
+        DB_CACHE_SIZE=-8000,
+        DB_MMAP_SIZE=0,
+        DB_BUSY_TIMEOUT=5000,
+        DB_STATEMENT_CACHE=128,
+        METRICS_ENABLED=False,
+        METRICS_DIR="",
+        METRICS_FLUSH_INTERVAL=5,
+        ASGI_DB_THREADS=4,
+        ASGI_WSGI_THREADS=16,
+        ARCHIVE_DIR="var/archive",
+        ARCHIVE_AFTER_DAYS=90,
+        ARCHIVE_COMPRESSION="lzma",
+        CLICK_PARTITIONS=False,
+        CLICK_PARTITION_DIR="var/clicks",
+        ADMIN_CACHE_MAX_AGE=0,
+        STRING_CACHE_SIZE=10000,
+        TRENDING_ENABLED=True,
+        TRENDING_CAPACITY=100,
+        TRENDING_DIR="",
+        TRENDING_FLUSH_INTERVAL=5,
+        TEMPLATE_CACHE_DIR="var/jinja",
+        TEMPLATE_PRELOAD=True,
+        SLUG_CACHE_PREWARM=0,
+        ANALYTICS_READONLY=True,
+        ANALYTICS_QUERY_TIMEOUT=5.0,
+        ANALYTICS_DB_CACHE_SIZE=-32000,
+        ANALYTICS_DB_MMAP_SIZE=0,
+        ANALYTICS_DB_BUSY_TIMEOUT=1000,
+        ANALYTICS_CACHE_SIZE=1000,
+        ANALYTICS_CACHE_BYTES=32 * 1024 * 1024,
+        SLUG_FILTER=False,
+        SLUG_FILTER_FP_RATE=0.01,
+        SLUG_FILTER_CHECK_INTERVAL=1.0,
     )
 
     cfg_path = os.environ.get("APP_CONFIG", "config/config.json")
@@ -62,24 +152,32 @@ def _load_config_and_logging(app: Flask):
     logging.getLogger("access").setLevel(level)
 
 def create_app(config_overrides: dict | None = None) -> Flask:
+    from .startup import StartupTimer, finish as finish_startup
+    timer = StartupTimer()
     app = Flask(__name__, static_folder="static", template_folder="templates")
 
-    _load_config_and_logging(app)
-    if config_overrides:
-        app.config.update(config_overrides)
-
-    from .public import bp as public_bp
-    from .admin import bp as admin_bp
-    from .api import bp as api_bp    
-    app.register_blueprint(public_bp)
-    app.register_blueprint(admin_bp, url_prefix="/admin")
-    app.register_blueprint(api_bp, url_prefix="/api")
-
-    from . import db as db_ext
-    db_ext.init_app(app)
-
-    from . import security as sec
-    sec.init_app(app)
+    with timer.phase("config"):
+        _load_config_and_logging(app)
+        if config_overrides:
+            app.config.update(config_overrides)
+
+    from . import logqueue as logqueue_ext
+    with timer.phase("logqueue"):
+        logqueue_ext.init_app(app)
+
+    with timer.phase("blueprints"):
+        from .public import bp as public_bp
+        from .admin import bp as admin_bp
+        from .api import bp as api_bp
+        app.register_blueprint(public_bp)
+        app.register_blueprint(admin_bp, url_prefix="/admin")
+        app.register_blueprint(api_bp, url_prefix="/api")
+
+    # Extensões na ordem de dependência; cada uma é uma fase do tempo de startup
+    for name in ("db", "security", "strings", "clicks", "cache", "memo", "slugs", "slugfilter", "search", "migrate",
+                 "partitions", "archive", "export", "trending", "metrics", "startup"):
+        with timer.phase(name):
+            importlib.import_module(f".{name}", __package__).init_app(app)
 
     @app.before_request
     def _start_timer():
@@ -87,29 +185,38 @@ def create_app(config_overrides: dict | None = None) -> Flask:
 
     @app.after_request
     def set_security_headers_and_access_log(resp):
-        resp.headers.setdefault("X-Content-Type-Options", "nosniff")
-        resp.headers.setdefault("X-Frame-Options", "DENY")
-        resp.headers.setdefault("Referrer-Policy", "strict-origin-when-cross-origin")
-        resp.headers.setdefault(
-            "Content-Security-Policy",
-            "default-src 'self'; img-src 'self' data:; style-src 'self' 'unsafe-inline'; script-src 'self';"
-        )
+        for name, value in SECURITY_HEADERS.items():
+            resp.headers.setdefault(name, value)
         try:
             dur_ms = int((time.perf_counter() - getattr(g, "_t0", time.perf_counter())) * 1000)
         except Exception:
             dur_ms = -1
+        sample = 1.0
+        if request.endpoint == "public.follow" and resp.status_code < 400:
+            sample = float(app.config.get("LOG_REDIRECT_SAMPLE", 1.0))
+            if not logqueue_ext.redirect_sampled(sample):
+                return resp
+        path = request.full_path.rstrip("?") if request.query_string else request.path
+        ua = request.headers.get("User-Agent", "-")
+        ref = request.headers.get("Referer", "-")
         logging.getLogger("access").info(
             '%s %s %s %s %dms ua="%s" ref="%s"',
             request.remote_addr or "-",
             request.method,
-            request.full_path.rstrip("?") if request.query_string else request.path,
+            path,
             resp.status_code,
             dur_ms,
-            request.headers.get("User-Agent", "-"),
-            request.headers.get("Referer", "-"),
+            ua,
+            ref,
+            extra={"http": {
+                "ip": request.remote_addr, "method": request.method, "path": path,
+                "status": resp.status_code, "dur_ms": dur_ms, "endpoint": request.endpoint,
+                "ua": ua, "ref": ref, "sample": sample,
+            }},
         )
         return resp
 
+    finish_startup(app, timer)
     return app
 
 if __name__ == "__main__":
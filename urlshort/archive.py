@@ -0,0 +1,281 @@
+from __future__ import annotations
+import os, sys, json, lzma, zlib, time, struct, bisect, calendar, logging
+from array import array
+from sqlite3 import Connection
+from flask import current_app, has_app_context
+import click
+from . import strings
+
+log = logging.getLogger("app")
+
+# Arquivo colunar por mês: MAGIC + u32 tamanho do header JSON + header + colunas.
+# Cada coluna é um bloco comprimido independente; inteiros em array('q') e textos
+# como dicionário (lista JSON) + códigos array('I'). Linhas ordenadas por (link_id, ts).
+MAGIC = b"UCOL1\n"
+COLUMNS = (("id", "int"), ("link_id", "int"), ("ts", "int"),
+           ("ip", "str"), ("user_agent", "str"), ("referrer", "str"))
+COMPRESSORS = {
+    "zlib": (lambda b: zlib.compress(b, 9), zlib.decompress),
+    "lzma": (lambda b: lzma.compress(b, preset=6), lzma.decompress),
+}
+TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def ts_to_epoch(ts: str) -> int:
+    # "YYYY-MM-DD HH:MM:SS" (UTC); fatiar é bem mais rápido que strptime
+    return calendar.timegm((int(ts[0:4]), int(ts[5:7]), int(ts[8:10]),
+                            int(ts[11:13] or 0), int(ts[14:16] or 0), int(ts[17:19] or 0)))
+
+def epoch_to_ts(t: int) -> str:
+    return time.strftime(TS_FORMAT, time.gmtime(t))
+
+def month_path(archive_dir: str, month: str) -> str:
+    return os.path.join(archive_dir, f"clicks-{month}.ucol")
+
+def list_months(archive_dir: str) -> list[str]:
+    """
+    Meses arquivados ("YYYY-MM"), em ordem crescente.
+    """
+    if not os.path.isdir(archive_dir):
+        return []
+    out = []
+    for fn in os.listdir(archive_dir):
+        if fn.startswith("clicks-") and fn.endswith(".ucol"):
+            out.append(fn[len("clicks-"):-len(".ucol")])
+    return sorted(out)
+
+def _encode_ints(values) -> bytes:
+    return array("q", values).tobytes()
+
+def _decode_ints(data: bytes, byteorder: str) -> array:
+    a = array("q")
+    a.frombytes(data)
+    if byteorder != sys.byteorder:
+        a.byteswap()
+    return a
+
+def _encode_strs(values) -> bytes:
+    index: dict = {}
+    codes = array("I", (index.setdefault(v, len(index)) for v in values))
+    dictionary = json.dumps(list(index), ensure_ascii=False).encode("utf-8")
+    return struct.pack(">I", len(dictionary)) + dictionary + codes.tobytes()
+
+def _decode_strs(data: bytes, byteorder: str) -> list:
+    (n,) = struct.unpack(">I", data[:4])
+    dictionary = json.loads(data[4:4 + n].decode("utf-8"))
+    codes = array("I")
+    codes.frombytes(data[4 + n:])
+    if byteorder != sys.byteorder:
+        codes.byteswap()
+    return [dictionary[c] for c in codes]
+
+def write_month(path: str, rows: list[tuple], compression: str = "lzma") -> int:
+    """
+    Grava `rows` (id, link_id, ts_epoch, ip, user_agent, referrer) num arquivo
+    colunar (escrita atômica: tmp + fsync + rename). Retorna o tamanho em bytes.
+    """
+    compress = COMPRESSORS[compression][0]
+    rows = sorted(rows, key=lambda r: (r[1], r[2], r[0]))
+    blocks, meta, offset = [], [], 0
+    for i, (name, kind) in enumerate(COLUMNS):
+        values = [r[i] for r in rows]
+        raw = _encode_ints(values) if kind == "int" else _encode_strs(values)
+        block = compress(raw)
+        blocks.append(block)
+        meta.append({"name": name, "kind": kind, "offset": offset, "length": len(block)})
+        offset += len(block)
+    header = json.dumps({
+        "version": 1, "rows": len(rows), "compression": compression, "byteorder": sys.byteorder,
+        "min_ts": min((r[2] for r in rows), default=None), "max_ts": max((r[2] for r in rows), default=None),
+        "columns": meta,
+    }).encode("utf-8")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack(">I", len(header)) + header)
+        for block in blocks:
+            f.write(block)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return os.path.getsize(path)
+
+class MonthFile:
+    """
+    Leitura preguiçosa de um arquivo colunar: cada coluna só é descomprimida quando usada.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            data = f.read()
+        if not data.startswith(MAGIC):
+            raise ValueError(f"{path}: não é um arquivo de arquivo de cliques")
+        pos = len(MAGIC)
+        (n,) = struct.unpack(">I", data[pos:pos + 4])
+        self.header = json.loads(data[pos + 4:pos + 4 + n].decode("utf-8"))
+        self._data = memoryview(data)[pos + 4 + n:]
+        self._cols: dict = {}
+        self.rows = int(self.header["rows"])
+
+    def column(self, name: str):
+        if name not in self._cols:
+            meta = next(c for c in self.header["columns"] if c["name"] == name)
+            raw = COMPRESSORS[self.header["compression"]][1](
+                bytes(self._data[meta["offset"]:meta["offset"] + meta["length"]]))
+            byteorder = self.header["byteorder"]
+            self._cols[name] = _decode_ints(raw, byteorder) if meta["kind"] == "int" else _decode_strs(raw, byteorder)
+        return self._cols[name]
+
+    def link_range(self, link_id: int) -> tuple[int, int]:
+        ids = self.column("link_id")
+        return bisect.bisect_left(ids, link_id), bisect.bisect_right(ids, link_id)
+
+    def all_rows(self) -> list[tuple]:
+        cols = [self.column(name) for name, _ in COLUMNS]
+        return list(zip(*cols))
+
+def archived_clicks(archive_dir: str, link_id: int, start: str | None = None, end: str | None = None,
+                    limit: int = 100) -> list[dict]:
+    """
+    Cliques arquivados do link no intervalo, mais recentes primeiro (mesmas chaves de
+    analytics.recent_clicks). Só abre os meses que o intervalo cobre.
+    """
+    lo = ts_to_epoch(start + " 00:00:00") if start else None
+    hi = ts_to_epoch(end + " 00:00:00") + 86400 if end else None
+    out: list[dict] = []
+    for month in reversed(list_months(archive_dir)):
+        if len(out) >= limit:
+            break
+        if (start and month < start[:7]) or (end and month > end[:7]):
+            continue
+        f = MonthFile(month_path(archive_dir, month))
+        a, b = f.link_range(link_id)
+        if a == b:
+            continue
+        ts, ip, ua, ref = f.column("ts"), f.column("ip"), f.column("user_agent"), f.column("referrer")
+        for i in range(b - 1, a - 1, -1):
+            t = ts[i]
+            if (hi is not None and t >= hi) or (lo is not None and t < lo):
+                continue
+            out.append({"ts": epoch_to_ts(t), "ip": ip[i], "user_agent": ua[i], "referrer": ref[i]})
+            if len(out) >= limit:
+                break
+    return out
+
+def get_archive_dir() -> str | None:
+    if not has_app_context():
+        return None
+    return current_app.config.get("ARCHIVE_DIR") or None
+
+def _months_to_archive(db: Connection, cutoff: str) -> list[tuple]:
+    """
+    (mês, partição) com cliques antes de `cutoff`; partição None = tabela clicks
+    do banco principal, coberta mês a mês a partir do clique mais antigo.
+    """
+    from .partitions import click_months, table_for
+    out = []
+    for part in click_months(end=cutoff):
+        table = table_for(db, part)
+        first = db.execute(f"SELECT MIN(ts) FROM {table}").fetchone()[0] if table else None
+        if first is None or first[:10] >= cutoff:
+            continue
+        if part is not None:
+            out.append((part, part))
+            continue
+        month = first[:7]
+        while month + "-01" < cutoff:
+            out.append((month, None))
+            month = db.execute("SELECT strftime('%Y-%m', date(?, '+1 month'))", (month + "-01",)).fetchone()[0]
+    return out
+
+def archive_clicks(db: Connection, archive_dir: str, older_than_days: int, compression: str = "lzma",
+                   vacuum: bool = True, progress=print) -> dict:
+    """
+    Move cliques de dias anteriores a hoje - `older_than_days` (UTC) para arquivos
+    colunares por mês e os apaga do banco.
+
+    Ordem segura: (1) recalcula clicks_daily dos dias arquivados (o rollup é a fonte
+    de clicks_per_day/count_clicks para dias fechados); (2) grava/mescla cada mês
+    (deduplicado pelo id do clique, então repetir após uma falha é idempotente);
+    (3) apaga do banco, um dia por transação; (4) checkpoint do WAL e VACUUM opcional.
+    Com partições (partitions.py), um mês inteiro antes do corte sai apagando o
+    arquivo da partição, sem DELETE.
+    """
+    from .clicks import backfill_daily
+    from .partitions import table_for, drop_partition, get_partition_dir
+    days = max(1, int(older_than_days))
+    cutoff = db.execute("SELECT date('now', ?)", (f"-{days} days",)).fetchone()[0]
+    stats = {"cutoff": cutoff, "rows": 0, "months": [], "bytes": 0}
+    months = _months_to_archive(db, cutoff)
+    if not months:
+        progress(f"nada a arquivar antes de {cutoff}")
+        return stats
+
+    until = db.execute("SELECT date(?, '-1 day')", (cutoff,)).fetchone()[0]
+    progress(f"rollup: recalculando {months[0][0]}-01..{until}")
+    backfill_daily(db, since=months[0][0] + "-01", until=until)
+
+    for month, part in months:
+        month_start = month + "-01"
+        next_month = db.execute("SELECT strftime('%Y-%m', date(?, '+1 month'))", (month_start,)).fetchone()[0]
+        upper = min(next_month + "-01", cutoff)
+        table = table_for(db, part)
+        if table is None:
+            continue
+        cur = db.execute(
+            f"SELECT c.id, c.link_id, c.ts, c.ip, {strings.SELECT_COLUMNS} FROM {table} c {strings.join_sql('c')} "
+            "WHERE c.ts >= ? AND c.ts < ?",
+            (month_start, upper),
+        )
+        rows = [(r[0], r[1], ts_to_epoch(r[2]), r[3], r[4], r[5]) for r in cur]
+        if not rows:
+            continue
+        by_day: dict[int, list] = {}
+        for r in rows:
+            by_day.setdefault(r[2] // 86400, []).append((r[0],))
+        path = month_path(archive_dir, month)
+        if os.path.exists(path):
+            seen = {r[0] for r in rows}
+            rows.extend(r for r in MonthFile(path).all_rows() if r[0] not in seen)
+        size = write_month(path, rows, compression)
+        stats["months"].append(month)
+        stats["bytes"] += size
+        progress(f"{month}: {len(rows)} cliques em {os.path.basename(path)} ({size} bytes)")
+        if part is not None and upper == next_month + "-01":
+            # Mês inteiro arquivado: apaga o arquivo da partição
+            drop_partition(db, get_partition_dir(), part)
+            stats["rows"] += sum(len(ids) for ids in by_day.values())
+            continue
+        # Só depois do arquivo estar no disco. Um dia por transação: nunca sobra
+        # dia parcial no banco, então o backfill do rollup numa nova execução é exato
+        for day in sorted(by_day):
+            with db:
+                db.executemany(f"DELETE FROM {table} WHERE id = ?", by_day[day])
+            stats["rows"] += len(by_day[day])
+
+    db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    if vacuum:
+        progress("VACUUM (bloqueia escritas até terminar)...")
+        db.execute("VACUUM")
+    log.info("archive cutoff=%s rows=%d months=%s", cutoff, stats["rows"], ",".join(stats["months"]))
+    return stats
+
+@click.command("archive-clicks")
+@click.option("--days", type=int, default=None, help="Mantém no banco só os últimos N dias (padrão ARCHIVE_AFTER_DAYS).")
+@click.option("--compression", type=click.Choice(sorted(COMPRESSORS)), default=None)
+@click.option("--vacuum/--no-vacuum", default=True, help="Roda VACUUM no fim para devolver o espaço ao disco.")
+def archive_clicks_command(days, compression, vacuum):
+    from .db import get_db
+    cfg = current_app.config
+    archive_dir = get_archive_dir()
+    if not archive_dir:
+        raise click.ClickException("ARCHIVE_DIR não configurado")
+    stats = archive_clicks(
+        get_db(), archive_dir,
+        days if days is not None else int(cfg.get("ARCHIVE_AFTER_DAYS", 90)),
+        compression or cfg.get("ARCHIVE_COMPRESSION", "lzma"),
+        vacuum=vacuum, progress=click.echo,
+    )
+    click.echo(f"{stats['rows']} cliques arquivados (antes de {stats['cutoff']}), {stats['bytes']} bytes em disco")
+
+def init_app(app):
+    app.cli.add_command(archive_clicks_command)
@@ -0,0 +1,412 @@
+"""
+Modo ASGI: redirects (`/<slug>`) e `GET /api/links/<slug>` atendidos de forma
+assíncrona; o resto do app Flask (admin, formulários, API de escrita) roda montado
+ao lado, numa ponte WSGI com pool de threads próprio.
+
+    uvicorn --factory urlshort.asgi:create_asgi_app --workers 4
+
+Sem dependências além do Flask: qualquer servidor ASGI 3 (uvicorn, hypercorn,
+granian) serve.
+"""
+from __future__ import annotations
+import sys, time, queue, random, asyncio, logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+from flask import current_app
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import RequestRedirect
+from .app import create_app, SECURITY_HEADERS
+from .db import get_db, get_analytics_db, db_time_reset, db_time_total, is_interrupted, query_timeout_response
+from .api import token_challenge, link_payload, link_marks, link_parts
+from .public import redirect_response
+from .clicks import record_click
+from .migrate import schema_ready
+from .security import rate_limit_retry
+from . import analytics as an
+from . import httpcache
+
+log = logging.getLogger("app")
+access_log = logging.getLogger("access")
+
+NATIVE_ENDPOINTS = ("public.follow", "api.api_get_link")
+
+def _header(scope, name: bytes) -> str | None:
+    for k, v in scope["headers"]:
+        if k == name:
+            return v.decode("latin-1")
+    return None
+
+def _client_ip(scope) -> str | None:
+    # Mesma regra de security.client_ip
+    xff = _header(scope, b"x-forwarded-for")
+    if xff:
+        return xff.split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else None
+
+class _Body:
+    """
+    wsgi.input alimentado pelo event loop (receive) e lido pela thread do WSGI.
+    """
+
+    def __init__(self):
+        self._q: queue.Queue = queue.Queue()
+        self._buf = b""
+        self._eof = False
+
+    def feed(self, chunk: bytes | None) -> None:
+        self._q.put(chunk)
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._q.get()
+        if chunk is None:
+            self._eof = True
+            return False
+        self._buf += chunk
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        while (size < 0 or len(self._buf) < size) and self._fill():
+            pass
+        if size < 0:
+            out, self._buf = self._buf, b""
+        else:
+            out, self._buf = self._buf[:size], self._buf[size:]
+        return out
+
+    def readline(self, size: int = -1) -> bytes:
+        while b"\n" not in self._buf and (size < 0 or len(self._buf) < size) and self._fill():
+            pass
+        end = self._buf.find(b"\n") + 1 or len(self._buf)
+        if size >= 0:
+            end = min(end, size)
+        out, self._buf = self._buf[:end], self._buf[end:]
+        return out
+
+    def readlines(self, hint: int = -1) -> list[bytes]:
+        return list(iter(self.readline, b""))
+
+    def __iter__(self):
+        return iter(self.readline, b"")
+
+class AsgiApp:
+    """
+    Aplicação ASGI 3 sobre um app Flask já criado.
+
+    - Redirect: cache de slugs consultado no próprio event loop; só um miss vai ao
+      banco, numa thread do executor pequeno (`db_threads`). O clique vai para o
+      buffer write-behind (nunca grava no request).
+    - GET /api/links/<slug>: autenticação, rate limit e consultas no mesmo executor.
+    - Qualquer outra rota (e os 404, para renderizar o template) segue para o Flask
+      via ponte WSGI, com corpo e resposta em streaming.
+    """
+
+    def __init__(self, flask_app, db_threads: int = 4, wsgi_threads: int = 16):
+        self.flask = flask_app
+        self.db_executor = ThreadPoolExecutor(max(1, db_threads), thread_name_prefix="asgi-db")
+        self.wsgi_executor = ThreadPoolExecutor(max(1, wsgi_threads), thread_name_prefix="asgi-wsgi")
+        self.max_age = int(flask_app.config.get("REDIRECT_CACHE", 3600))
+        self.sample = float(flask_app.config.get("LOG_REDIRECT_SAMPLE", 1.0))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] != "http":
+            return
+        endpoint, args = self._match(scope)
+        if endpoint is not None and not schema_ready(self.flask):
+            # Schema atrasado: o Flask responde 503 (e reavalia depois do migrate)
+            endpoint = None
+        if endpoint == "public.follow":
+            return await self._follow(scope, receive, send, args["slug"])
+        if endpoint == "api.api_get_link":
+            return await self._api_get_link(scope, send, args["slug"])
+        return await self._wsgi(scope, receive, send)
+
+    def _match(self, scope):
+        if scope["method"] not in ("GET", "HEAD"):
+            return None, None
+        adapter = self.flask.url_map.bind("localhost", script_name=scope.get("root_path") or None)
+        try:
+            endpoint, args = adapter.match(scope["path"], scope["method"])
+        except (HTTPException, RequestRedirect):
+            return None, None
+        return (endpoint, args) if endpoint in NATIVE_ENDPOINTS else (None, None)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                rec = self.flask.extensions.get("click_recorder")
+                if rec is not None:
+                    await asyncio.get_running_loop().run_in_executor(None, rec.close)
+                self.db_executor.shutdown(wait=False)
+                self.wsgi_executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    # --- rotas nativas ---
+
+    def _in_app(self, fn, *args):
+        # Roda fn num app context (conexão do pool da thread, cache, config)
+        db_time_reset()
+        with self.flask.app_context():
+            result = fn(get_db(), *args)
+        return result, db_time_total()
+
+    def _in_analytics(self, fn, *args):
+        # Como _in_app, com a conexão só-leitura de analytics (com prazo por consulta)
+        db_time_reset()
+        with self.flask.app_context():
+            result = fn(get_analytics_db(), *args)
+        return result, db_time_total()
+
+    def _load_link(self, db, slug: str):
+        # (link, 404 pronto): com o filtro de slugs, um "não" nem busca o slug
+        slug_filter = self.flask.extensions.get("slug_filter")
+        # O "não" sem conferência já foi respondido no event loop; aqui só a conferida
+        if slug_filter is not None and slug_filter.check_due() and slug_filter.definitely_missing(slug, lambda: db):
+            return None, slug_filter.not_found_response(slug)
+        link = an.fetch_link_by_slug(db, slug)
+        cache = self.flask.extensions.get("link_cache")
+        if link is not None and cache is not None:
+            cache.put(slug, link)
+        if link is None and slug_filter is not None:
+            slug_filter.false_positive()
+            return None, slug_filter.not_found_response(slug)
+        return link, None
+
+    async def _follow(self, scope, receive, send, slug: str):
+        t0 = time.perf_counter()
+        cache = self.flask.extensions.get("link_cache")
+        link = cache.get(slug) if cache is not None else None
+        db_time = 0.0
+        if link is None:
+            slug_filter = self.flask.extensions.get("slug_filter")
+            if slug_filter is not None and slug_filter.definitely_missing(slug):
+                # Sem ida ao pool de threads nem ao SQLite; conferência da geração
+                # vencida responde "talvez" aqui e é feita no executor
+                resp = slug_filter.not_found_response(slug)
+                await self._send_response(scope, send, resp)
+                return self._finish(scope, "public", "public.follow", resp.status_code, t0, 0.0)
+            loop = asyncio.get_running_loop()
+            (link, not_found), db_time = await loop.run_in_executor(
+                self.db_executor, self._in_app, self._load_link, slug
+            )
+            if not_found is not None:
+                await self._send_response(scope, send, not_found)
+                return self._finish(scope, "public", "public.follow", not_found.status_code, t0, db_time)
+            if link is None:
+                return await self._wsgi(scope, receive, send)
+
+        ip = _client_ip(scope)
+        ua = _header(scope, b"user-agent")
+        ref = _header(scope, b"referer")
+        rec = self.flask.extensions.get("click_recorder")
+        if rec is not None:
+            rec.record(link["id"], ip, ua, ref)
+        else:
+            # CLICK_BUFFER desligado por override: grava no pool de threads, como o WSGI
+            loop = asyncio.get_running_loop()
+            _, t = await loop.run_in_executor(
+                self.db_executor, self._in_app, record_click, link["id"], ip, ua, ref
+            )
+            db_time += t
+        trending = self.flask.extensions.get("trending")
+        if trending is not None:
+            trending.record(link["id"], flush=False)
+            if trending.flush_due():
+                asyncio.get_running_loop().run_in_executor(self.db_executor, trending.maybe_flush)
+
+        resp = redirect_response(link, self.max_age)
+        sampled = self.sample >= 1.0 or random.random() < self.sample
+        if sampled:
+            log.info("redirect slug=%s code=%s to=%s ip=%s", slug, resp.status_code, link["target_url"], ip)
+        await self._send_response(scope, send, resp)
+        self._finish(scope, "public", "public.follow", resp.status_code, t0, db_time, log_access=sampled)
+
+    def _api_get_link_sync(self, db, scope, slug: str):
+        challenge = token_challenge(_header(scope, b"authorization") or "")
+        if challenge is not None:
+            resp = current_app.json.response({"error": "unauthorized"})
+            resp.status_code = 401
+            resp.headers["WWW-Authenticate"] = challenge
+            return resp
+        retry = rate_limit_retry("api-get", _client_ip(scope))
+        if retry is not None:
+            resp = current_app.response_class("Too Many Requests", status=429)
+            resp.headers["Retry-After"] = str(max(1, int(retry + 0.999)))
+            return resp
+        link = an.get_link_by_slug(db, slug)
+        if not link:
+            resp = current_app.json.response({"error": "not found"})
+            resp.status_code = 404
+            return resp
+        qs = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        arg = lambda k: (qs.get(k) or [None])[0]
+        start, end, aggregate = arg("start"), arg("end"), arg("aggregate")
+        etag, last = httpcache.validators(db, link_marks(link), *link_parts(link, start, end, aggregate))
+        cc = httpcache.API_CACHE_CONTROL
+        if httpcache.is_not_modified(etag, last, _header(scope, b"if-none-match"), _header(scope, b"if-modified-since")):
+            return httpcache.not_modified_response(etag, last, cc, vary="Authorization")
+        try:
+            resp = current_app.json.response(link_payload(db, link, start, end, aggregate))
+        except Exception as e:
+            if not is_interrupted(e):
+                raise
+            log.warning("analytics query cancelled endpoint=api.api_get_link")
+            return query_timeout_response(as_json=True)
+        return httpcache.finish(resp, etag, last, cc, vary="Authorization")
+
+    async def _api_get_link(self, scope, send, slug: str):
+        t0 = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        resp, db_time = await loop.run_in_executor(
+            self.db_executor, self._in_analytics, self._api_get_link_sync, scope, slug)
+        await self._send_response(scope, send, resp)
+        self._finish(scope, "api", "api.api_get_link", resp.status_code, t0, db_time,
+                     rate_scope="api-get" if resp.status_code == 429 else None)
+
+    async def _send_response(self, scope, send, resp):
+        for name, value in SECURITY_HEADERS.items():
+            resp.headers.setdefault(name, value)
+        data = resp.get_data()
+        resp.headers["Content-Length"] = str(len(data))
+        body = b"" if scope["method"] == "HEAD" else data
+        # Location IRI -> URI, como na resposta WSGI (autocorrect_location_header é False)
+        headers = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in resp.get_wsgi_headers({}).items()]
+        await send({"type": "http.response.start", "status": resp.status_code, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    def _finish(self, scope, blueprint: str, endpoint: str, status: int, t0: float, db_time: float,
+                log_access: bool = True, rate_scope: str | None = None):
+        duration = time.perf_counter() - t0
+        metrics = self.flask.extensions.get("metrics")
+        if metrics is not None:
+            metrics.observe_request(blueprint, endpoint, scope["method"], status, duration, db_time, rate_scope)
+        if not log_access:
+            return
+        qs = scope.get("query_string") or b""
+        path = scope["path"] + ("?" + qs.decode("latin-1") if qs else "")
+        client = scope.get("client")
+        remote = client[0] if client else "-"
+        ua = _header(scope, b"user-agent") or "-"
+        ref = _header(scope, b"referer") or "-"
+        dur_ms = int(duration * 1000)
+        access_log.info(
+            '%s %s %s %s %dms ua="%s" ref="%s"', remote, scope["method"], path, status, dur_ms, ua, ref,
+            extra={"http": {
+                "ip": remote, "method": scope["method"], "path": path, "status": status,
+                "dur_ms": dur_ms, "endpoint": endpoint, "ua": ua, "ref": ref,
+                "sample": self.sample if endpoint == "public.follow" else 1.0,
+            }},
+        )
+
+    # --- ponte WSGI para o resto do app ---
+
+    def _environ(self, scope, body: _Body) -> dict:
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client")
+        root_path = scope.get("root_path", "")
+        path = scope["path"]
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": root_path.encode("utf-8").decode("latin-1"),
+            "PATH_INFO": path.encode("utf-8").decode("latin-1"),
+            "QUERY_STRING": (scope.get("query_string") or b"").decode("latin-1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1] or 80),
+            "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+            "REMOTE_ADDR": client[0] if client else "",
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": body,
+            "wsgi.input_terminated": True,
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": True,
+            "wsgi.run_once": False,
+        }
+        for k, v in scope["headers"]:
+            name = k.decode("latin-1").upper().replace("-", "_")
+            value = v.decode("latin-1")
+            if name in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+                environ[name] = value
+                continue
+            key = "HTTP_" + name
+            environ[key] = environ[key] + "," + value if key in environ else value
+        return environ
+
+    def _run_wsgi(self, environ, loop, send) -> None:
+        def _send(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+            return lambda data: None
+
+        def _start():
+            _send({"type": "http.response.start", "status": started["status"], "headers": started["headers"]})
+
+        result = self.flask.wsgi_app(environ, start_response)
+        try:
+            sent = False
+            for chunk in result:
+                if not chunk:
+                    continue
+                if not sent:
+                    _start()
+                    sent = True
+                _send({"type": "http.response.body", "body": chunk, "more_body": True})
+            if not sent:
+                _start()
+            _send({"type": "http.response.body", "body": b""})
+        finally:
+            close = getattr(result, "close", None)
+            if close is not None:
+                close()
+
+    async def _wsgi(self, scope, receive, send):
+        body = _Body()
+        loop = asyncio.get_running_loop()
+
+        async def pump():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    body.feed(None)
+                    return
+                body.feed(message.get("body", b""))
+                if not message.get("more_body"):
+                    body.feed(None)
+                    return
+
+        pumping = asyncio.ensure_future(pump())
+        try:
+            await loop.run_in_executor(self.wsgi_executor, self._run_wsgi, self._environ(scope, body), loop, send)
+        finally:
+            if not pumping.done():
+                pumping.cancel()
+
+def create_asgi_app(config_overrides: dict | None = None) -> AsgiApp:
+    """
+    Cria o app Flask (mesma config do WSGI) e o envolve em AsgiApp. Neste modo o
+    buffer de cliques fica ligado por padrão, para o redirect nunca gravar no banco.
+    """
+    overrides = {"CLICK_BUFFER": True}
+    overrides.update(config_overrides or {})
+    flask_app = create_app(overrides)
+    return AsgiApp(
+        flask_app,
+        db_threads=int(flask_app.config.get("ASGI_DB_THREADS", 4)),
+        wsgi_threads=int(flask_app.config.get("ASGI_WSGI_THREADS", 16)),
+    )
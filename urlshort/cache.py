@@ -0,0 +1,98 @@
+from __future__ import annotations
+import time, threading
+from typing import Any
+from collections import OrderedDict
+from flask import current_app, has_app_context
+
+class LinkCache:
+    """
+    Cache LRU com TTL para slug -> link (id, slug, target_url, is_permanent, created_at).
+
+    Só guarda links existentes; misses sempre vão ao banco. É por processo:
+    o TTL limita quanto tempo outro worker pode servir um link já alterado.
+    Também é usado, com outra instância, para cachear contagens (count_links).
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 60.0):
+        self.max_size = max(1, int(max_size))
+        self.ttl = float(ttl)
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = self._misses = self._evictions = self._expirations = 0
+
+    def get(self, slug: str) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(slug)
+            if item is None:
+                self._misses += 1
+                return None
+            expires, value = item
+            if expires <= now:
+                del self._data[slug]
+                self._expirations += 1
+                self._misses += 1
+                return None
+            self._data.move_to_end(slug)
+            self._hits += 1
+            return value
+
+    def put(self, slug: str, value: Any) -> None:
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            self._data[slug] = (expires, value)
+            self._data.move_to_end(slug)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, slug: str) -> None:
+        with self._lock:
+            self._data.pop(slug, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "hit_ratio": (self._hits / lookups) if lookups else 0.0,
+            }
+
+def get_link_cache() -> LinkCache | None:
+    if not has_app_context():
+        return None
+    return current_app.extensions.get("link_cache")
+
+def get_count_cache() -> LinkCache | None:
+    if not has_app_context():
+        return None
+    return current_app.extensions.get("count_cache")
+
+def invalidate_link(slug: str) -> None:
+    """
+    Remove o slug do cache; chamar sempre que um link for criado ou alterado.
+    """
+    cache = get_link_cache()
+    if cache is not None:
+        cache.invalidate(slug)
+
+def init_app(app):
+    count_ttl = float(app.config.get("COUNT_CACHE_TTL", 30))
+    if count_ttl > 0:
+        app.extensions["count_cache"] = LinkCache(max_size=256, ttl=count_ttl)
+
+    size = int(app.config.get("SLUG_CACHE_SIZE", 10000))
+    ttl = float(app.config.get("SLUG_CACHE_TTL", 60))
+    if size <= 0 or ttl <= 0:
+        return
+    app.extensions["link_cache"] = LinkCache(max_size=size, ttl=ttl)
@@ -0,0 +1,298 @@
+from __future__ import annotations
+import time, queue, atexit, logging, threading, os
+from collections import Counter
+from sqlite3 import Connection
+from flask import current_app
+import click
+from .db import connect, get_db, db_settings, DEFAULT_DB_PATH
+from .partitions import insert_partitioned, click_tables, get_partition_dir
+from .httpcache import bump
+from .strings import ClickEncoder, get_encoder
+from . import hll
+
+log = logging.getLogger("app")
+
+OVERFLOW_POLICIES = ("drop", "sync")
+
+def utc_ts() -> str:
+    """Timestamp no mesmo formato de CURRENT_TIMESTAMP do SQLite (UTC)."""
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+
+_ROLLUP_SQL = """
+INSERT INTO clicks_daily (link_id, day, clicks) VALUES (?,?,?)
+ON CONFLICT(link_id, day) DO UPDATE SET clicks = clicks + excluded.clicks
+"""
+
+def insert_clicks(db: Connection, rows: list[tuple], partition_dir: str | None = None,
+                  encoder: ClickEncoder | None = None) -> None:
+    """
+    Grava cliques (link_id, ts, ip, user_agent, referrer) numa única transação,
+    somando-os ao rollup clicks_daily na mesma transação. user_agent/referrer
+    podem vir como texto ou já como id de dicionário (ClickEncoder.lookup); os
+    textos são internados na mesma transação.
+
+    Com `partition_dir` os cliques vão para a partição do mês (partitions.py) e o
+    rollup é somado depois, numa transação curta no banco principal. Uma queda
+    entre as duas deixa o rollup para trás: `flask backfill-rollup` corrige.
+    As marcas d'água dos links (httpcache.py) e os sketches de visitantes únicos
+    (hll.py) andam junto com o rollup.
+    """
+    per_day = Counter((r[0], r[1][:10]) for r in rows)
+    daily = [(link_id, day, n) for (link_id, day), n in per_day.items()]
+    now = utc_ts()
+    marks = {f"link:{link_id}": now for link_id in {r[0] for r in rows}}
+    marks["clicks"] = now
+    encoder = encoder or ClickEncoder(0)
+    if partition_dir:
+        with db:
+            rows = encoder.encode(db, rows)
+        insert_partitioned(db, partition_dir, rows)
+        with db:
+            db.executemany(_ROLLUP_SQL, daily)
+            hll.update_sketches(db, rows)
+            bump(db, marks)
+        return
+    with db:
+        db.executemany(
+            "INSERT INTO clicks (link_id, ts, ip, user_agent_id, referrer_id) VALUES (?,?,?,?,?)",
+            encoder.encode(db, rows),
+        )
+        db.executemany(_ROLLUP_SQL, daily)
+        hll.update_sketches(db, rows)
+        bump(db, marks)
+
+def backfill_daily(db: Connection, since: str | None = None, until: str | None = None,
+                   links_per_tx: int = 500) -> int:
+    """
+    Recalcula clicks_daily e os sketches de clicks_hll a partir de clicks, link a
+    link (usa o índice (link_id, ts)), com `links_per_tx` links por transação para
+    não segurar o lock de escrita por muito tempo. Dias sem cliques brutos não são
+    tocados.
+    Com partições, só lê as dos meses do intervalo (um dia nunca cruza partições).
+    Retorna o número de links processados.
+    """
+    where, params = [], []
+    if since:
+        where.append("ts >= ?")
+        params.append(since + " 00:00:00")
+    if until:
+        where.append("ts < date(?, '+1 day')")
+        params.append(until)
+    range_sql = "".join(" AND " + w for w in where)
+    n = 0
+    for _, table in click_tables(db, since, until):
+        sql = f"""
+        INSERT INTO clicks_daily (link_id, day, clicks)
+        SELECT link_id, date(ts), COUNT(*)
+        FROM {table}
+        WHERE link_id = ?{range_sql}
+        GROUP BY link_id, date(ts)
+        ON CONFLICT(link_id, day) DO UPDATE SET clicks = excluded.clicks
+        """
+        last_id, done = 0, 0
+        while True:
+            ids = [r[0] for r in db.execute(
+                "SELECT id FROM links WHERE id > ? ORDER BY id LIMIT ?", (last_id, links_per_tx)
+            ).fetchall()]
+            if not ids:
+                break
+            with db:
+                for link_id in ids:
+                    db.execute(sql, (link_id, *params))
+                    hll.rebuild_link(db, table, link_id, range_sql, params)
+            last_id, done = ids[-1], done + len(ids)
+        n = max(n, done)
+    with db:
+        bump(db, {"maint": utc_ts()})
+    return n
+
+class ClickRecorder:
+    """
+    Fila limitada de cliques com flush em lote numa thread de fundo (write-behind).
+
+    O flush acontece quando o lote atinge `batch_size` ou quando `interval`
+    segundos se passam desde o primeiro clique pendente. Com a fila cheia:
+      - "drop": descarta o clique e incrementa `dropped`;
+      - "sync": grava o clique de forma síncrona na conexão do request.
+    """
+
+    def __init__(self, db_path: str, max_queue: int = 10000, batch_size: int = 500,
+                 interval: float = 1.0, overflow: str = "drop", settings: dict | None = None,
+                 partition_dir: str | None = None, encoder: ClickEncoder | None = None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"CLICK_BUFFER_OVERFLOW inválido: {overflow!r}")
+        self.db_path = db_path
+        self.settings = settings
+        self.partition_dir = partition_dir
+        self.encoder = encoder
+        self.batch_size = max(1, int(batch_size))
+        self.interval = max(0.01, float(interval))
+        self.overflow = overflow
+        self._q: queue.Queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._pid = None
+        self._counters = {"queued": 0, "flushed": 0, "dropped": 0, "sync": 0, "batches": 0, "errors": 0}
+
+    def _incr(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += n
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._counters)
+        out["pending"] = self._q.qsize()
+        out["capacity"] = self._q.maxsize
+        out["overflow"] = self.overflow
+        return out
+
+    def _ensure_started(self) -> None:
+        # Threads não sobrevivem a fork (gunicorn pre-fork): reinicia por processo
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == pid and self._thread.is_alive():
+                return
+            if self._pid != pid:
+                self._q = queue.Queue(maxsize=self._q.maxsize)
+            self._pid = pid
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="click-flusher", daemon=True)
+            self._thread.start()
+
+    def record(self, link_id: int, ip, user_agent, referrer, db: Connection | None = None) -> bool:
+        """
+        Enfileira um clique. Retorna False se o clique foi descartado.
+        """
+        self._ensure_started()
+        if self.encoder is not None:
+            # Ids do LRU quando conhecidos; textos novos são internados no flush
+            user_agent, referrer = self.encoder.lookup(user_agent, referrer)
+        row = (link_id, utc_ts(), ip, user_agent, referrer)
+        try:
+            self._q.put_nowait(row)
+        except queue.Full:
+            if self.overflow == "sync" and db is not None:
+                insert_clicks(db, [row], self.partition_dir, self.encoder)
+                self._incr("sync")
+                return True
+            self._incr("dropped")
+            return False
+        self._incr("queued")
+        return True
+
+    def _drain(self) -> list[tuple]:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, conn: Connection, batch: list[tuple]) -> None:
+        if not batch:
+            return
+        try:
+            insert_clicks(conn, batch, self.partition_dir, self.encoder)
+            self._incr("flushed", len(batch))
+            self._incr("batches")
+        except Exception:
+            log.exception("click flush failed n=%d", len(batch))
+            self._incr("errors")
+            self._incr("dropped", len(batch))
+
+    def _run(self) -> None:
+        conn = connect(self.db_path, self.settings)
+        try:
+            while not self._stop.is_set():
+                try:
+                    first = self._q.get(timeout=self.interval)
+                except queue.Empty:
+                    continue
+                batch = [first]
+                deadline = time.monotonic() + self.interval
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self._q.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+                self._write(conn, batch)
+            # Drena o que sobrou antes de sair
+            while True:
+                batch = self._drain()
+                if not batch:
+                    break
+                self._write(conn, batch)
+        finally:
+            conn.close()
+
+    def flush(self) -> None:
+        """
+        Grava imediatamente tudo que está pendente (na thread chamadora).
+        """
+        conn = connect(self.db_path, self.settings)
+        try:
+            while True:
+                batch = self._drain()
+                if not batch:
+                    break
+                self._write(conn, batch)
+        finally:
+            conn.close()
+
+    def close(self, timeout: float = 10.0) -> None:
+        """
+        Para o flusher e garante que a fila foi gravada (usado no shutdown).
+        """
+        self._stop.set()
+        t = self._thread
+        if t is not None and t.is_alive() and self._pid == os.getpid():
+            t.join(timeout)
+        if self._q.qsize():
+            self.flush()
+
+def get_recorder() -> ClickRecorder | None:
+    return current_app.extensions.get("click_recorder")
+
+def record_click(db: Connection, link_id: int, ip, user_agent, referrer) -> None:
+    """
+    Registra um clique: enfileira se o buffer estiver ativo, senão grava na hora.
+    """
+    rec = get_recorder()
+    if rec is not None:
+        rec.record(link_id, ip, user_agent, referrer, db=db)
+        return
+    encoder = get_encoder()
+    if encoder is not None:
+        user_agent, referrer = encoder.lookup(user_agent, referrer)
+    insert_clicks(db, [(link_id, utc_ts(), ip, user_agent, referrer)], get_partition_dir(), encoder)
+
+@click.command("backfill-rollup")
+@click.option("--since", default=None, help="Primeiro dia (YYYY-MM-DD).")
+@click.option("--until", default=None, help="Último dia (YYYY-MM-DD).")
+def backfill_rollup_command(since, until):
+    n = backfill_daily(get_db(), since=since, until=until)
+    click.echo(f"clicks_daily recalculado: {n} link(s)")
+
+def init_app(app):
+    app.cli.add_command(backfill_rollup_command)
+    if not app.config.get("CLICK_BUFFER"):
+        return
+    rec = ClickRecorder(
+        app.config.get("DB_PATH", DEFAULT_DB_PATH),
+        max_queue=int(app.config.get("CLICK_BUFFER_SIZE", 10000)),
+        batch_size=int(app.config.get("CLICK_FLUSH_BATCH", 500)),
+        interval=float(app.config.get("CLICK_FLUSH_INTERVAL", 1.0)),
+        overflow=str(app.config.get("CLICK_BUFFER_OVERFLOW", "drop")),
+        settings=db_settings(app.config),
+        partition_dir=(app.config.get("CLICK_PARTITION_DIR") or None) if app.config.get("CLICK_PARTITIONS") else None,
+        encoder=app.extensions.get("click_strings"),
+    )
+    app.extensions["click_recorder"] = rec
+    atexit.register(rec.close)
@@ -1,47 +1,400 @@
 import os
+import time
 import sqlite3
-from flask import current_app, g
+import logging
+import threading
+from urllib.parse import quote
+from flask import current_app, g, request
 import click
 
 DEFAULT_DB_PATH = "var/data.db"
 
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+# Instruções da VM do SQLite entre duas checagens do prazo das consultas de analytics
+PROGRESS_STEPS = 1000
+
+log = logging.getLogger("app")
+
+_timing = threading.local()
+
+def db_time_reset() -> None:
+    _timing.total = 0.0
+
+def db_time_total() -> float:
+    """
+    Segundos gastos no SQLite pela thread atual desde o último db_time_reset().
+    """
+    return getattr(_timing, "total", 0.0)
+
+def _add_db_time(dt: float) -> None:
+    _timing.total = getattr(_timing, "total", 0.0) + dt
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    Cursor que soma o tempo de execute/fetch* em db_time_total() (métricas).
+    """
+
+    def execute(self, *args):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(*args)
+        finally:
+            _add_db_time(time.perf_counter() - t0)
+
+    def executemany(self, *args):
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(*args)
+        finally:
+            _add_db_time(time.perf_counter() - t0)
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            _add_db_time(time.perf_counter() - t0)
+
+    def fetchmany(self, *args):
+        t0 = time.perf_counter()
+        try:
+            return super().fetchmany(*args)
+        finally:
+            _add_db_time(time.perf_counter() - t0)
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            _add_db_time(time.perf_counter() - t0)
+
+class TimedConnection(sqlite3.Connection):
+    """
+    Conexão cujos cursores (inclusive os de conn.execute) são TimedCursor.
+    """
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+    def commit(self):
+        t0 = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            _add_db_time(time.perf_counter() - t0)
+
+def db_settings(config) -> dict:
+    """
+    Extrai da config do app os ajustes de conexão (PRAGMAs e cache de statements).
+    """
+    sync = str(config.get("DB_SYNCHRONOUS", "NORMAL")).upper()
+    if sync not in SYNCHRONOUS_MODES:
+        raise ValueError(f"DB_SYNCHRONOUS inválido: {sync!r}")
+    return {
+        "synchronous": sync,
+        "cache_size": int(config.get("DB_CACHE_SIZE", -8000)),
+        "mmap_size": int(config.get("DB_MMAP_SIZE", 0)),
+        "busy_timeout": int(config.get("DB_BUSY_TIMEOUT", 5000)),
+        "cached_statements": int(config.get("DB_STATEMENT_CACHE", 128)),
+    }
+
+def connect(db_path: str, settings: dict | None = None, factory=sqlite3.Connection) -> sqlite3.Connection:
+    """
+    Abre uma conexão SQLite configurada (usada por request e por threads de fundo)
+    """
+    settings = settings or {}
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+
+    conn = sqlite3.connect(
+        db_path,
+        detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+        cached_statements=int(settings.get("cached_statements", 128)),
+        factory=factory,
+    )
+    conn.row_factory = sqlite3.Row
+    # Segurança/consistência
+    conn.execute("PRAGMA foreign_keys = ON;")
+    # Melhor para concorrência leitura/escrita
+    conn.execute("PRAGMA journal_mode = WAL;")
+    # Ajustes por conexão: aplicados uma vez, quando a conexão é criada
+    if "synchronous" in settings:
+        conn.execute(f"PRAGMA synchronous = {settings['synchronous']};")
+    if "cache_size" in settings:
+        conn.execute(f"PRAGMA cache_size = {int(settings['cache_size'])};")
+    if "mmap_size" in settings:
+        conn.execute(f"PRAGMA mmap_size = {int(settings['mmap_size'])};")
+    if "busy_timeout" in settings:
+        conn.execute(f"PRAGMA busy_timeout = {int(settings['busy_timeout'])};")
+    return conn
+
+def analytics_settings(config) -> dict:
+    """
+    Ajustes das conexões só-leitura de analytics (cache e timeouts próprios).
+    """
+    return {
+        "cache_size": int(config.get("ANALYTICS_DB_CACHE_SIZE", -32000)),
+        "mmap_size": int(config.get("ANALYTICS_DB_MMAP_SIZE", 0)),
+        "busy_timeout": int(config.get("ANALYTICS_DB_BUSY_TIMEOUT", 1000)),
+        "cached_statements": int(config.get("DB_STATEMENT_CACHE", 128)),
+    }
+
+def connect_readonly(db_path: str, settings: dict | None = None, factory=sqlite3.Connection) -> sqlite3.Connection:
+    """
+    Abre o banco em mode=ro + query_only: nenhuma escrita, nem por engano (o banco
+    já precisa existir e estar em WAL, como o init-db deixa).
+    """
+    settings = settings or {}
+    conn = sqlite3.connect(
+        f"file:{quote(os.path.abspath(db_path))}?mode=ro",
+        uri=True,
+        detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+        cached_statements=int(settings.get("cached_statements", 128)),
+        factory=factory,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA query_only = ON;")
+    if "cache_size" in settings:
+        conn.execute(f"PRAGMA cache_size = {int(settings['cache_size'])};")
+    if "mmap_size" in settings:
+        conn.execute(f"PRAGMA mmap_size = {int(settings['mmap_size'])};")
+    if "busy_timeout" in settings:
+        conn.execute(f"PRAGMA busy_timeout = {int(settings['busy_timeout'])};")
+    return conn
+
+def set_query_deadline(conn: sqlite3.Connection, seconds: float | None) -> None:
+    """
+    Cancela (sqlite3.OperationalError "interrupted") qualquer consulta da conexão
+    que passar de `seconds` a partir de agora; None ou 0 tira o limite.
+    """
+    if not seconds or seconds <= 0:
+        conn.set_progress_handler(None, 0)
+        return
+    deadline = time.monotonic() + seconds
+    conn.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_STEPS)
+
+def is_interrupted(e: BaseException) -> bool:
+    return isinstance(e, sqlite3.OperationalError) and str(e) == "interrupted"
+
+class ConnectionPool:
+    """
+    Uma conexão por thread (e por processo), reaproveitada entre requests.
+
+    Conexões SQLite não podem trocar de thread, então o "pool" é um thread-local:
+    cada thread de worker abre sua conexão uma vez (PRAGMAs incluídos) e a reusa.
+    A conexão é reciclada após `max_age` segundos e checada com `SELECT 1`
+    quando ficou ociosa por mais de `health_interval` segundos.
+    """
+
+    def __init__(self, db_path: str, settings: dict | None = None,
+                 max_age: float = 3600.0, health_interval: float = 30.0,
+                 factory=sqlite3.Connection, readonly: bool = False):
+        self.db_path = db_path
+        self.settings = settings or {}
+        self.factory = factory
+        self.readonly = readonly
+        self.max_age = float(max_age)
+        self.health_interval = float(health_interval)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._open = 0
+        self._counters = {"created": 0, "reused": 0, "recycled": 0, "health_failures": 0, "rollbacks": 0}
+
+    def _incr(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _discard(self, conn: sqlite3.Connection) -> None:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._open -= 1
+
+    def acquire(self) -> sqlite3.Connection:
+        now = time.monotonic()
+        entry = getattr(self._local, "entry", None)
+        if entry is not None:
+            conn, created, last_used, pid = entry
+            self._local.entry = None
+            if pid != os.getpid():
+                # Conexão herdada via fork: não pode ser usada (nem fechada) aqui
+                entry = None
+            elif now - created > self.max_age:
+                self._discard(conn)
+                self._incr("recycled")
+                entry = None
+            elif now - last_used > self.health_interval:
+                try:
+                    conn.execute("SELECT 1").fetchone()
+                except sqlite3.Error:
+                    self._discard(conn)
+                    self._incr("health_failures")
+                    entry = None
+        if entry is None:
+            conn = (connect_readonly if self.readonly else connect)(self.db_path, self.settings, self.factory)
+            created = now
+            with self._lock:
+                self._open += 1
+            self._incr("created")
+        else:
+            self._incr("reused")
+        self._local.in_use = (conn, created)
+        return conn
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        in_use = getattr(self._local, "in_use", None)
+        self._local.in_use = None
+        if in_use is None or in_use[0] is not conn:
+            self._discard(conn)
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+                self._incr("rollbacks")
+        except sqlite3.Error:
+            self._discard(conn)
+            self._incr("health_failures")
+            return
+        self._local.entry = (conn, in_use[1], time.monotonic(), os.getpid())
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._counters)
+            out["open"] = self._open
+        out["max_age"] = self.max_age
+        out["health_interval"] = self.health_interval
+        out["settings"] = dict(self.settings)
+        out["readonly"] = self.readonly
+        return out
+
+def _connection_factory(app):
+    # Com métricas ativas, mede o tempo gasto no SQLite por request
+    return TimedConnection if app.config.get("METRICS_ENABLED") else sqlite3.Connection
+
+def get_pool() -> ConnectionPool | None:
+    return current_app.extensions.get("db_pool")
+
 def get_db() -> sqlite3.Connection:
     """
-    Retorna uma conexão SQLite por request
+    Retorna uma conexão SQLite por request (do pool da thread, se ativo)
     """
     if "db" not in g:
-        db_path = current_app.config.get("DB_PATH", DEFAULT_DB_PATH)
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
-
-        conn = sqlite3.connect(
-            db_path,
-            detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
-        )
-        conn.row_factory = sqlite3.Row
-        # Segurança/consistência
-        conn.execute("PRAGMA foreign_keys = ON;")
-        # Melhor para concorrência leitura/escrita
-        conn.execute("PRAGMA journal_mode = WAL;")
-        g.db = conn
+        pool = get_pool()
+        if pool is not None:
+            g.db = pool.acquire()
+        else:
+            g.db = connect(
+                current_app.config.get("DB_PATH", DEFAULT_DB_PATH),
+                db_settings(current_app.config),
+                _connection_factory(current_app),
+            )
     return g.db
 
 def close_db(e=None):
     conn = g.pop("db", None)
     if conn is not None:
-        conn.close()
+        pool = get_pool()
+        if pool is not None:
+            pool.release(conn)
+        else:
+            conn.close()
+
+def get_analytics_pool() -> ConnectionPool | None:
+    return current_app.extensions.get("analytics_pool")
+
+def get_analytics_db(time_limit: bool = True) -> sqlite3.Connection:
+    """
+    Conexão só-leitura para dashboards e relatórios (analytics.py, admin, leituras
+    da API), separada da conexão que grava cliques. Com `time_limit`, consultas que
+    passarem de ANALYTICS_QUERY_TIMEOUT segundos (contados a partir desta chamada)
+    são canceladas; exports em streaming pedem sem limite. Sem ANALYTICS_READONLY,
+    devolve get_db().
+    """
+    if not current_app.config.get("ANALYTICS_READONLY", True):
+        return get_db()
+    if "analytics_db" not in g:
+        pool = get_analytics_pool()
+        if pool is not None:
+            g.analytics_db = pool.acquire()
+        else:
+            g.analytics_db = connect_readonly(
+                current_app.config.get("DB_PATH", DEFAULT_DB_PATH),
+                analytics_settings(current_app.config),
+                _connection_factory(current_app),
+            )
+    timeout = float(current_app.config.get("ANALYTICS_QUERY_TIMEOUT", 5.0)) if time_limit else None
+    set_query_deadline(g.analytics_db, timeout)
+    return g.analytics_db
+
+def close_analytics_db(e=None):
+    conn = g.pop("analytics_db", None)
+    if conn is not None:
+        set_query_deadline(conn, None)
+        pool = get_analytics_pool()
+        if pool is not None:
+            pool.release(conn)
+        else:
+            conn.close()
+
+def _query_timeout_response(e):
+    if not is_interrupted(e):
+        raise e
+    log.warning("analytics query cancelled endpoint=%s timeout=%ss", request.endpoint,
+                current_app.config.get("ANALYTICS_QUERY_TIMEOUT", 5.0))
+    return query_timeout_response(request.blueprint == "api")
+
+def query_timeout_response(as_json: bool):
+    """
+    503 para uma consulta de analytics cancelada pelo prazo (JSON na API).
+    """
+    if as_json:
+        resp = current_app.json.response({"error": "query timeout"})
+        resp.status_code = 503
+    else:
+        resp = current_app.response_class("Consulta cancelada: excedeu o tempo limite.\n", status=503,
+                                          mimetype="text/plain")
+    resp.headers["Retry-After"] = "30"
+    return resp
 
-def init_db():
-    db = get_db()
-    with current_app.open_resource("models.sql", mode="r") as f:
-        sql = f.read()
-    db.executescript(sql)
-    db.commit()
+def init_db(progress=None):
+    """
+    Cria/atualiza o schema: models.sql + migrações pendentes (ver migrate.py)
+    """
+    from .migrate import run_migrations
+    run_migrations(get_db(), progress=progress or (lambda msg: None))
 
 @click.command("init-db")
 def init_db_command():
-    init_db()
+    init_db(progress=click.echo)
     click.echo("Banco inicializando em {}".format(current_app.config.get("DB_PATH", DEFAULT_DB_PATH)))
 
 def init_app(app):
+    if app.config.get("DB_POOL", True):
+        app.extensions["db_pool"] = ConnectionPool(
+            app.config.get("DB_PATH", DEFAULT_DB_PATH),
+            db_settings(app.config),
+            max_age=float(app.config.get("DB_POOL_MAX_AGE", 3600)),
+            health_interval=float(app.config.get("DB_POOL_HEALTH_INTERVAL", 30)),
+            factory=_connection_factory(app),
+        )
+        if app.config.get("ANALYTICS_READONLY", True):
+            app.extensions["analytics_pool"] = ConnectionPool(
+                app.config.get("DB_PATH", DEFAULT_DB_PATH),
+                analytics_settings(app.config),
+                max_age=float(app.config.get("DB_POOL_MAX_AGE", 3600)),
+                health_interval=float(app.config.get("DB_POOL_HEALTH_INTERVAL", 30)),
+                factory=_connection_factory(app),
+                readonly=True,
+            )
     app.teardown_appcontext(close_db)
-    app.cli.add_command(init_db_command)
\ No newline at end of file
+    app.teardown_appcontext(close_analytics_db)
+    app.register_error_handler(sqlite3.OperationalError, _query_timeout_response)
+    app.cli.add_command(init_db_command)
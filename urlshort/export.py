@@ -0,0 +1,232 @@
+from __future__ import annotations
+import io, csv, sys, json, zlib
+from datetime import datetime
+from sqlite3 import Connection
+from flask import Response, request, stream_with_context
+import click
+from . import analytics as an
+from .partitions import click_tables, table_for_id
+from . import strings
+
+FORMATS = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+CLICK_COLUMNS = ("id", "ts", "link_id", "slug", "ip", "user_agent", "referrer")
+LINK_COLUMNS = ("id", "slug", "target_url", "is_permanent", "created_at", "clicks")
+# Linhas acumuladas antes de cada yield (menos chamadas ao servidor WSGI)
+FLUSH_BYTES = 64 * 1024
+
+class ExportError(ValueError):
+    pass
+
+def parse_day(value: str | None) -> str | None:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date().isoformat()
+    except ValueError:
+        raise ExportError(f"invalid date: {value}")
+
+def iter_clicks(db: Connection, start: str | None = None, end: str | None = None,
+                link_id: int | None = None, after: int | None = None, chunk: int = 5000):
+    """
+    Cliques do intervalo em blocos de `chunk` linhas, por chave: cada bloco é uma
+    consulta curta (sem transação longa segurando o WAL). Retomável por `after`
+    (id do último clique recebido).
+
+    Com link_id a ordem é (ts, id), pelo índice (link_id, ts); sem link, é por id.
+    Com partições, percorre só os meses do intervalo, em ordem.
+    """
+    where, params = [], []
+    if start:
+        where.append("c.ts >= ?")
+        params.append(start + " 00:00:00")
+    if end:
+        where.append("c.ts < date(?, '+1 day')")
+        params.append(end)
+    resume = None
+    if after is not None:
+        found = table_for_id(db, after)
+        row = db.execute(f"SELECT ts FROM {found[1]} WHERE id = ?", (after,)).fetchone() if found else None
+        if row is None:
+            raise ExportError("unknown cursor")
+        resume = (found[0], (row[0], after))
+
+    if link_id is not None:
+        where.insert(0, "c.link_id = ?")
+        params.insert(0, link_id)
+        keyset, order = "(c.ts, c.id) > (?, ?)", "c.ts, c.id"
+    else:
+        keyset, order = "c.id > ?", "c.id"
+
+    base = " AND ".join(where)
+    for month, table in click_tables(db, start, end):
+        key = None
+        if resume is not None:
+            if month is not None and month < resume[0]:
+                continue
+            if month == resume[0]:
+                key = resume[1]
+        while True:
+            conds = [base] if base else []
+            key_params = []
+            if key is not None:
+                conds.append(keyset)
+                key_params = list(key) if link_id is not None else [key[1]]
+            sql = f"""
+            SELECT c.id, c.ts, c.link_id, l.slug, c.ip, {strings.SELECT_COLUMNS}
+            FROM {table} c JOIN links l ON l.id = c.link_id {strings.join_sql("c")}
+            {"WHERE " + " AND ".join(conds) if conds else ""}
+            ORDER BY {order}
+            LIMIT ?
+            """
+            rows = db.execute(sql, (*params, *key_params, chunk)).fetchall()
+            yield from rows
+            if len(rows) < chunk:
+                break
+            key = (rows[-1]["ts"], rows[-1]["id"])
+
+def iter_link_totals(db: Connection, start: str | None = None, end: str | None = None,
+                     q: str | None = None, after: int | None = None, chunk: int = 1000):
+    """
+    Links com total de cliques no intervalo, em blocos via totals_by_link (ordem
+    created_at DESC, id DESC). Retomável por `after` (id do último link recebido).
+    Sem o cache de resultados (memo.py): cada bloco é lido uma vez só e tiraria do
+    LRU as entradas quentes dos dashboards.
+    """
+    key = None
+    if after is not None:
+        row = db.execute("SELECT created_at FROM links WHERE id = ?", (after,)).fetchone()
+        if row is None:
+            raise ExportError("unknown cursor")
+        key = (row[0], after)
+    while True:
+        rows = an.totals_by_link.uncached(db, start=start, end=end, q=q, limit=chunk, after=key)
+        yield from rows
+        if len(rows) < chunk:
+            return
+        key = (rows[-1]["created_at"], rows[-1]["id"])
+
+def _lines(rows, columns: tuple, fmt: str):
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator="\n")
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow([row[c] for c in columns])
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        return
+    for row in rows:
+        yield json.dumps({c: row[c] for c in columns}, ensure_ascii=False) + "\n"
+
+def encode(lines, gzip: bool = False):
+    """
+    Agrupa as linhas em blocos de ~FLUSH_BYTES e, se pedido, comprime em gzip
+    incremental. Gera bytes.
+    """
+    z = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+    parts, size = [], 0
+    for line in lines:
+        parts.append(line)
+        size += len(line)
+        if size >= FLUSH_BYTES:
+            data = "".join(parts).encode("utf-8")
+            parts, size = [], 0
+            data = z.compress(data) if z else data
+            if data:
+                yield data
+    data = "".join(parts).encode("utf-8")
+    if z:
+        data = z.compress(data) + z.flush()
+    if data:
+        yield data
+
+def _wants_gzip() -> bool:
+    if request.args.get("gzip") in ("1", "true"):
+        return True
+    return "gzip" in request.headers.get("Accept-Encoding", "") and request.args.get("gzip") != "0"
+
+def export_response(kind: str, db: Connection, fmt: str, filename: str, **kwargs) -> Response:
+    """
+    Resposta em streaming (CSV/NDJSON, gzip opcional) para kind = "clicks" | "links".
+    Erros de validação (cursor) são levantados antes do primeiro byte.
+    """
+    if fmt not in FORMATS:
+        raise ExportError("format must be csv or ndjson")
+    if kind == "clicks":
+        rows, columns = iter_clicks(db, **kwargs), CLICK_COLUMNS
+    else:
+        rows, columns = iter_link_totals(db, **kwargs), LINK_COLUMNS
+    first = next(rows, None)
+
+    def _all():
+        if first is not None:
+            yield first
+            yield from rows
+
+    gzip = _wants_gzip()
+    headers = {
+        "Content-Disposition": f'attachment; filename="{filename}.{fmt}"',
+        "Cache-Control": "no-store",
+        "X-Accel-Buffering": "no",
+    }
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    body = encode(_lines(_all(), columns, fmt), gzip)
+    return Response(stream_with_context(body), content_type=FORMATS[fmt], headers=headers)
+
+def _link_id(db: Connection, slug: str | None):
+    if not slug:
+        return None
+    link = an.get_link_by_slug(db, slug)
+    if link is None:
+        raise click.ClickException(f"slug não encontrado: {slug}")
+    return link["id"]
+
+def _write(out: str, chunks) -> None:
+    if out == "-":
+        for data in chunks:
+            sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+        return
+    with open(out, "wb") as f:
+        for data in chunks:
+            f.write(data)
+
+@click.command("export-clicks")
+@click.option("--start", default=None, help="Primeiro dia (YYYY-MM-DD).")
+@click.option("--end", default=None, help="Último dia (YYYY-MM-DD).")
+@click.option("--slug", default=None, help="Só os cliques deste link.")
+@click.option("--format", "fmt", type=click.Choice(sorted(FORMATS)), default="csv")
+@click.option("--after", type=int, default=None, help="Retoma depois deste id de clique.")
+@click.option("--gzip", is_flag=True)
+@click.option("--out", default="-", help="Arquivo de saída (padrão: stdout).")
+def export_clicks_command(start, end, slug, fmt, after, gzip, out):
+    from .db import get_db
+    db = get_db()
+    try:
+        rows = iter_clicks(db, start=parse_day(start), end=parse_day(end), link_id=_link_id(db, slug), after=after)
+        _write(out, encode(_lines(rows, CLICK_COLUMNS, fmt), gzip))
+    except ExportError as e:
+        raise click.ClickException(str(e))
+
+@click.command("export-links")
+@click.option("--start", default=None, help="Primeiro dia (YYYY-MM-DD).")
+@click.option("--end", default=None, help="Último dia (YYYY-MM-DD).")
+@click.option("--q", default=None, help="Busca em slug/destino.")
+@click.option("--format", "fmt", type=click.Choice(sorted(FORMATS)), default="csv")
+@click.option("--after", type=int, default=None, help="Retoma depois deste id de link.")
+@click.option("--gzip", is_flag=True)
+@click.option("--out", default="-", help="Arquivo de saída (padrão: stdout).")
+def export_links_command(start, end, q, fmt, after, gzip, out):
+    from .db import get_db
+    try:
+        rows = iter_link_totals(get_db(), start=parse_day(start), end=parse_day(end), q=q, after=after)
+        _write(out, encode(_lines(rows, LINK_COLUMNS, fmt), gzip))
+    except ExportError as e:
+        raise click.ClickException(str(e))
+
+def init_app(app):
+    app.cli.add_command(export_clicks_command)
+    app.cli.add_command(export_links_command)
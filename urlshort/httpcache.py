@@ -0,0 +1,91 @@
+from __future__ import annotations
+import json, hashlib
+from datetime import datetime, timezone
+from sqlite3 import Connection
+from flask import current_app, request
+from werkzeug.http import parse_etags, parse_date
+
+# Validadores HTTP (ETag/Last-Modified) a partir de marcas d'água baratas na
+# tabela watermarks (models.sql): uma versão e um horário por chave, somados na
+# mesma transação que muda os dados. Chaves:
+#   "link:<id>" - cliques do link (insert_clicks)
+#   "clicks"    - qualquer clique
+#   "links"     - links criados (trigger em links)
+#   "maint"     - manutenção que muda leituras (backfill, partições apagadas)
+BUMP_SQL = """
+INSERT INTO watermarks (key, version, updated_at) VALUES (?, 1, ?)
+ON CONFLICT(key) DO UPDATE SET version = version + 1, updated_at = max(updated_at, excluded.updated_at)
+"""
+# Respostas autenticadas: o proxy pode guardar, mas revalida sempre (a app
+# confere o token e responde 304 sem refazer as consultas)
+API_CACHE_CONTROL = "public, no-cache"
+TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def bump(db: Connection, marks: dict[str, str]) -> None:
+    """
+    Avança as marcas {chave: horário UTC}; roda na transação do chamador.
+    """
+    db.executemany(BUMP_SQL, list(marks.items()))
+
+def read_marks(db: Connection, keys: list[str]) -> dict[str, tuple[int, str]]:
+    """
+    {chave: (versão, horário)} das marcas existentes; uma consulta por chave primária.
+    """
+    rows = db.execute(
+        f"SELECT key, version, updated_at FROM watermarks WHERE key IN ({','.join('?' * len(keys))})",
+        keys,
+    ).fetchall()
+    return {r[0]: (r[1], r[2]) for r in rows}
+
+def validators(db: Connection, keys: list[str], *parts) -> tuple[str, datetime]:
+    """
+    (etag, last_modified) para uma resposta que depende das marcas `keys` e dos
+    parâmetros `parts`. Uma consulta por chave primária; nenhuma agregação.
+    O dia UTC entra no ETag: intervalos padrão ("últimos 30 dias") andam à meia-noite.
+    """
+    marks = read_marks(db, keys)
+    now = datetime.now(timezone.utc)
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    raw = json.dumps([parts, [marks.get(k) for k in keys], midnight.date().isoformat()], default=str)
+    etag = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+    last = midnight
+    for _, updated_at in marks.values():
+        t = datetime.strptime(updated_at, TS_FORMAT).replace(tzinfo=timezone.utc)
+        last = max(last, t)
+    return etag, min(last, now.replace(microsecond=0))
+
+def is_not_modified(etag: str, last_modified: datetime,
+                    if_none_match: str | None, if_modified_since: str | None) -> bool:
+    """
+    If-None-Match tem precedência; If-Modified-Since só vale sem ele (RFC 9110).
+    """
+    if if_none_match:
+        return parse_etags(if_none_match).contains_weak(etag)
+    since = parse_date(if_modified_since) if if_modified_since else None
+    return since is not None and last_modified <= since
+
+def admin_cache_control() -> str:
+    max_age = int(current_app.config.get("ADMIN_CACHE_MAX_AGE", 0))
+    return f"public, max-age=0, s-maxage={max_age}" if max_age > 0 else "public, no-cache"
+
+def finish(resp, etag: str, last_modified: datetime, cache_control: str, vary: str | None = None):
+    resp.set_etag(etag, weak=True)
+    resp.last_modified = last_modified
+    resp.headers["Cache-Control"] = cache_control
+    if vary:
+        resp.vary.add(vary)
+    return resp
+
+def not_modified_response(etag: str, last_modified: datetime, cache_control: str, vary: str | None = None):
+    return finish(current_app.response_class(status=304), etag, last_modified, cache_control, vary)
+
+def conditional(db: Connection, keys: list[str], parts: tuple, cache_control: str, vary: str | None = None):
+    """
+    Para views Flask: retorna (resposta 304 ou None, aplicar) onde aplicar(resp)
+    põe os validadores na resposta completa.
+    """
+    etag, last = validators(db, keys, *parts)
+    apply = lambda resp: finish(resp, etag, last, cache_control, vary)
+    if is_not_modified(etag, last, request.headers.get("If-None-Match"), request.headers.get("If-Modified-Since")):
+        return not_modified_response(etag, last, cache_control, vary), apply
+    return None, apply
@@ -0,0 +1,45 @@
+from __future__ import annotations
+import sqlite3, logging
+from sqlite3 import Connection
+from .cache import invalidate_link
+from .slugs import RESERVED_SLUGS, get_allocator
+from .slugfilter import link_created
+
+log = logging.getLogger("app")
+
+def insert_link(
+    db: Connection,
+    target_url: str,
+    is_permanent: int,
+    slug: str | None = None,
+    created_ip: str | None = None,
+    commit: bool = True,
+) -> str | None:
+    """
+    Insere um link com o slug pedido ou com um slug do alocador (SLUG_STRATEGY).
+    Retorna o slug, ou None se o slug pedido já existe / não foi possível alocar.
+    Com commit=False o chamador controla a transação (lotes).
+    """
+    candidates = [slug] if slug else (c for c in get_allocator().candidates(db) if c not in RESERVED_SLUGS)
+    created = None
+    try:
+        for cand in candidates:
+            try:
+                db.execute(
+                    "INSERT INTO links (slug, target_url, is_permanent, created_ip) VALUES (?,?,?,?)",
+                    (cand, target_url, is_permanent, created_ip),
+                )
+            except sqlite3.IntegrityError:
+                continue
+            created = cand
+            break
+    except RuntimeError as e:
+        log.error("slug allocation failed: %s", e)
+        return None
+    if created is None:
+        return None
+    link_created(created)
+    if commit:
+        db.commit()
+    invalidate_link(created)
+    return created
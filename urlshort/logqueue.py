@@ -0,0 +1,252 @@
+from __future__ import annotations
+import os, json, time, queue, random, atexit, logging, threading
+import logging.handlers
+from flask import g, has_request_context
+
+LOGGERS = ("app", "access")
+ACCESS_FORMATS = ("text", "json")
+# emit() de stream/arquivo que o pipeline sabe reproduzir sem o flush por registro;
+# handlers com emit próprio recebem handle() normal
+_STREAM_EMITS = (logging.StreamHandler.emit, logging.FileHandler.emit,
+                 logging.handlers.BaseRotatingHandler.emit)
+
+class JsonAccessFormatter(logging.Formatter):
+    """
+    Envolve o formatter original do handler: registros de acesso (com o atributo
+    `http`) viram uma linha JSON; os demais seguem o formato de sempre.
+    """
+
+    def __init__(self, inner: logging.Formatter | None):
+        super().__init__()
+        self.inner = inner or logging.Formatter()
+
+    def format(self, record: logging.LogRecord) -> str:
+        http = getattr(record, "http", None)
+        if http is None:
+            return self.inner.format(record)
+        doc = {"ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+               + ".%03dZ" % record.msecs, "logger": record.name}
+        doc.update(http)
+        return json.dumps(doc, ensure_ascii=False, separators=(",", ":"))
+
+class _QueueHandler(logging.Handler):
+    """
+    Só enfileira o LogRecord: formatação e I/O ficam com a thread do LogPipeline.
+    Os argumentos dos nossos logs são imutáveis, então não precisam ser
+    resolvidos aqui (ao contrário de logging.handlers.QueueHandler).
+    """
+
+    def __init__(self, pipeline: "LogPipeline"):
+        super().__init__()
+        self.pipeline = pipeline
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.exc_info:
+            # Tracebacks são formatados agora (os frames mudam depois)
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.pipeline.put(record)
+
+class LogPipeline:
+    """
+    Fila limitada + thread que grava os logs de `app` e `access` em lotes.
+
+    Os handlers configurados (console, arquivo rotativo) saem dos loggers e passam a
+    ser chamados só pela thread de escrita; o flush do stream é feito uma vez por
+    lote. Fila cheia descarta o registro (contado em stats()). Drena tudo no exit.
+    """
+
+    def __init__(self, handlers: dict[str, list[logging.Handler]], max_queue: int = 10000,
+                 batch_size: int = 256):
+        self.handlers = handlers
+        self.batch_size = max(1, int(batch_size))
+        self._q: queue.Queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._pid = os.getpid()
+        self._counters = {"queued": 0, "written": 0, "dropped": 0, "batches": 0, "errors": 0}
+
+    def _incr(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += n
+
+    def _ensure_started(self) -> None:
+        # Mesma regra do ClickRecorder: threads não sobrevivem a fork
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == pid and self._thread.is_alive():
+                return
+            if self._pid != pid:
+                self._q = queue.Queue(maxsize=self._q.maxsize)
+            self._pid = pid
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread.start()
+
+    def put(self, record: logging.LogRecord) -> None:
+        self._ensure_started()
+        try:
+            self._q.put_nowait(record)
+        except queue.Full:
+            self._incr("dropped")
+            return
+        self._incr("queued")
+
+    def _drain(self, batch: list) -> list:
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _emit_all(self, h: logging.Handler, records: list) -> None:
+        # Como StreamHandler.emit (rotação incluída), mas com um flush só no fim. Tudo
+        # sob o lock do handler, que é compartilhado com o root e outros loggers: nada
+        # nele é alterado, e os emits das outras threads seguem com seu próprio flush.
+        if type(h).emit not in _STREAM_EMITS:
+            for record in records:
+                try:
+                    h.handle(record)
+                except Exception:
+                    self._incr("errors")
+            return
+        rotating = isinstance(h, logging.handlers.BaseRotatingHandler)
+        h.acquire()
+        try:
+            for record in records:
+                if not h.filter(record):
+                    continue
+                try:
+                    if rotating and h.shouldRollover(record):
+                        h.doRollover()
+                    if h.stream is None:
+                        # FileHandler com delay=True: o emit dele abre o arquivo
+                        h.handle(record)
+                        continue
+                    h.stream.write(h.format(record) + h.terminator)
+                except Exception:
+                    self._incr("errors")
+            try:
+                h.flush()
+            except Exception:
+                self._incr("errors")
+        finally:
+            h.release()
+
+    def _write(self, batch: list) -> None:
+        if not batch:
+            return
+        # Agrupado por handler, na ordem de chegada
+        per_handler: dict[logging.Handler, list] = {}
+        for record in batch:
+            for h in self.handlers.get(record.name, ()):
+                if record.levelno >= h.level:
+                    per_handler.setdefault(h, []).append(record)
+        for h, records in per_handler.items():
+            self._emit_all(h, records)
+        self._incr("written", len(batch))
+        self._incr("batches")
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                first = self._q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self._write(self._drain([first]))
+        while True:
+            batch = self._drain([])
+            if not batch:
+                break
+            self._write(batch)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """
+        Para a thread depois de gravar tudo que está na fila.
+        """
+        if self._pid != os.getpid():
+            return
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                return
+            self._thread = None
+        self._write(self._drain([]))
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._counters)
+        out["pending"] = self._q.qsize()
+        out["capacity"] = self._q.maxsize
+        return out
+
+_pipeline: LogPipeline | None = None
+
+def get_pipeline() -> LogPipeline | None:
+    return _pipeline
+
+def _effective_handlers(logger: logging.Logger) -> list[logging.Handler]:
+    # Sem seção "logging" no config.json os loggers só propagam para o root
+    if _pipeline is not None and any(isinstance(h, _QueueHandler) for h in logger.handlers):
+        # Pipeline ainda instalado (create_app chamado de novo sem dictConfig)
+        return list(_pipeline.handlers.get(logger.name, []))
+    own = list(logger.handlers)
+    if own or not logger.propagate:
+        return own
+    return list(logging.getLogger().handlers)
+
+def install(max_queue: int, batch_size: int) -> LogPipeline:
+    """
+    Troca os handlers de `app`/`access` por um _QueueHandler. Os loggers são
+    globais: um novo create_app (que refaz o dictConfig) encerra o pipeline anterior.
+    """
+    global _pipeline
+    handlers = {name: _effective_handlers(logging.getLogger(name)) for name in LOGGERS}
+    if _pipeline is not None:
+        _pipeline.close()
+    pipeline = LogPipeline(handlers, max_queue, batch_size)
+    qh = _QueueHandler(pipeline)
+    for name in LOGGERS:
+        logger = logging.getLogger(name)
+        logger.handlers = [qh]
+        logger.propagate = False
+    _pipeline = pipeline
+    return pipeline
+
+def _shutdown():
+    if _pipeline is not None:
+        _pipeline.close()
+
+atexit.register(_shutdown)
+
+def redirect_sampled(rate: float) -> bool:
+    """
+    Decide (uma vez por request) se os logs de um redirect são gravados,
+    para que a linha do `follow` e a de acesso sejam amostradas juntas.
+    """
+    if rate >= 1.0:
+        return True
+    if not has_request_context():
+        return random.random() < rate
+    if "log_sampled" not in g:
+        g.log_sampled = random.random() < rate
+    return g.log_sampled
+
+def init_app(app):
+    fmt = str(app.config.get("LOG_ACCESS_FORMAT", "text")).lower()
+    if fmt not in ACCESS_FORMATS:
+        raise ValueError(f"LOG_ACCESS_FORMAT inválido: {fmt!r}")
+    if fmt == "json":
+        for h in _effective_handlers(logging.getLogger("access")):
+            if not isinstance(h.formatter, JsonAccessFormatter):
+                h.setFormatter(JsonAccessFormatter(h.formatter))
+    if app.config.get("LOG_QUEUE"):
+        app.extensions["log_pipeline"] = install(
+            int(app.config.get("LOG_QUEUE_SIZE", 10000)),
+            int(app.config.get("LOG_QUEUE_BATCH", 256)),
+        )
@@ -0,0 +1,170 @@
+from __future__ import annotations
+import sys, time, inspect, sqlite3, threading, functools
+from collections import OrderedDict
+from typing import Any, Callable
+from flask import current_app, has_app_context
+from .httpcache import read_marks
+
+# Cache de resultados de analytics.py: chave = função + argumentos (fora o db);
+# cada entrada guarda o "carimbo" das marcas d'água (httpcache.py) de que o
+# resultado depende. Vale enquanto as versões não mudarem; nenhum TTL. Misses
+# iguais e simultâneos esperam uma única consulta.
+FIELDS = ("hits", "misses", "coalesced", "stale")
+
+def _sizeof(value) -> int:
+    """
+    Bytes aproximados do resultado (listas de sqlite3.Row, tuplas, números, textos).
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple, sqlite3.Row)):
+        size += sum(_sizeof(v) for v in value)
+    elif isinstance(value, dict):
+        size += sum(_sizeof(k) + _sizeof(v) for k, v in value.items())
+    return size
+
+class _Flight:
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error: BaseException | None = None
+
+class ResultCache:
+    """
+    LRU limitado por número de entradas e por bytes. Os valores são compartilhados
+    entre threads: quem lê não pode alterá-los.
+    """
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 32 * 1024 * 1024):
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(1, int(max_bytes))
+        self._data: OrderedDict[tuple, tuple[tuple, Any, int]] = OrderedDict()
+        self._inflight: dict[tuple, _Flight] = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._evictions = 0
+        self._per_fn: dict[str, dict[str, int]] = {}
+
+    def _count(self, fn: str, field: str) -> None:
+        c = self._per_fn.get(fn)
+        if c is None:
+            c = self._per_fn[fn] = dict.fromkeys(FIELDS, 0)
+        c[field] += 1
+
+    def _drop(self, key: tuple) -> None:
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def _store(self, key: tuple, stamp: tuple, value) -> None:
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (stamp, value, size)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._data)))
+                self._evictions += 1
+
+    def get_or_compute(self, fn: str, key: tuple, stamp: tuple, compute: Callable[[], Any]):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[0] == stamp:
+                    self._data.move_to_end(key)
+                    self._count(fn, "hits")
+                    return entry[1]
+                self._drop(key)
+                self._count(fn, "stale")
+            flight = self._inflight.get((key, stamp))
+            leader = flight is None
+            if leader:
+                flight = self._inflight[(key, stamp)] = _Flight()
+                self._count(fn, "misses")
+            else:
+                self._count(fn, "coalesced")
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = compute()
+        except BaseException as e:
+            flight.error = e
+            raise
+        else:
+            self._store(key, stamp, flight.value)
+        finally:
+            with self._lock:
+                self._inflight.pop((key, stamp), None)
+            flight.event.set()
+        return flight.value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            per_fn = {fn: dict(c) for fn, c in self._per_fn.items()}
+            out = {"entries": len(self._data), "bytes": self._bytes, "evictions": self._evictions,
+                   "max_entries": self.max_entries, "max_bytes": self.max_bytes}
+        for c in per_fn.values():
+            lookups = c["hits"] + c["misses"] + c["coalesced"]
+            c["hit_ratio"] = round(c["hits"] / lookups, 4) if lookups else None
+        totals = {f: sum(c[f] for c in per_fn.values()) for f in FIELDS}
+        lookups = totals["hits"] + totals["misses"] + totals["coalesced"]
+        out.update(totals)
+        out["hit_ratio"] = round(totals["hits"] / lookups, 4) if lookups else None
+        out["functions"] = per_fn
+        return out
+
+def get_result_cache() -> ResultCache | None:
+    if not has_app_context():
+        return None
+    return current_app.extensions.get("analytics_cache")
+
+def memoize(marks: Callable[[dict], list[str]]):
+    """
+    Decorador para funções fn(db, ...) de analytics.py. `marks(args)` recebe os
+    argumentos nomeados (com defaults) e devolve as marcas d'água do resultado.
+    `fn.uncached` chama a função sem cache.
+    """
+    def decorator(fn):
+        sig = inspect.signature(fn)
+        db_param = next(iter(sig.parameters))
+        name = fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(db, *args, **kwargs):
+            cache = get_result_cache()
+            if cache is None:
+                return fn(db, *args, **kwargs)
+            bound = sig.bind(db, *args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+            del arguments[db_param]
+            keys = marks(arguments)
+            # Marcas lidas antes da consulta: um clique durante ela só faz a entrada
+            # ser recalculada na próxima leitura (nunca um resultado velho fica válido)
+            current = read_marks(db, keys)
+            stamp = (tuple(current.get(k, (0,))[0] for k in keys), time.strftime("%Y-%m-%d", time.gmtime()))
+            key = (name, tuple(arguments.items()))
+            return cache.get_or_compute(name, key, stamp, lambda: fn(db, *args, **kwargs))
+
+        wrapper.uncached = fn
+        return wrapper
+    return decorator
+
+def init_app(app):
+    size = int(app.config.get("ANALYTICS_CACHE_SIZE", 1000))
+    if size <= 0:
+        return
+    app.extensions["analytics_cache"] = ResultCache(
+        max_entries=size, max_bytes=int(app.config.get("ANALYTICS_CACHE_BYTES", 32 * 1024 * 1024)),
+    )
@@ -0,0 +1,258 @@
+from __future__ import annotations
+import os, json, time, atexit, bisect, logging, threading
+from flask import request, g, current_app, Response
+from .db import db_time_reset, db_time_total
+
+log = logging.getLogger("app")
+
+# Buckets (segundos) pensados para redirects sub-milissegundo até páginas lentas
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "urlshort_http_requests_total": ("counter", "Requests HTTP por blueprint, endpoint, método e status."),
+    "urlshort_http_request_duration_seconds": ("histogram", "Latência dos requests HTTP."),
+    "urlshort_db_time_seconds": ("histogram", "Tempo gasto no SQLite por request."),
+    "urlshort_rate_limited_total": ("counter", "Requests rejeitados pelo rate limit (429)."),
+    "urlshort_slug_cache_hits_total": ("counter", "Acertos do cache de slugs."),
+    "urlshort_slug_cache_misses_total": ("counter", "Falhas do cache de slugs."),
+    "urlshort_slug_cache_evictions_total": ("counter", "Remoções por LRU do cache de slugs."),
+    "urlshort_click_buffer_total": ("counter", "Cliques no buffer write-behind, por evento."),
+    "urlshort_slug_filter_total": ("counter", "Consultas ao filtro de slugs inexistentes, por resultado."),
+    "urlshort_analytics_cache_total": ("counter", "Consultas de analytics no cache de resultados, por função e resultado."),
+}
+
+class Registry:
+    """
+    Contadores e histogramas em memória, por processo.
+
+    Cada observação custa um lock, um bisect e alguns incrementos em listas.
+    Chaves: (nome, tupla de pares de labels).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: dict[tuple, float] = {}
+        self.histograms: dict[tuple, list] = {}
+
+    def inc(self, name: str, labels: tuple = (), value: float = 1.0) -> None:
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def observe(self, name: str, labels: tuple, value: float) -> None:
+        key = (name, labels)
+        i = bisect.bisect_left(BUCKETS, value)
+        with self._lock:
+            h = self.histograms.get(key)
+            if h is None:
+                # len(BUCKETS) buckets + +Inf, depois soma e contagem
+                h = self.histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0, 0]
+            h[i] += 1
+            h[-2] += value
+            h[-1] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": [[n, list(map(list, l)), v] for (n, l), v in self.counters.items()],
+                "histograms": [[n, list(map(list, l)), list(h)] for (n, l), h in self.histograms.items()],
+            }
+
+def _collect_app_counters(app) -> list:
+    """
+    Contadores vindos de outras extensões (cache de slugs, buffer de cliques).
+    """
+    out = []
+    cache = app.extensions.get("link_cache")
+    if cache is not None:
+        st = cache.stats()
+        out.append(["urlshort_slug_cache_hits_total", [], st["hits"]])
+        out.append(["urlshort_slug_cache_misses_total", [], st["misses"]])
+        out.append(["urlshort_slug_cache_evictions_total", [], st["evictions"]])
+    rec = app.extensions.get("click_recorder")
+    if rec is not None:
+        st = rec.stats()
+        for event in ("queued", "flushed", "dropped", "sync", "errors"):
+            out.append(["urlshort_click_buffer_total", [["event", event]], st[event]])
+    slug_filter = app.extensions.get("slug_filter")
+    if slug_filter is not None:
+        st = slug_filter.stats()
+        for result in ("negatives", "passes", "false_positives"):
+            out.append(["urlshort_slug_filter_total", [["result", result]], st[result]])
+    results = app.extensions.get("analytics_cache")
+    if results is not None:
+        for fn, st in results.stats()["functions"].items():
+            for result in ("hits", "misses", "coalesced", "stale"):
+                out.append(["urlshort_analytics_cache_total", [["function", fn], ["result", result]], st[result]])
+    return out
+
+def merge(snapshots: list[dict]) -> dict:
+    """
+    Soma snapshots de vários processos (contadores e histogramas são aditivos).
+    """
+    counters: dict[tuple, float] = {}
+    histograms: dict[tuple, list] = {}
+    for snap in snapshots:
+        for name, labels, value in snap.get("counters", []):
+            key = (name, tuple(tuple(p) for p in labels))
+            counters[key] = counters.get(key, 0.0) + value
+        for name, labels, h in snap.get("histograms", []):
+            key = (name, tuple(tuple(p) for p in labels))
+            cur = histograms.get(key)
+            histograms[key] = list(h) if cur is None else [a + b for a, b in zip(cur, h)]
+    return {"counters": counters, "histograms": histograms}
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(pairs, extra=()) -> str:
+    items = list(pairs) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+def _num(v) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+def render(merged: dict) -> str:
+    """
+    Formato de exposição texto do Prometheus (0.0.4).
+    """
+    lines = []
+    by_name: dict[str, list] = {}
+    for (name, labels), v in merged["counters"].items():
+        by_name.setdefault(name, []).append(("c", labels, v))
+    for (name, labels), h in merged["histograms"].items():
+        by_name.setdefault(name, []).append(("h", labels, h))
+    for name in sorted(by_name):
+        kind, help_text = HELP.get(name, ("untyped", name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for typ, labels, v in sorted(by_name[name], key=lambda x: x[1]):
+            if typ == "c":
+                lines.append(f"{name}{_labels(labels)} {_num(v)}")
+                continue
+            cumulative = 0
+            for bound, n in zip(BUCKETS, v):
+                cumulative += n
+                lines.append(f"{name}_bucket{_labels(labels, [('le', repr(bound))])} {cumulative}")
+            cumulative += v[len(BUCKETS)]
+            lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_num(v[-2])}")
+            lines.append(f"{name}_count{_labels(labels)} {int(v[-1])}")
+    return "\n".join(lines) + "\n"
+
+class MetricsStore:
+    """
+    Registro do processo + (opcional) diretório compartilhado para agregar workers
+    pre-forked: cada processo grava seu snapshot em METRICS_DIR/metrics-<pid>.json
+    a cada `flush_interval` segundos e no exit; /metrics soma todos os arquivos.
+    Os arquivos de workers encerrados continuam contando (contadores não podem cair);
+    limpe o diretório a cada deploy, como no modo multiprocess do prometheus_client.
+    """
+
+    def __init__(self, app, directory: str | None = None, flush_interval: float = 5.0):
+        self.app = app
+        self.directory = directory
+        self.flush_interval = float(flush_interval)
+        self.registry = Registry()
+        self._pid = os.getpid()
+        self._last_flush = 0.0
+
+    def _ensure_process(self) -> None:
+        # Depois de um fork o filho começa do zero (o pai já grava os próprios números)
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self.registry = Registry()
+            self._last_flush = 0.0
+
+    def observe_request(self, blueprint: str, endpoint: str, method: str, status: int,
+                        duration: float | None, db_time: float, rate_scope: str | None = None) -> None:
+        self._ensure_process()
+        labels = (("blueprint", blueprint), ("endpoint", endpoint))
+        reg = self.registry
+        reg.inc("urlshort_http_requests_total", labels + (("method", method), ("status", str(status))))
+        if duration is not None:
+            reg.observe("urlshort_http_request_duration_seconds", labels, duration)
+        reg.observe("urlshort_db_time_seconds", labels, db_time)
+        if status == 429:
+            reg.inc("urlshort_rate_limited_total", (("scope", rate_scope or ""),))
+        self.maybe_flush()
+
+    def local_snapshot(self) -> dict:
+        snap = self.registry.snapshot()
+        snap["counters"].extend(_collect_app_counters(self.app))
+        return snap
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"metrics-{pid}.json")
+
+    def flush(self) -> None:
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(os.getpid())
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.local_snapshot(), f)
+        os.replace(tmp, path)
+        self._last_flush = time.monotonic()
+
+    def maybe_flush(self) -> None:
+        if self.directory and time.monotonic() - self._last_flush >= self.flush_interval:
+            try:
+                self.flush()
+            except OSError:
+                log.exception("metrics flush failed")
+
+    def collect(self) -> dict:
+        snapshots = [self.local_snapshot()]
+        if self.directory and os.path.isdir(self.directory):
+            own = os.path.basename(self._path(os.getpid()))
+            for fn in os.listdir(self.directory):
+                if not (fn.startswith("metrics-") and fn.endswith(".json")) or fn == own:
+                    continue
+                try:
+                    with open(os.path.join(self.directory, fn), encoding="utf-8") as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return merge(snapshots)
+
+def get_metrics() -> MetricsStore | None:
+    return current_app.extensions.get("metrics")
+
+def init_app(app):
+    if not app.config.get("METRICS_ENABLED"):
+        return
+    store = MetricsStore(
+        app,
+        directory=app.config.get("METRICS_DIR") or None,
+        flush_interval=float(app.config.get("METRICS_FLUSH_INTERVAL", 5)),
+    )
+    app.extensions["metrics"] = store
+    atexit.register(lambda: store.directory and store._pid == os.getpid() and store.flush())
+
+    @app.before_request
+    def _metrics_start():
+        db_time_reset()
+
+    @app.after_request
+    def _metrics_record(resp):
+        t0 = getattr(g, "_t0", None)
+        store.observe_request(
+            request.blueprint or "", request.endpoint or "none", request.method, resp.status_code,
+            time.perf_counter() - t0 if t0 is not None else None, db_time_total(),
+            getattr(g, "rate_limit_scope", None),
+        )
+        return resp
+
+    def metrics_view():
+        token = app.config.get("METRICS_TOKEN")
+        if token and request.headers.get("Authorization", "") != f"Bearer {token}":
+            return Response("unauthorized\n", status=401, headers={"WWW-Authenticate": 'Bearer realm="metrics"'})
+        body = render(store.collect())
+        return Response(body, mimetype="text/plain", headers={"Cache-Control": "no-store"},
+                        content_type="text/plain; version=0.0.4; charset=utf-8")
+
+    app.add_url_rule("/metrics", "metrics", metrics_view, methods=["GET"])
@@ -0,0 +1,182 @@
+from __future__ import annotations
+import re, time, logging, sqlite3, importlib
+from pathlib import Path
+from sqlite3 import Connection
+import click
+
+log = logging.getLogger("app")
+
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+MODELS_SQL = Path(__file__).parent / "models.sql"
+_NAME_RE = re.compile(r"^(\d{4})_(\w+)\.(sql|py)$")
+
+def list_migrations() -> list[tuple[int, str, Path]]:
+    """
+    Migrações disponíveis, em ordem: (versão, nome, caminho).
+    """
+    found = []
+    for path in MIGRATIONS_DIR.iterdir():
+        m = _NAME_RE.match(path.name)
+        if m:
+            found.append((int(m.group(1)), m.group(2), path))
+    found.sort()
+    versions = [v for v, _, _ in found]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError("versões de migração duplicadas em {}".format(MIGRATIONS_DIR))
+    return found
+
+def current_version(db: Connection) -> int:
+    return int(db.execute("PRAGMA user_version").fetchone()[0])
+
+def pending_migrations(db: Connection, target: int | None = None):
+    version = current_version(db)
+    return [m for m in list_migrations() if m[0] > version and (target is None or m[0] <= target)]
+
+def create_index_with_progress(db: Connection, name: str, table: str, columns: str, progress,
+                               unique: bool = False, interval: float = 2.0) -> None:
+    """
+    CREATE INDEX reportando progresso periódico (via progress handler do SQLite).
+
+    O SQLite não constrói índices de forma concorrente: o build segura o lock de
+    escrita até o fim. Em WAL, leitores (redirects) seguem normalmente e escritores
+    esperam até busy_timeout — com CLICK_BUFFER ativo os cliques ficam na fila.
+    """
+    exists = db.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (name,)).fetchone()
+    if exists:
+        progress(f"{name}: já existe")
+        return
+    approx_rows = db.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0] or 0
+    progress(f"{name}: construindo em {table} (~{approx_rows} linhas)")
+    t0 = last = time.monotonic()
+    steps = {"n": 0}
+
+    def _tick():
+        nonlocal last
+        steps["n"] += 1
+        now = time.monotonic()
+        if now - last >= interval:
+            last = now
+            progress(f"{name}: {now - t0:.1f}s, {steps['n'] * 100}k passos da VM")
+        return 0
+
+    db.set_progress_handler(_tick, 100_000)
+    try:
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        db.execute(f"CREATE {kind} IF NOT EXISTS {name} ON {table} {columns}")
+    finally:
+        db.set_progress_handler(None, 0)
+    progress(f"{name}: pronto em {time.monotonic() - t0:.1f}s")
+
+def apply_migration(db: Connection, version: int, name: str, path: Path, progress) -> None:
+    """
+    Aplica uma migração e grava user_version na mesma transação.
+    """
+    if db.in_transaction:
+        db.commit()
+    if path.suffix == ".sql":
+        sql = path.read_text(encoding="utf-8")
+        try:
+            db.executescript(f"BEGIN IMMEDIATE;\n{sql}\nPRAGMA user_version = {version};\nCOMMIT;")
+        except Exception:
+            if db.in_transaction:
+                db.rollback()
+            raise
+        return
+    module = importlib.import_module(f"{__package__}.migrations.{path.stem}")
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        module.upgrade(db, progress)
+        db.execute(f"PRAGMA user_version = {version}")
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+def run_migrations(db: Connection, target: int | None = None, progress=print) -> list[int]:
+    """
+    Aplica o schema base (models.sql, idempotente), as migrações pendentes até
+    `target` e o índice de busca. Retorna as versões aplicadas.
+    """
+    db.executescript(MODELS_SQL.read_text(encoding="utf-8"))
+    db.commit()
+    applied = []
+    for version, name, path in pending_migrations(db, target):
+        progress(f"migração {version:04d}_{name}...")
+        t0 = time.monotonic()
+        apply_migration(db, version, name, path, progress)
+        progress(f"migração {version:04d}_{name} aplicada em {time.monotonic() - t0:.1f}s")
+        applied.append(version)
+
+    from .search import ensure_index
+    ensure_index(db)
+    return applied
+
+@click.command("migrate")
+@click.option("--target", type=int, default=None, help="Para na versão indicada.")
+@click.option("--dry-run", is_flag=True, help="Só lista as migrações pendentes.")
+def migrate_command(target, dry_run):
+    from flask import current_app
+    from .db import get_db, DEFAULT_DB_PATH
+    db = get_db()
+    click.echo("Banco {} na versão {}".format(current_app.config.get("DB_PATH", DEFAULT_DB_PATH), current_version(db)))
+    if dry_run:
+        for version, name, _ in pending_migrations(db, target):
+            click.echo(f"pendente: {version:04d}_{name}")
+        return
+    applied = run_migrations(db, target=target, progress=click.echo)
+    click.echo("Versão atual: {} ({} migração(ões) aplicada(s))".format(current_version(db), len(applied)))
+
+def latest_version() -> int:
+    migrations = list_migrations()
+    return migrations[-1][0] if migrations else 0
+
+def schema_message(version: int, latest: int) -> str:
+    return (f"Banco na versão de schema {version}, o código espera {latest}: rode "
+            f"`flask --app urlshort.app migrate` (ou `init-db` num banco novo).")
+
+def check_schema(app) -> bool:
+    """
+    Compara PRAGMA user_version com a última migração (conexão própria, como no
+    startup). Guarda o resultado em app.extensions["schema"]; False = atrasado.
+    """
+    from .db import connect, db_settings, DEFAULT_DB_PATH
+    latest = latest_version()
+    try:
+        conn = connect(app.config.get("DB_PATH", DEFAULT_DB_PATH), db_settings(app.config))
+        try:
+            version = current_version(conn)
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        log.error("schema check failed: %s", e)
+        version = -1
+    app.extensions["schema"] = {"version": version, "latest": latest, "ready": version >= latest}
+    return version >= latest
+
+def schema_ready(app) -> bool:
+    return app.extensions.get("schema", {}).get("ready", True)
+
+def init_app(app):
+    app.cli.add_command(migrate_command)
+    # Banco atrás do código (ex.: clicks sem user_agent_id antes da 0002): em vez de
+    # 500 em cada redirect, 503 com a instrução. Os comandos da CLI (migrate,
+    # init-db) não passam por aqui; o estado é reavaliado a cada request enquanto
+    # estiver atrasado, então o processo volta a servir sozinho depois do migrate.
+    if not check_schema(app):
+        state = app.extensions["schema"]
+        log.error("schema behind: %s", schema_message(state["version"], state["latest"]))
+
+    @app.before_request
+    def _require_schema():
+        if schema_ready(app):
+            return None
+        from .db import get_db
+        state = app.extensions["schema"]
+        state["version"] = current_version(get_db())
+        if state["version"] >= state["latest"]:
+            state["ready"] = True
+            return None
+        resp = app.response_class(schema_message(state["version"], state["latest"]) + "\n",
+                                  status=503, mimetype="text/plain")
+        resp.headers["Retry-After"] = "30"
+        return resp
@@ -0,0 +1,12 @@
+"""
+Índice composto (link_id, ts) em clicks, substituindo idx_clicks_link_id e
+idx_clicks_ts: consultas WHERE link_id = ? AND ts >= ? usam um único índice.
+"""
+from urlshort.migrate import create_index_with_progress
+
+def upgrade(db, progress):
+    create_index_with_progress(
+        db, "idx_clicks_link_ts", "clicks", "(link_id, ts)", progress,
+    )
+    db.execute("DROP INDEX IF EXISTS idx_clicks_link_id")
+    db.execute("DROP INDEX IF EXISTS idx_clicks_ts")
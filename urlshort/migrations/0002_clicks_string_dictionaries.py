@@ -0,0 +1,10 @@
+"""
+user_agent/referrer de clicks viram ids das tabelas de dicionário user_agents e
+referrers (a tabela é reconstruída). Partições (partitions.py) são convertidas
+quando anexadas. Rode VACUUM depois para devolver o espaço ao disco.
+"""
+from urlshort.strings import encode_table
+
+def upgrade(db, progress):
+    n = encode_table(db, "main", foreign_keys=True, progress=progress)
+    progress(f"clicks: {n} linhas convertidas")
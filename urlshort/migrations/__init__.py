@@ -0,0 +1,7 @@
+"""
+Migrações versionadas (PRAGMA user_version), aplicadas por `flask migrate`.
+
+Arquivos NNNN_nome.sql ou NNNN_nome.py (com upgrade(db, progress)), em ordem.
+O models.sql descreve o schema atual; as migrações levam bancos antigos até ele,
+então devem ser idempotentes (IF NOT EXISTS / IF EXISTS).
+"""
@@ -16,15 +16,62 @@ CREATE UNIQUE INDEX IF NOT EXISTS idx_links_slug ON links(slug);
 
 CREATE INDEX IF NOT EXISTS idx_links_created_at ON links(created_at);
 
+-- user_agent/referrer como ids dos dicionários abaixo (ver strings.py)
 CREATE TABLE IF NOT EXISTS clicks (
-  id         INTEGER PRIMARY KEY AUTOINCREMENT,
-  link_id    INTEGER NOT NULL,
-  ts         DATETIME NOT NULL DEFAULT (CURRENT_TIMESTAMP),
-  ip         TEXT,
-  user_agent TEXT,
-  referrer   TEXT,
+  id            INTEGER PRIMARY KEY AUTOINCREMENT,
+  link_id       INTEGER NOT NULL,
+  ts            DATETIME NOT NULL DEFAULT (CURRENT_TIMESTAMP),
+  ip            TEXT,
+  user_agent_id INTEGER,
+  referrer_id   INTEGER,
+  FOREIGN KEY (link_id) REFERENCES links(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS user_agents (
+  id    INTEGER PRIMARY KEY,
+  value TEXT    NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS referrers (
+  id    INTEGER PRIMARY KEY,
+  value TEXT    NOT NULL UNIQUE
+);
+
+-- Índices de clicks ficam nas migrações (urlshort/migrations): em tabelas grandes
+-- eles precisam ser construídos com relatório de progresso, não a cada init-db.
+
+-- Rollup diário de cliques, mantido incrementalmente em clicks.insert_clicks
+CREATE TABLE IF NOT EXISTS clicks_daily (
+  link_id INTEGER NOT NULL,
+  day     TEXT    NOT NULL,
+  clicks  INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (link_id, day),
+  FOREIGN KEY (link_id) REFERENCES links(id) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+-- Visitantes únicos: sketch HyperLogLog (1 KiB) por link e dia, ver hll.py
+CREATE TABLE IF NOT EXISTS clicks_hll (
+  link_id INTEGER NOT NULL,
+  day     TEXT    NOT NULL,
+  sketch  BLOB    NOT NULL,
+  PRIMARY KEY (link_id, day),
   FOREIGN KEY (link_id) REFERENCES links(id) ON DELETE CASCADE
 );
 
-CREATE INDEX IF NOT EXISTS idx_clicks_link_id ON clicks(link_id);
-CREATE INDEX IF NOT EXISTS idx_clicks_ts      ON clicks(ts);
\ No newline at end of file
+-- Contadores do alocador de slugs (blocos reservados por worker)
+CREATE TABLE IF NOT EXISTS slug_counter (
+  name TEXT    PRIMARY KEY,
+  next INTEGER NOT NULL DEFAULT 0
+);
+
+-- Marcas d'água dos validadores HTTP (ETag/Last-Modified), ver httpcache.py
+CREATE TABLE IF NOT EXISTS watermarks (
+  key        TEXT    PRIMARY KEY,
+  version    INTEGER NOT NULL DEFAULT 0,
+  updated_at TEXT    NOT NULL
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS watermarks_links_ai AFTER INSERT ON links BEGIN
+  INSERT INTO watermarks (key, version, updated_at) VALUES ('links', 1, CURRENT_TIMESTAMP)
+  ON CONFLICT(key) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at;
+END;
@@ -0,0 +1,26 @@
+from __future__ import annotations
+import json, base64, binascii
+
+NEXT, PREV = "n", "p"
+
+def encode_cursor(direction: str, created_at, link_id: int) -> str:
+    """
+    Cursor opaco para paginação por chave (created_at, id).
+    """
+    raw = json.dumps([direction, str(created_at), int(link_id)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str | None):
+    """
+    Retorna (direction, created_at, id) ou None se o cursor for vazio/inválido.
+    """
+    if not cursor:
+        return None
+    try:
+        pad = "=" * (-len(cursor) % 4)
+        direction, created_at, link_id = json.loads(base64.urlsafe_b64decode(cursor + pad))
+    except (ValueError, TypeError, binascii.Error):
+        return None
+    if direction not in (NEXT, PREV) or not isinstance(created_at, str) or not isinstance(link_id, int):
+        return None
+    return direction, created_at, link_id
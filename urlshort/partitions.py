@@ -0,0 +1,298 @@
+from __future__ import annotations
+import os, re, time, logging
+from sqlite3 import Connection
+from flask import current_app, has_app_context
+import click
+
+log = logging.getLogger("app")
+
+# Cliques particionados por mês: um arquivo SQLite por mês (clicks-YYYY-MM.db),
+# anexado sob demanda (ATTACH) na conexão que precisa dele. O rollup clicks_daily
+# continua no banco principal; só os cliques brutos mudam de lugar.
+#
+# Ids globais: cada partição começa em YYYYMM * ID_BASE, então o id diz o mês e a
+# ordem por id continua cronológica entre partições.
+ID_BASE = 10 ** 10
+# SQLite aceita no máximo 10 bancos anexados por conexão (SQLITE_MAX_ATTACHED)
+MAX_ATTACHED = 8
+# Relação vazia com as colunas de clicks (mês atual ainda sem partição)
+EMPTY = "(SELECT NULL AS id, NULL AS link_id, NULL AS ts, NULL AS ip, NULL AS user_agent_id, NULL AS referrer_id WHERE 0)"
+_FILE = re.compile(r"^clicks-(\d{4}-\d{2})\.db$")
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS {s}.clicks (
+      id            INTEGER PRIMARY KEY AUTOINCREMENT,
+      link_id       INTEGER NOT NULL,
+      ts            DATETIME NOT NULL,
+      ip            TEXT,
+      user_agent_id INTEGER,
+      referrer_id   INTEGER
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS {s}.idx_clicks_link_ts ON clicks(link_id, ts)",
+)
+
+def get_partition_dir() -> str | None:
+    """
+    Diretório das partições quando CLICK_PARTITIONS está ativo (None fora de um app).
+    """
+    if not has_app_context() or not current_app.config.get("CLICK_PARTITIONS"):
+        return None
+    return current_app.config.get("CLICK_PARTITION_DIR") or None
+
+def partition_path(partition_dir: str, month: str) -> str:
+    return os.path.join(partition_dir, f"clicks-{month}.db")
+
+def schema_name(month: str) -> str:
+    return "p_" + month.replace("-", "_")
+
+def current_month() -> str:
+    return time.strftime("%Y-%m", time.gmtime())
+
+def month_of_id(click_id: int) -> str | None:
+    """
+    Mês da partição que gerou o id (None para ids antigos, do banco principal).
+    """
+    if click_id < ID_BASE:
+        return None
+    ym = click_id // ID_BASE
+    return f"{ym // 100:04d}-{ym % 100:02d}"
+
+def list_partitions(partition_dir: str) -> list[str]:
+    """
+    Meses com partição ("YYYY-MM"), em ordem crescente.
+    """
+    if not os.path.isdir(partition_dir):
+        return []
+    return sorted(m.group(1) for m in map(_FILE.match, os.listdir(partition_dir)) if m)
+
+def _ensure_schema(db: Connection, schema: str, month: str) -> None:
+    if db.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE name = 'clicks'").fetchone():
+        return
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        for stmt in SCHEMA:
+            db.execute(stmt.format(s=schema))
+        db.execute(
+            f"""
+            INSERT INTO {schema}.sqlite_sequence (name, seq)
+            SELECT 'clicks', ? WHERE NOT EXISTS (SELECT 1 FROM {schema}.sqlite_sequence WHERE name = 'clicks')
+            """,
+            (int(month.replace("-", "")) * ID_BASE,),
+        )
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+
+def attach(db: Connection, partition_dir: str, month: str, create: bool = False) -> str | None:
+    """
+    Anexa a partição do mês à conexão (se ainda não estiver) e retorna o nome do
+    schema; None se a partição não existe e `create` é falso. Com o limite de ATTACH
+    atingido, desanexa as partições mais antigas.
+    """
+    schema = schema_name(month)
+    path = partition_path(partition_dir, month)
+    attached = [r[1] for r in db.execute("PRAGMA database_list").fetchall()]
+    if schema in attached:
+        if os.path.exists(path):
+            return schema
+        # Apagada (drop-click-partition) depois de anexada nesta conexão
+        db.execute(f"DETACH DATABASE {schema}")
+        attached.remove(schema)
+    if not create and not os.path.exists(path):
+        return None
+    parts = sorted(n for n in attached if n.startswith("p_"))
+    for name in parts[:max(0, len(parts) - MAX_ATTACHED + 1)]:
+        db.execute(f"DETACH DATABASE {name}")
+    os.makedirs(partition_dir, exist_ok=True)
+    db.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+    # PRAGMAs de conexão valem por schema: copia os do banco principal
+    db.execute(f"PRAGMA {schema}.journal_mode = WAL")
+    db.execute(f"PRAGMA {schema}.synchronous = {int(db.execute('PRAGMA main.synchronous').fetchone()[0])}")
+    db.execute(f"PRAGMA {schema}.cache_size = {int(db.execute('PRAGMA main.cache_size').fetchone()[0])}")
+    if create:
+        _ensure_schema(db, schema, month)
+    elif db.execute(f"SELECT 1 FROM pragma_table_info('clicks', '{schema}') WHERE name = 'user_agent'").fetchone():
+        _encode_legacy(db, schema)
+    return schema
+
+def _encode_legacy(db: Connection, schema: str) -> None:
+    # Partição criada antes dos dicionários de user_agent/referrer (migração 0002)
+    from .strings import encode_table
+    log.warning("click partition %s: converting user_agent/referrer to dictionary ids", schema)
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        encode_table(db, schema, foreign_keys=False, progress=lambda msg: None)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+
+def insert_partitioned(db: Connection, partition_dir: str, rows: list[tuple]) -> None:
+    """
+    Grava cliques (link_id, ts, ip, user_agent_id, referrer_id) na partição do mês
+    de cada ts; uma transação por partição (só o arquivo do mês fica travado).
+    """
+    by_month: dict[str, list] = {}
+    for r in rows:
+        by_month.setdefault(r[1][:7], []).append(r)
+    for month, part in by_month.items():
+        schema = attach(db, partition_dir, month, create=True)
+        with db:
+            db.executemany(
+                f"INSERT INTO {schema}.clicks (link_id, ts, ip, user_agent_id, referrer_id) VALUES (?,?,?,?,?)",
+                part,
+            )
+
+def click_months(start: str | None = None, end: str | None = None, newest_first: bool = False) -> list:
+    """
+    Meses com partição dentro de [start, end] (dias YYYY-MM-DD). Sem particionamento
+    retorna [None], que table_for() traduz para a tabela clicks do banco principal.
+    """
+    partition_dir = get_partition_dir()
+    if not partition_dir:
+        return [None]
+    months = [m for m in list_partitions(partition_dir)
+              if (not start or m >= start[:7]) and (not end or m <= end[:7])]
+    return months[::-1] if newest_first else months
+
+def table_for(db: Connection, month: str | None) -> str | None:
+    """
+    Nome qualificado da tabela de cliques do mês ("p_YYYY_MM.clicks"); None se a
+    partição não existe mais. Use antes de anexar a próxima: o ATTACH pode
+    desanexar partições antigas.
+    """
+    if month is None:
+        return "clicks"
+    partition_dir = get_partition_dir()
+    schema = attach(db, partition_dir, month) if partition_dir else None
+    return f"{schema}.clicks" if schema else None
+
+def click_tables(db: Connection, start: str | None = None, end: str | None = None, newest_first: bool = False):
+    """
+    Gera (mês, tabela) só para as partições que o intervalo cobre, anexando uma de
+    cada vez.
+    """
+    for month in click_months(start, end, newest_first):
+        table = table_for(db, month)
+        if table is not None:
+            yield month, table
+
+def today_table(db: Connection) -> str:
+    """
+    Tabela com os cliques brutos de hoje: a partição do mês atual (ou "clicks").
+    """
+    if not get_partition_dir():
+        return "clicks"
+    return table_for(db, current_month()) or EMPTY
+
+def table_for_id(db: Connection, click_id: int) -> tuple[str | None, str] | None:
+    """
+    (mês, tabela) que contém o clique; ids antigos (migrados por partition-clicks)
+    são procurados partição a partição.
+    """
+    month = month_of_id(click_id) if get_partition_dir() else None
+    if month is not None or not get_partition_dir():
+        table = table_for(db, month)
+        return (month, table) if table else None
+    for month, table in click_tables(db):
+        if db.execute(f"SELECT 1 FROM {table} WHERE id = ?", (click_id,)).fetchone():
+            return month, table
+    return None
+
+def _bump_maint(db: Connection) -> None:
+    from .httpcache import bump
+    with db:
+        bump(db, {"maint": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())})
+
+def drop_partition(db: Connection | None, partition_dir: str, month: str) -> bool:
+    """
+    Apaga a partição do mês (O(1): remove o arquivo, sem DELETE). O rollup
+    clicks_daily não é tocado. Outras conexões desanexam no próximo attach().
+    """
+    schema = schema_name(month)
+    if db is not None and schema in [r[1] for r in db.execute("PRAGMA database_list").fetchall()]:
+        db.execute(f"DETACH DATABASE {schema}")
+    path = partition_path(partition_dir, month)
+    existed = os.path.exists(path)
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+    if existed:
+        if db is not None:
+            _bump_maint(db)
+        log.info("click partition dropped month=%s", month)
+    return existed
+
+def migrate_legacy(db: Connection, partition_dir: str, progress=print) -> int:
+    """
+    Move os cliques da tabela clicks do banco principal para as partições, mês a
+    mês. Mantém os ids (INSERT OR IGNORE), então repetir após uma falha é seguro.
+    """
+    moved = 0
+    while True:
+        first = db.execute("SELECT MIN(ts) FROM main.clicks").fetchone()[0]
+        if first is None:
+            if moved:
+                _bump_maint(db)
+            return moved
+        month = first[:7]
+        upper = db.execute("SELECT date(?, '+1 month')", (month + "-01",)).fetchone()[0]
+        schema = attach(db, partition_dir, month, create=True)
+        with db:
+            db.execute(
+                f"""
+                INSERT OR IGNORE INTO {schema}.clicks (id, link_id, ts, ip, user_agent_id, referrer_id)
+                SELECT id, link_id, ts, ip, user_agent_id, referrer_id FROM main.clicks WHERE ts >= ? AND ts < ?
+                """,
+                (month + "-01", upper),
+            )
+        # Só depois da partição gravada (commits separados: um arquivo por vez)
+        with db:
+            n = db.execute("DELETE FROM main.clicks WHERE ts >= ? AND ts < ?", (month + "-01", upper)).rowcount
+        moved += n
+        progress(f"{month}: {n} cliques movidos para {os.path.basename(partition_path(partition_dir, month))}")
+
+def _require_dir() -> str:
+    partition_dir = get_partition_dir()
+    if not partition_dir:
+        raise click.ClickException("CLICK_PARTITIONS não está ativo")
+    return partition_dir
+
+@click.command("click-partitions")
+def list_partitions_command():
+    partition_dir = _require_dir()
+    for month in list_partitions(partition_dir):
+        click.echo(f"{month}  {os.path.getsize(partition_path(partition_dir, month))} bytes")
+
+@click.command("partition-clicks")
+def partition_clicks_command():
+    from .db import get_db
+    n = migrate_legacy(get_db(), _require_dir(), progress=click.echo)
+    click.echo(f"{n} cliques movidos para partições")
+
+@click.command("drop-click-partition")
+@click.argument("month")
+@click.option("--yes", is_flag=True, help="Não pede confirmação.")
+def drop_partition_command(month, yes):
+    from .db import get_db
+    partition_dir = _require_dir()
+    if not re.fullmatch(r"\d{4}-\d{2}", month):
+        raise click.ClickException("mês deve ser YYYY-MM")
+    if month >= current_month():
+        raise click.ClickException("só meses já fechados podem ser apagados")
+    if not yes:
+        click.confirm(f"Apagar os cliques brutos de {month}? (clicks_daily é mantido)", abort=True)
+    if drop_partition(get_db(), partition_dir, month):
+        click.echo(f"partição {month} apagada")
+    else:
+        click.echo(f"partição {month} não existe")
+
+def init_app(app):
+    app.cli.add_command(list_partitions_command)
+    app.cli.add_command(partition_clicks_command)
+    app.cli.add_command(drop_partition_command)
@@ -1,18 +1,19 @@
 from __future__ import annotations
-import sqlite3, secrets, logging
+import logging
 from urllib.parse import urlparse
 from flask import Blueprint, render_template, current_app, request, redirect, url_for, flash
 from .db import get_db
 from .security import client_ip, check_rate_limit, require_csrf
+from .clicks import record_click
+from .trending import get_trending
+from .links import insert_link
+from .slugfilter import get_slug_filter
+from .logqueue import redirect_sampled
+from . import analytics as an
 
 bp = Blueprint("public", __name__)
 log = logging.getLogger("app")
 
-ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
-
-def base62_slug(n: int = 6) -> str:
-    return "".join(secrets.choice(ALPHABET) for _ in range(n))
-
 def is_valid_http_url(u: str) -> bool:
     if not u or len(u) > 2048:
         return False
@@ -55,22 +56,7 @@ def index():
             return render_template("public/index.html", base_url=base_url, links=links), 400
 
         created_ip = client_ip()
-        slug_len = int(current_app.config.get("SLUG_LEN", 6))
-        max_tries, slug = 10, None
-
-        for _ in range(max_tries):
-            candidate = base62_slug(slug_len)
-            try:
-                db.execute(
-                    "INSERT INTO links (slug, target_url, is_permanent, created_ip) VALUES (?,?,?,?)",
-                    (candidate, target_url, is_perm, created_ip),
-                )
-                db.commit()
-                slug = candidate
-                log.info("create slug=%s is_perm=%s ip=%s target=%s", slug, is_perm, created_ip, target_url)
-                break
-            except sqlite3.IntegrityError:
-                continue
+        slug = insert_link(db, target_url, is_perm, created_ip=created_ip)
 
         if not slug:
             flash("Falha ao gerar slug único. Tente novamente.", "error")
@@ -79,6 +65,7 @@ def index():
             ).fetchall()
             return render_template("public/index.html", base_url=base_url, links=links), 500
 
+        log.info("create slug=%s is_perm=%s ip=%s target=%s", slug, is_perm, created_ip, target_url)
         short_url = f"{base_url.rstrip('/')}/{slug}"
         flash(f"Link criado: {short_url}", "success")
         return redirect(url_for("public.index"))
@@ -90,30 +77,39 @@ def index():
 
 @bp.get("/<slug>")
 def follow(slug: str):
+    slug_filter = get_slug_filter()
+    # Slug que certamente não existe: 404 pré-renderizado, sem tocar no SQLite
+    if slug_filter is not None and slug_filter.definitely_missing(slug, get_db):
+        return slug_filter.not_found_response(slug)
     db = get_db()
-    row = db.execute(
-        "SELECT id, target_url, is_permanent FROM links WHERE slug = ?",
-        (slug,),
-    ).fetchone()
+    row = an.get_link_by_slug(db, slug)
 
     if not row:
+        if slug_filter is not None:
+            slug_filter.false_positive()
+            return slug_filter.not_found_response(slug)
         return render_template("public/not_found.html", slug=slug), 404
 
     ip = client_ip()
     ua = request.headers.get("User-Agent")
     ref = request.headers.get("Referer")
-    db.execute(
-        "INSERT INTO clicks (link_id, ip, user_agent, referrer) VALUES (?,?,?,?)",
-        (row["id"], ip, ua, ref),
-    )
-    db.commit()
+    record_click(db, row["id"], ip, ua, ref)
+    trending = get_trending()
+    if trending is not None:
+        trending.record(row["id"])
+
+    resp = redirect_response(row, int(current_app.config.get("REDIRECT_CACHE", 3600)))
+    if redirect_sampled(float(current_app.config.get("LOG_REDIRECT_SAMPLE", 1.0))):
+        log.info("redirect slug=%s code=%s to=%s ip=%s", slug, resp.status_code, row["target_url"], ip)
+    return resp
 
+def redirect_response(row, max_age: int):
+    """
+    301 (cacheável por `max_age`) ou 302 (sem cache) para o destino do link.
+    """
     code = 301 if row["is_permanent"] else 302
-    log.info("redirect slug=%s code=%s to=%s ip=%s", slug, code, row["target_url"], ip)
-
     resp = redirect(row["target_url"], code=code)
     if code == 301:
-        max_age = int(current_app.config.get("REDIRECT_CACHE", 3600))
         resp.headers["Cache-Control"] = f"public, max-age={max_age}"
     else:
         resp.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
@@ -0,0 +1,113 @@
+from __future__ import annotations
+import re, sqlite3, logging
+from sqlite3 import Connection
+from flask import current_app, has_app_context
+import click
+
+log = logging.getLogger("app")
+
+# Índice FTS5 "external content" sobre links, mantido por triggers
+_FTS_TABLE = """
+CREATE VIRTUAL TABLE links_fts USING fts5(
+  slug, target_url, note,
+  content='links', content_rowid='id', tokenize='{tokenizer}'
+);
+"""
+
+_FTS_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS links_fts_ai AFTER INSERT ON links BEGIN
+  INSERT INTO links_fts(rowid, slug, target_url, note)
+  VALUES (new.id, new.slug, new.target_url, new.note);
+END;
+CREATE TRIGGER IF NOT EXISTS links_fts_ad AFTER DELETE ON links BEGIN
+  INSERT INTO links_fts(links_fts, rowid, slug, target_url, note)
+  VALUES ('delete', old.id, old.slug, old.target_url, old.note);
+END;
+CREATE TRIGGER IF NOT EXISTS links_fts_au AFTER UPDATE ON links BEGIN
+  INSERT INTO links_fts(links_fts, rowid, slug, target_url, note)
+  VALUES ('delete', old.id, old.slug, old.target_url, old.note);
+  INSERT INTO links_fts(rowid, slug, target_url, note)
+  VALUES (new.id, new.slug, new.target_url, new.note);
+END;
+"""
+
+# Preferência: trigram (substring, como o LIKE '%q%'); senão tokens com prefixo
+TOKENIZERS = ("trigram", "unicode61")
+
+def detect_mode(db: Connection) -> str | None:
+    """
+    Retorna o tokenizer do índice links_fts ("trigram"/"unicode61") ou None se não existe.
+    """
+    row = db.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'links_fts'").fetchone()
+    if not row:
+        return None
+    return "trigram" if "trigram" in row[0] else "unicode61"
+
+def fts_mode(db: Connection) -> str | None:
+    if not has_app_context():
+        return detect_mode(db)
+    ext = current_app.extensions
+    if "search_mode" not in ext:
+        ext["search_mode"] = detect_mode(db)
+    return ext["search_mode"]
+
+def ensure_index(db: Connection, rebuild: bool = False) -> str | None:
+    """
+    Cria (se possível) o índice FTS5 e os triggers de sincronização.
+    Sem FTS5 no SQLite, retorna None e a busca continua com LIKE.
+    """
+    mode = detect_mode(db)
+    created = False
+    if mode is None:
+        for tokenizer in TOKENIZERS:
+            try:
+                db.executescript(_FTS_TABLE.format(tokenizer=tokenizer))
+            except sqlite3.OperationalError as e:
+                log.warning("fts5 tokenizer=%s indisponível: %s", tokenizer, e)
+                continue
+            mode, created = tokenizer, True
+            break
+    if mode is None:
+        return None
+    db.executescript(_FTS_TRIGGERS)
+    if created or rebuild:
+        with db:
+            db.execute("INSERT INTO links_fts(links_fts) VALUES ('rebuild')")
+    if has_app_context():
+        current_app.extensions["search_mode"] = mode
+    return mode
+
+def _match_query(mode: str, q: str) -> str | None:
+    if mode == "trigram":
+        # Trigram precisa de pelo menos 3 caracteres; frase = substring
+        if len(q) < 3:
+            return None
+        return '"' + q.replace('"', '""') + '"'
+    tokens = re.findall(r"\w+", q)
+    if not tokens:
+        return None
+    return " AND ".join('"' + t + '"*' for t in tokens)
+
+def search_filter(db: Connection, q: str, id_col: str = "id", like_cols: tuple = ("slug", "target_url")):
+    """
+    Filtro SQL para a busca q: usa o índice FTS quando disponível e a consulta
+    permite; senão cai no LIKE '%q%' antigo. Retorna (sql, params).
+    """
+    mode = fts_mode(db)
+    match = _match_query(mode, q) if mode else None
+    if match is not None:
+        return f"{id_col} IN (SELECT rowid FROM links_fts WHERE links_fts MATCH ?)", [match]
+    like = f"%{q}%"
+    return "(" + " OR ".join(f"{c} LIKE ?" for c in like_cols) + ")", [like] * len(like_cols)
+
+@click.command("search-rebuild")
+def search_rebuild_command():
+    from .db import get_db
+    mode = ensure_index(get_db(), rebuild=True)
+    if mode:
+        click.echo(f"Índice de busca reconstruído (fts5, tokenizer={mode})")
+    else:
+        click.echo("FTS5 indisponível neste SQLite; a busca usa LIKE")
+
+def init_app(app):
+    app.cli.add_command(search_rebuild_command)
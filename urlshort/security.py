@@ -1,10 +1,14 @@
 from __future__ import annotations
+import os
+import math
 import time
+import sqlite3
 import secrets
-from collections import deque
+import threading
 from flask import request, session, current_app, abort, g
 
-_RATE_BUCKETS: dict[str, deque[float]] = {}
+# Endpoints que aceitam corpo maior que MAX_FORM_BYTES -> chave de config do limite
+_BODY_LIMITS = {"api.api_create_links_batch": "BATCH_MAX_BYTES"}
 
 def client_ip() -> str | None:
     xff = request.headers.get("X-Forwarded-For")
@@ -15,34 +19,143 @@ def client_ip() -> str | None:
 def _now() -> float:
     return time.time()
 
-def check_rate_limit(scope: str, limit: int | None = None, window: int | None = None) -> bool:
+def _gcra(tat: float | None, now: float, limit: int, window: float):
     """
-    Verifica/atualiza o bucket de rate limit por IP.
-    Excede -> abort(429) e define Retry-After.
+    GCRA: `limit` requests por `window` segundos guardando só o TAT (theoretical
+    arrival time) da chave. Retorna (novo_tat, None) se permitido, ou
+    (tat, retry_after_em_segundos) se excedeu.
+    """
+    interval = window / limit
+    tat = max(tat or now, now)
+    new_tat = tat + interval
+    if new_tat - now > window:
+        return tat, new_tat - now - window
+    return new_tat, None
+
+class MemoryRateLimiter:
+    """
+    Rate limit por processo: um float por chave, chaves ociosas removidas a cada
+    `sweep_interval` segundos.
+    """
+    name = "memory"
+
+    def __init__(self, sweep_interval: float = 60.0):
+        self.sweep_interval = float(sweep_interval)
+        self._tat: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = _now()
+        self._rejected = 0
+
+    def hit(self, key: str, limit: int, window: float, now: float) -> float | None:
+        with self._lock:
+            tat, retry = _gcra(self._tat.get(key), now, limit, window)
+            if retry is None:
+                self._tat[key] = tat
+            else:
+                self._rejected += 1
+            if now - self._last_sweep >= self.sweep_interval:
+                self._last_sweep = now
+                # TAT no passado = chave sem crédito consumido: equivale a não existir
+                for k in [k for k, t in self._tat.items() if t <= now]:
+                    del self._tat[k]
+        return retry
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"backend": self.name, "keys": len(self._tat), "rejected": self._rejected}
+
+class SQLiteRateLimiter:
+    """
+    Rate limit compartilhado entre processos do host numa tabela SQLite local
+    (arquivo próprio, separado do banco principal). Cada hit é uma transação
+    BEGIN IMMEDIATE curta; chaves ociosas são apagadas a cada `sweep_interval`.
+    """
+    name = "sqlite"
+
+    def __init__(self, db_path: str, sweep_interval: float = 60.0, busy_timeout: int = 2000):
+        self.db_path = db_path
+        self.sweep_interval = float(sweep_interval)
+        self.busy_timeout = int(busy_timeout)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        self._rejected = 0
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, tat REAL NOT NULL) WITHOUT ROWID"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        entry = getattr(self._local, "entry", None)
+        if entry is not None and entry[1] == os.getpid():
+            return entry[0]
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        conn.execute("PRAGMA journal_mode = WAL;")
+        # Estado descartável: não vale um fsync por request
+        conn.execute("PRAGMA synchronous = OFF;")
+        conn.execute(f"PRAGMA busy_timeout = {self.busy_timeout};")
+        self._local.entry = (conn, os.getpid())
+        return conn
+
+    def hit(self, key: str, limit: int, window: float, now: float) -> float | None:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tat FROM rate_limits WHERE key = ?", (key,)).fetchone()
+            tat, retry = _gcra(row[0] if row else None, now, limit, window)
+            if retry is None:
+                conn.execute(
+                    "INSERT INTO rate_limits (key, tat) VALUES (?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET tat = excluded.tat",
+                    (key, tat),
+                )
+            if now - self._last_sweep >= self.sweep_interval:
+                self._last_sweep = now
+                conn.execute("DELETE FROM rate_limits WHERE tat <= ?", (now,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if retry is not None:
+            with self._lock:
+                self._rejected += 1
+        return retry
+
+    def stats(self) -> dict:
+        row = self._conn().execute("SELECT COUNT(*) FROM rate_limits").fetchone()
+        with self._lock:
+            return {"backend": self.name, "keys": row[0], "rejected": self._rejected, "db_path": self.db_path}
+
+def get_rate_limiter():
+    limiter = current_app.extensions.get("rate_limiter")
+    if limiter is None:
+        limiter = current_app.extensions["rate_limiter"] = MemoryRateLimiter()
+    return limiter
+
+def rate_limit_retry(scope: str, ip: str | None, limit: int | None = None,
+                     window: int | None = None) -> float | None:
+    """
+    Conta um hit de `ip` no escopo; retorna os segundos de espera se excedeu, senão None.
+    Só precisa de app context (usado também pelo modo ASGI).
     """
     if limit is None:
         limit = int(current_app.config.get("RATE_LIMIT_MAX", 10))
     if window is None:
         window = int(current_app.config.get("RATE_LIMIT_WINDOW", 60))
+    key = f"{scope}:{ip or 'unknown'}"
+    return get_rate_limiter().hit(key, max(1, int(limit)), float(window), _now())
 
-    ip = client_ip() or "unknown"
-    key = f"{scope}:{ip}"
-
-    dq = _RATE_BUCKETS.get(key)
-    now = _now()
-    if dq is None:
-        dq = deque()
-        _RATE_BUCKETS[key] = dq
-
-    while dq and (now - dq[0]) > window:
-        dq.popleft()
-
-    if len(dq) >= limit:
-        retry_after = int(window - (now - dq[0]))
-        g.rate_limited = retry_after
+def check_rate_limit(scope: str, limit: int | None = None, window: int | None = None) -> bool:
+    """
+    Verifica/atualiza o rate limit por IP (GCRA, memória constante por chave).
+    Excede -> abort(429) e define Retry-After.
+    """
+    retry = rate_limit_retry(scope, client_ip(), limit, window)
+    if retry is not None:
+        g.rate_limited = max(1, math.ceil(retry))
+        g.rate_limit_scope = scope
         abort(429)
-
-    dq.append(now)
     return True
 
 
@@ -67,10 +180,22 @@ def require_csrf() -> None:
 def init_app(app):
     app.jinja_env.globals["csrf_token"] = generate_csrf_token
 
+    backend = str(app.config.get("RATE_LIMIT_BACKEND", "memory"))
+    sweep = float(app.config.get("RATE_LIMIT_SWEEP", 60))
+    if backend == "sqlite":
+        app.extensions["rate_limiter"] = SQLiteRateLimiter(
+            app.config.get("RATE_LIMIT_DB", "var/ratelimit.db"), sweep_interval=sweep
+        )
+    elif backend == "memory":
+        app.extensions["rate_limiter"] = MemoryRateLimiter(sweep_interval=sweep)
+    else:
+        raise ValueError(f"RATE_LIMIT_BACKEND inválido: {backend!r}")
+
     @app.before_request
     def _limit_form_size():
         if request.method in ("POST", "PUT", "PATCH", "DELETE"):
-            max_bytes = int(app.config.get("MAX_FORM_BYTES", 4096))
+            limit_key = _BODY_LIMITS.get(request.endpoint, "MAX_FORM_BYTES")
+            max_bytes = int(app.config.get(limit_key, app.config.get("MAX_FORM_BYTES", 4096)))
             cl = request.content_length
             if cl is not None and cl > max_bytes:
                 abort(413)
@@ -0,0 +1,232 @@
+from __future__ import annotations
+import math, time, hashlib, logging, sqlite3, threading
+from flask import current_app, has_app_context, render_template
+from markupsafe import escape
+
+log = logging.getLogger("app")
+
+# Filtro de Bloom com todos os slugs existentes, em memória por processo: um "talvez"
+# segue o caminho normal (cache de slugs -> banco); um "não" vira 404 pré-renderizado
+# sem abrir conexão nem consultar o SQLite.
+#
+# Links criados por este processo entram no filtro na hora (link_created). Os de
+# fora (outros workers, CLI, bench, SQL manual, outro host) aparecem na geração dos
+# links, a marca d'água "links" (httpcache.py) que o trigger de links avança a cada
+# insert. Um "não" confere a geração no máximo a cada `check_interval` segundos
+# (SLUG_FILTER_CHECK_INTERVAL); se ela mudou, o filtro busca os links com id acima
+# do maior que já viu antes de responder. Janela de atraso: um link gravado por
+# outro processo pode receber 404 deste por até `check_interval` segundos.
+MIN_CAPACITY = 1024
+_PLACEHOLDER = "__urlshort_slug__"
+
+class BloomFilter:
+    """
+    m bits e k hashes (double hashing sobre um blake2b de 128 bits), dimensionados
+    para `capacity` itens com taxa de falso positivo `fp_rate`.
+    """
+
+    def __init__(self, capacity: int, fp_rate: float = 0.01):
+        self.capacity = max(MIN_CAPACITY, int(capacity))
+        self.fp_rate = float(fp_rate)
+        m = int(math.ceil(-self.capacity * math.log(self.fp_rate) / math.log(2) ** 2))
+        self.m = (m + 7) // 8 * 8
+        self.k = max(1, int(round(self.m / self.capacity * math.log(2))))
+        self.bits = bytearray(self.m // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        d = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(d[:8], "little")
+        h2 = int.from_bytes(d[8:], "little") | 1
+        m = self.m
+        return [(h1 + i * h2) % m for i in range(self.k)]
+
+    def add(self, item: str) -> None:
+        bits = self.bits
+        for p in self._positions(item):
+            bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(item))
+
+    def expected_fp_rate(self) -> float:
+        return (1 - math.exp(-self.k * self.count / self.m)) ** self.k
+
+class SlugFilter:
+    """
+    BloomFilter + sincronização com o banco pela geração de links.
+    """
+
+    def __init__(self, app, fp_rate: float = 0.01, check_interval: float = 1.0):
+        self._app = app
+        self.fp_rate = float(fp_rate)
+        self.check_interval = float(check_interval)
+        self._checked_at = 0.0
+        self.bloom: BloomFilter | None = None
+        self._lock = threading.Lock()
+        self._max_id = 0
+        self._generation = None
+        self._not_found_page: str | None = None
+        self._counters = {"negatives": 0, "passes": 0, "false_positives": 0, "checks": 0, "syncs": 0,
+                          "rebuilds": 0}
+
+    # --- banco ---
+
+    @staticmethod
+    def generation(db: sqlite3.Connection) -> int:
+        row = db.execute("SELECT version FROM watermarks WHERE key = 'links'").fetchone()
+        return row[0] if row else 0
+
+    def build(self, db: sqlite3.Connection) -> None:
+        """
+        (Re)constrói o filtro com todos os slugs; capacidade para o dobro dos atuais.
+        """
+        # Geração lida antes dos links: um insert no meio só força outra sincronização
+        generation = self.generation(db)
+        n, max_id = db.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM links").fetchone()
+        bloom = BloomFilter(2 * n, self.fp_rate)
+        for (slug,) in db.execute("SELECT slug FROM links WHERE id <= ?", (max_id,)):
+            bloom.add(slug)
+        with self._lock:
+            self.bloom = bloom
+            self._max_id = max_id
+            self._generation = generation
+            self._checked_at = time.monotonic()
+            self._counters["rebuilds"] += 1
+        log.info("slug filter built links=%d bytes=%d k=%d", n, len(bloom.bits), bloom.k)
+
+    def sync(self, db: sqlite3.Connection, generation: int | None = None) -> None:
+        """
+        Acrescenta os links com id acima do maior já visto. O trigger avança a geração
+        uma vez por link inserido: se vieram menos linhas do que isso, algum insert
+        usou um id antigo (ou houve delete) e o filtro é reconstruído.
+        """
+        if self.bloom is None or self._generation is None:
+            self.build(db)
+            return
+        if generation is None:
+            generation = self.generation(db)
+        rows = db.execute("SELECT id, slug FROM links WHERE id > ? ORDER BY id", (self._max_id,)).fetchall()
+        if len(rows) < generation - self._generation:
+            self.build(db)
+            return
+        with self._lock:
+            for link_id, slug in rows:
+                self.bloom.add(slug)
+                self._max_id = max(self._max_id, link_id)
+            self._generation = generation
+            self._counters["syncs"] += 1
+        if self.bloom.count > self.bloom.capacity:
+            self.build(db)
+
+    # --- redirect ---
+
+    def check_due(self) -> bool:
+        return self.bloom is None or time.monotonic() - self._checked_at >= self.check_interval
+
+    def definitely_missing(self, slug: str, get_db=None) -> bool:
+        """
+        True só quando o slug certamente não existe (a menos da janela de
+        `check_interval` para links gravados por outros processos). `get_db()` só é
+        chamado quando a geração precisa ser conferida; sem get_db (event loop do
+        ASGI) uma conferência vencida responde "talvez". Erro de banco: "talvez".
+        """
+        bloom = self.bloom
+        if bloom is not None and slug in bloom:
+            self._counters["passes"] += 1
+            return False
+        if self.check_due():
+            if get_db is None:
+                return False
+            try:
+                db = get_db()
+                generation = self.generation(db)
+                if bloom is None or generation != self._generation or bloom.count > bloom.capacity:
+                    self.sync(db, generation)
+                self._checked_at = time.monotonic()
+                self._counters["checks"] += 1
+            except sqlite3.Error as e:
+                log.warning("slug filter sync failed: %s", e)
+                return False
+            if slug in self.bloom:
+                self._counters["passes"] += 1
+                return False
+        self._counters["negatives"] += 1
+        return True
+
+    def false_positive(self) -> None:
+        """
+        O filtro disse "talvez" e o banco não achou o slug.
+        """
+        self._counters["false_positives"] += 1
+
+    def add(self, slug: str) -> None:
+        if self.bloom is None:
+            return
+        with self._lock:
+            self.bloom.add(slug)
+
+    # --- 404 ---
+
+    def prerender(self, app) -> None:
+        """
+        Renderiza public/not_found.html uma vez, com um marcador no lugar do slug
+        (contexto de request próprio: não consome mensagens flash de ninguém).
+        """
+        with app.test_request_context("/"):
+            self._not_found_page = render_template("public/not_found.html", slug=_PLACEHOLDER)
+
+    def not_found_response(self, slug: str):
+        if self._not_found_page is None:
+            self.prerender(self._app)
+        body = self._not_found_page.replace(_PLACEHOLDER, str(escape(slug)), 1)
+        return self._app.response_class(body, status=404, mimetype="text/html")
+
+    def stats(self) -> dict:
+        out = dict(self._counters)
+        bloom = self.bloom
+        misses = out["negatives"] + out["false_positives"]
+        out["observed_fp_rate"] = round(out["false_positives"] / misses, 6) if misses else None
+        if bloom is not None:
+            out.update({
+                "items": bloom.count, "capacity": bloom.capacity, "bits": bloom.m, "hashes": bloom.k,
+                "bytes": len(bloom.bits), "target_fp_rate": bloom.fp_rate,
+                "expected_fp_rate": round(bloom.expected_fp_rate(), 6),
+            })
+        return out
+
+def get_slug_filter() -> SlugFilter | None:
+    if not has_app_context():
+        return None
+    return current_app.extensions.get("slug_filter")
+
+def link_created(slug: str) -> None:
+    """
+    Chamado por insert_link: o slug entra no filtro do processo na hora.
+    """
+    f = get_slug_filter()
+    if f is not None:
+        f.add(slug)
+
+def init_app(app):
+    if not app.config.get("SLUG_FILTER", False):
+        return
+    from .db import connect, db_settings, DEFAULT_DB_PATH
+    f = SlugFilter(
+        app,
+        fp_rate=float(app.config.get("SLUG_FILTER_FP_RATE", 0.01)),
+        check_interval=float(app.config.get("SLUG_FILTER_CHECK_INTERVAL", 1.0)),
+    )
+    # Construído no startup com conexão própria (pode rodar no master antes do
+    # fork); sem tabela links ainda, fica para a primeira consulta
+    try:
+        conn = connect(app.config.get("DB_PATH", DEFAULT_DB_PATH), db_settings(app.config))
+        try:
+            f.build(conn)
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        log.warning("slug filter build deferred: %s", e)
+    app.extensions["slug_filter"] = f
@@ -0,0 +1,195 @@
+from __future__ import annotations
+import os, hmac, hashlib, secrets, threading
+from sqlite3 import Connection
+from flask import current_app
+
+ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+BASE = len(ALPHABET)
+# Slugs que colidem com rotas fixas: /api/links/top, /metrics e /admin (redireciona
+# para /admin/). Recusados como slug personalizado e pulados pelos alocadores.
+RESERVED_SLUGS = frozenset({"top", "metrics", "admin"})
+
+def random_slug(n: int = 6) -> str:
+    return "".join(secrets.choice(ALPHABET) for _ in range(n))
+
+def encode_base62(value: int, width: int) -> str:
+    """
+    Codifica value em base62 com exatamente `width` dígitos (zeros à esquerda).
+    """
+    if value < 0 or value >= BASE ** width:
+        raise ValueError("valor fora do espaço de slugs")
+    out = []
+    for _ in range(width):
+        value, r = divmod(value, BASE)
+        out.append(ALPHABET[r])
+    return "".join(reversed(out))
+
+class Permutation:
+    """
+    Bijeção pseudoaleatória em [0, domain): rede de Feistel com chave (HMAC-SHA256)
+    sobre o menor número par de bits que cobre o domínio, com cycle-walking para
+    cair de volta em [0, domain). Sequenciais viram slugs não adivinháveis.
+    """
+
+    def __init__(self, domain: int, key: bytes, rounds: int = 4):
+        bits = max(2, (domain - 1).bit_length())
+        bits += bits % 2
+        self.domain = domain
+        self.half = bits // 2
+        self.mask = (1 << self.half) - 1
+        self.key = key
+        self.rounds = rounds
+
+    def _round(self, i: int, x: int) -> int:
+        digest = hmac.new(self.key, i.to_bytes(1, "big") + x.to_bytes(8, "big"), hashlib.sha256).digest()
+        return int.from_bytes(digest[:8], "big") & self.mask
+
+    def __call__(self, x: int) -> int:
+        if not 0 <= x < self.domain:
+            raise ValueError("valor fora do domínio")
+        while True:
+            left, right = x >> self.half, x & self.mask
+            for i in range(self.rounds):
+                left, right = right, left ^ self._round(i, right)
+            x = (left << self.half) | right
+            if x < self.domain:
+                return x
+
+class RandomAllocator:
+    """
+    Estratégia antiga: até `tries` slugs aleatórios; o insert pode colidir.
+    """
+    name = "random"
+
+    def __init__(self, slug_len: int = 6, tries: int = 10):
+        self.slug_len = slug_len
+        self.tries = tries
+
+    def candidates(self, db: Connection):
+        for _ in range(self.tries):
+            yield random_slug(self.slug_len)
+
+    def stats(self) -> dict:
+        return {"strategy": self.name, "slug_len": self.slug_len}
+
+class CounterAllocator:
+    """
+    Contador em base62 com blocos reservados por processo: cada worker reserva
+    `block_size` ids de uma vez na tabela slug_counter e os consome em memória,
+    então dois workers nunca geram o mesmo slug. Com `key`, os ids passam por uma
+    Permutation antes de virar slug.
+
+    Um candidato só colide com slugs que não vieram do contador (slugs
+    personalizados ou aleatórios antigos); nesse caso o próximo id é usado.
+    """
+    name = "counter"
+
+    def __init__(self, slug_len: int = 6, block_size: int = 1000, key: bytes | None = None,
+                 max_skips: int = 100):
+        self.slug_len = slug_len
+        self.block_size = max(1, int(block_size))
+        self.capacity = BASE ** slug_len
+        self.permutation = Permutation(self.capacity, key) if key else None
+        self.max_skips = max_skips
+        self.counter_name = f"base62:{slug_len}"
+        self._lock = threading.Lock()
+        self._next = self._end = 0
+        self._pid = None
+        self._tx_db: Connection | None = None
+        self._blocks = 0
+        self._discarded = 0
+
+    def _reserve(self, db: Connection, n: int) -> None:
+        # Se o request já está numa transação (batch), a reserva vai junto nela e o
+        # bloco fica provisório: um rollback desfaz o UPDATE do contador
+        owns_tx = not db.in_transaction
+        db.execute("INSERT OR IGNORE INTO slug_counter (name, next) VALUES (?, 0)", (self.counter_name,))
+        db.execute("UPDATE slug_counter SET next = next + ? WHERE name = ?", (n, self.counter_name))
+        hi = db.execute("SELECT next FROM slug_counter WHERE name = ?", (self.counter_name,)).fetchone()[0]
+        if owns_tx:
+            db.commit()
+        self._next, self._end = hi - n, hi
+        self._tx_db = None if owns_tx else db
+        self._blocks += 1
+
+    def _check_block(self, db: Connection) -> None:
+        # Chamar com o lock. Bloco herdado via fork também estaria no processo pai, e
+        # bloco provisório só vale dentro da transação que o reservou: fora dela não há
+        # como saber se houve commit ou rollback, então o resto é descartado (perde ids,
+        # nunca repete)
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._next = self._end = 0
+            self._tx_db = None
+        elif self._tx_db is not None and (db is not self._tx_db or not db.in_transaction):
+            self._next = self._end = 0
+            self._tx_db = None
+            self._discarded += 1
+
+    def _take(self, db: Connection) -> int:
+        with self._lock:
+            self._check_block(db)
+            if self._next >= self._end:
+                self._reserve(db, self.block_size)
+            value = self._next
+            self._next += 1
+        if value >= self.capacity:
+            raise RuntimeError("espaço de slugs esgotado para SLUG_LEN={}".format(self.slug_len))
+        return value
+
+    def prefetch(self, db: Connection, n: int) -> None:
+        """
+        Garante ao menos n ids em memória (chamar fora de transação, antes de um lote).
+        """
+        with self._lock:
+            self._check_block(db)
+            if self._end - self._next < n:
+                self._reserve(db, max(n, self.block_size))
+
+    def candidates(self, db: Connection):
+        for _ in range(self.max_skips):
+            value = self._take(db)
+            if self.permutation is not None:
+                value = self.permutation(value)
+            yield encode_base62(value, self.slug_len)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "strategy": self.name,
+                "slug_len": self.slug_len,
+                "block_size": self.block_size,
+                "blocks_reserved": self._blocks,
+                "blocks_discarded": self._discarded,
+                "ids_left_in_block": max(0, self._end - self._next),
+                "permuted": self.permutation is not None,
+            }
+
+def _random_factory(app):
+    return RandomAllocator(int(app.config.get("SLUG_LEN", 6)))
+
+def _counter_factory(app):
+    key = None
+    if app.config.get("SLUG_PERMUTE", True):
+        secret = app.config.get("SLUG_SECRET") or app.config.get("SECRET_KEY") or ""
+        key = hashlib.sha256(("slug-permutation:" + str(secret)).encode("utf-8")).digest()
+    return CounterAllocator(
+        int(app.config.get("SLUG_LEN", 6)),
+        block_size=int(app.config.get("SLUG_BLOCK_SIZE", 1000)),
+        key=key,
+    )
+
+# SLUG_STRATEGY -> fábrica(app); novas estratégias só precisam de candidates(db) e stats()
+STRATEGIES = {
+    "random": _random_factory,
+    "counter": _counter_factory,
+}
+
+def get_allocator():
+    return current_app.extensions["slug_allocator"]
+
+def init_app(app):
+    strategy = str(app.config.get("SLUG_STRATEGY", "counter"))
+    if strategy not in STRATEGIES:
+        raise ValueError(f"SLUG_STRATEGY inválido: {strategy!r}")
+    app.extensions["slug_allocator"] = STRATEGIES[strategy](app)
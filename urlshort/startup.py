@@ -0,0 +1,204 @@
+from __future__ import annotations
+import os, sys, json, time, logging, sqlite3, subprocess, tempfile
+from contextlib import contextmanager
+from flask import current_app
+from jinja2 import FileSystemBytecodeCache
+import click
+
+log = logging.getLogger("app")
+
+# Links mais clicados nos últimos dias (rollup), para o pré-aquecimento do cache de slugs
+_HOT_LINKS_SQL = """
+SELECT l.id, l.slug, l.target_url, l.is_permanent, l.created_at
+FROM (
+  SELECT link_id, SUM(clicks) AS n FROM clicks_daily
+  WHERE day >= date('now', ?) GROUP BY link_id ORDER BY n DESC LIMIT ?
+) d JOIN links l ON l.id = d.link_id
+ORDER BY d.n DESC
+"""
+PREWARM_DAYS = 7
+
+class StartupTimer:
+    """
+    Tempo de cada fase do create_app, em ms, na ordem em que rodaram.
+    """
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.phases: dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + (time.perf_counter() - t) * 1000
+
+    def report(self) -> dict:
+        return {
+            "total_ms": round((time.perf_counter() - self.t0) * 1000, 2),
+            "phases_ms": {k: round(v, 2) for k, v in self.phases.items()},
+        }
+
+def setup_bytecode_cache(app) -> None:
+    """
+    Cache persistente de bytecode do Jinja: workers novos carregam os templates
+    já compilados (o arquivo é invalidado pelo checksum do fonte).
+    """
+    directory = app.config.get("TEMPLATE_CACHE_DIR")
+    if not directory:
+        return
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError:
+        log.warning("template cache dir unavailable: %s", directory)
+        return
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+def preload_templates(app) -> int:
+    """
+    Compila (ou carrega do cache de bytecode) todos os templates .html no processo.
+    """
+    env = app.jinja_env
+    names = [n for n in env.list_templates() if n.endswith(".html")]
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+def prewarm_slug_cache(app, limit: int) -> int:
+    """
+    Põe no cache de slugs os `limit` links mais clicados dos últimos PREWARM_DAYS
+    dias. Usa uma conexão própria (fechada em seguida): o create_app pode rodar no
+    master antes do fork. Falhas só viram aviso.
+    """
+    from .cache import LinkCache
+    from .db import connect, db_settings, DEFAULT_DB_PATH
+    cache: LinkCache | None = app.extensions.get("link_cache")
+    if cache is None or limit <= 0:
+        return 0
+    limit = min(limit, cache.max_size)
+    try:
+        conn = connect(app.config.get("DB_PATH", DEFAULT_DB_PATH), db_settings(app.config))
+        try:
+            rows = conn.execute(_HOT_LINKS_SQL, (f"-{PREWARM_DAYS} day", limit)).fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        log.warning("slug cache prewarm skipped: %s", e)
+        return 0
+    # Do menos para o mais clicado: os quentes ficam no fim do LRU
+    for row in reversed(rows):
+        cache.put(row["slug"], dict(row))
+    return len(rows)
+
+def finish(app, timer: StartupTimer) -> None:
+    """
+    Últimas fases do create_app (templates, cache de slugs) e o log do tempo total.
+    """
+    with timer.phase("templates"):
+        setup_bytecode_cache(app)
+        if app.config.get("TEMPLATE_PRELOAD", True):
+            preload_templates(app)
+    with timer.phase("prewarm"):
+        prewarm_slug_cache(app, int(app.config.get("SLUG_CACHE_PREWARM", 0)))
+    report = timer.report()
+    app.extensions["startup"] = report
+    log.info("startup total=%.1fms %s", report["total_ms"],
+             " ".join(f"{k}={v:.1f}ms" for k, v in report["phases_ms"].items()))
+
+def get_startup() -> dict | None:
+    return current_app.extensions.get("startup")
+
+# Arquivos que o processo do probe pode gravar; no startup-bench vão para um diretório
+# temporário (o banco vai como cópia): o redirect medido não toca nos dados de verdade
+_PROBE_STATE = {
+    "RATE_LIMIT_DB": "ratelimit.db",
+    "CLICK_PARTITION_DIR": "clicks",
+    "ARCHIVE_DIR": "archive",
+    "TRENDING_DIR": "trending",
+    "METRICS_DIR": "metrics",
+}
+
+def copy_database(src_path: str, dst_path: str) -> None:
+    """
+    Cópia consistente do banco (API de backup do sqlite3, segura com o app no ar).
+    """
+    src = sqlite3.connect(src_path)
+    try:
+        dst = sqlite3.connect(dst_path)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+    finally:
+        src.close()
+
+def _probe_env(config, workdir: str) -> dict:
+    db_copy = os.path.join(workdir, "probe.db")
+    copy_database(config.get("DB_PATH", ""), db_copy)
+    env = dict(os.environ, DB_PATH=db_copy, LOG_LEVEL="WARNING")
+    for key, name in _PROBE_STATE.items():
+        # Diretório vazio no config (trending/métricas só em memória) continua vazio
+        if config.get(key):
+            env[key] = os.path.join(workdir, name)
+    return env
+
+def _probe(slug: str) -> None:
+    # Roda num processo novo (startup-bench): import, create_app e o primeiro redirect
+    t0 = time.perf_counter()
+    from .app import create_app
+    t_import = time.perf_counter()
+    app = create_app()
+    t_app = time.perf_counter()
+    status = app.test_client().get(f"/{slug}").status_code
+    t_first = time.perf_counter()
+    print(json.dumps({
+        "import_ms": round((t_import - t0) * 1000, 2),
+        "create_app_ms": round((t_app - t_import) * 1000, 2),
+        "first_redirect_ms": round((t_first - t_app) * 1000, 2),
+        "status": status,
+        "phases_ms": app.extensions["startup"]["phases_ms"],
+    }))
+
+@click.command("startup-bench")
+@click.option("--slug", default=None, help="Slug do redirect (padrão: o link mais recente).")
+@click.option("--runs", type=int, default=3, show_default=True, help="Processos novos a medir.")
+@click.option("--clear-template-cache", is_flag=True, help="Apaga o cache de bytecode antes da 1ª rodada.")
+def startup_bench_command(slug, runs, clear_template_cache):
+    """
+    Mede o cold start: processo Python novo até a resposta do primeiro redirect.
+    """
+    from .db import get_db
+    if slug is None:
+        row = get_db().execute("SELECT slug FROM links ORDER BY id DESC LIMIT 1").fetchone()
+        if row is None:
+            raise click.ClickException("nenhum link no banco; use --slug")
+        slug = row["slug"]
+    cache_dir = current_app.config.get("TEMPLATE_CACHE_DIR")
+    if clear_template_cache and cache_dir and os.path.isdir(cache_dir):
+        for fn in os.listdir(cache_dir):
+            if fn.startswith("__jinja2_") and fn.endswith(".cache"):
+                os.remove(os.path.join(cache_dir, fn))
+    # O filho lê o mesmo config (APP_CONFIG/variáveis) e o mesmo cache de templates,
+    # mas roda contra uma cópia do banco: migrações, contador de slugs e cliques ficam nela
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = f"from urlshort.startup import _probe; _probe({slug!r})"
+    with tempfile.TemporaryDirectory(prefix="startup-bench-") as workdir:
+        env = _probe_env(current_app.config, workdir)
+        env["PYTHONPATH"] = os.pathsep.join(p for p in (root, env.get("PYTHONPATH")) if p)
+        for i in range(1, runs + 1):
+            t0 = time.perf_counter()
+            out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True)
+            wall = (time.perf_counter() - t0) * 1000
+            if out.returncode != 0:
+                raise click.ClickException(out.stderr.strip().splitlines()[-1] if out.stderr.strip() else "probe failed")
+            r = json.loads([l for l in out.stdout.splitlines() if l.startswith("{")][-1])
+            click.echo(
+                f"#{i} processo={wall:.1f}ms import={r['import_ms']:.1f}ms create_app={r['create_app_ms']:.1f}ms "
+                f"primeiro_redirect={r['first_redirect_ms']:.1f}ms status={r['status']}"
+            )
+            click.echo("   " + " ".join(f"{k}={v:.1f}ms" for k, v in r["phases_ms"].items()))
+
+def init_app(app):
+    app.cli.add_command(startup_bench_command)
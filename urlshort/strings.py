@@ -0,0 +1,149 @@
+from __future__ import annotations
+from sqlite3 import Connection
+from flask import current_app, has_app_context
+from .cache import LinkCache
+
+# user_agent e referrer dos cliques ficam em tabelas de dicionário (user_agents,
+# referrers: id -> texto único); clicks guarda só os ids. Ver models.sql e a
+# migração 0002.
+TABLES = {"user_agent": "user_agents", "referrer": "referrers"}
+# Ids nunca mudam: o TTL só existe porque LinkCache exige um
+_TTL = 24 * 3600.0
+_IN_CHUNK = 500
+
+# Colunas de texto reconstituídas (com os nomes antigos), junto com join_sql()
+SELECT_COLUMNS = "ua.value AS user_agent, rf.value AS referrer"
+
+def join_sql(alias: str = "c") -> str:
+    """
+    JOINs com os dicionários; vale para clicks do banco principal e das partições.
+    """
+    return (f"LEFT JOIN main.user_agents ua ON ua.id = {alias}.user_agent_id "
+            f"LEFT JOIN main.referrers rf ON rf.id = {alias}.referrer_id")
+
+class StringTable:
+    """
+    Uma tabela de dicionário com LRU texto -> id na frente (opcional).
+    """
+
+    def __init__(self, table: str, cache: LinkCache | None = None):
+        self.table = table
+        self.cache = cache
+
+    def cached_id(self, value):
+        """
+        Id do texto se estiver no LRU; senão devolve o próprio texto (resolvido no flush).
+        """
+        if value is None or self.cache is None:
+            return value
+        hit = self.cache.get(value)
+        return value if hit is None else hit
+
+    def ids(self, db: Connection, values: set[str]) -> dict[str, int]:
+        """
+        Ids dos textos, criando os que faltam (INSERT OR IGNORE). Roda na transação
+        do chamador.
+        """
+        out, missing = {}, []
+        for v in values:
+            hit = self.cache.get(v) if self.cache is not None else None
+            if hit is None:
+                missing.append(v)
+            else:
+                out[v] = hit
+        if missing:
+            db.executemany(f"INSERT OR IGNORE INTO main.{self.table} (value) VALUES (?)", [(v,) for v in missing])
+            for i in range(0, len(missing), _IN_CHUNK):
+                chunk = missing[i:i + _IN_CHUNK]
+                sql = f"SELECT id, value FROM main.{self.table} WHERE value IN ({','.join('?' * len(chunk))})"
+                for id_, value in db.execute(sql, chunk).fetchall():
+                    out[value] = id_
+                    if self.cache is not None:
+                        self.cache.put(value, id_)
+        return out
+
+class ClickEncoder:
+    """
+    Troca user_agent/referrer por ids de dicionário. `lookup` só consulta o LRU
+    (nada de banco no caminho do redirect); `encode` resolve o resto em lote.
+    """
+
+    def __init__(self, max_size: int = 10000):
+        make = (lambda: LinkCache(max_size, _TTL)) if max_size > 0 else (lambda: None)
+        self.user_agents = StringTable(TABLES["user_agent"], make())
+        self.referrers = StringTable(TABLES["referrer"], make())
+
+    def lookup(self, user_agent, referrer) -> tuple:
+        return self.user_agents.cached_id(user_agent), self.referrers.cached_id(referrer)
+
+    def encode(self, db: Connection, rows: list[tuple]) -> list[tuple]:
+        """
+        rows (link_id, ts, ip, user_agent, referrer), com textos ou ids já
+        resolvidos, -> mesmas linhas só com ids.
+        """
+        ua = self.user_agents.ids(db, {r[3] for r in rows if isinstance(r[3], str)})
+        rf = self.referrers.ids(db, {r[4] for r in rows if isinstance(r[4], str)})
+        return [(r[0], r[1], r[2], ua.get(r[3], r[3]), rf.get(r[4], r[4])) for r in rows]
+
+    def stats(self) -> dict:
+        return {
+            "user_agents": self.user_agents.cache.stats() if self.user_agents.cache else None,
+            "referrers": self.referrers.cache.stats() if self.referrers.cache else None,
+        }
+
+def get_encoder() -> ClickEncoder | None:
+    if not has_app_context():
+        return None
+    return current_app.extensions.get("click_strings")
+
+def encode_table(db: Connection, schema: str, foreign_keys: bool, progress=print) -> int:
+    """
+    Converte `schema`.clicks do formato antigo (textos) para ids de dicionário:
+    interna os textos distintos, copia para uma tabela nova com JOIN, troca as
+    tabelas e recria o índice (link_id, ts). Roda na transação do chamador; o
+    espaço só volta ao disco com VACUUM. Retorna o número de linhas (0 se já convertida).
+    """
+    cols = [r[1] for r in db.execute(f"PRAGMA {schema}.table_info(clicks)").fetchall()]
+    if not cols or "user_agent_id" in cols:
+        return 0
+    for column, table in TABLES.items():
+        progress(f"{schema}.clicks: internando {column}")
+        db.execute(
+            f"INSERT OR IGNORE INTO main.{table} (value) "
+            f"SELECT DISTINCT {column} FROM {schema}.clicks WHERE {column} IS NOT NULL"
+        )
+    fk = ",\n      FOREIGN KEY (link_id) REFERENCES links(id) ON DELETE CASCADE" if foreign_keys else ""
+    db.execute(f"""
+    CREATE TABLE {schema}.clicks_new (
+      id            INTEGER PRIMARY KEY AUTOINCREMENT,
+      link_id       INTEGER NOT NULL,
+      ts            DATETIME NOT NULL DEFAULT (CURRENT_TIMESTAMP),
+      ip            TEXT,
+      user_agent_id INTEGER,
+      referrer_id   INTEGER{fk}
+    )""")
+    progress(f"{schema}.clicks: copiando linhas")
+    n = db.execute(f"""
+    INSERT INTO {schema}.clicks_new (id, link_id, ts, ip, user_agent_id, referrer_id)
+    SELECT c.id, c.link_id, c.ts, c.ip, ua.id, rf.id
+    FROM {schema}.clicks c
+    LEFT JOIN main.user_agents ua ON ua.value = c.user_agent
+    LEFT JOIN main.referrers rf ON rf.value = c.referrer
+    """).rowcount
+    # Preserva o AUTOINCREMENT (nas partições ele carrega o mês, ver partitions.py)
+    seq = db.execute(f"SELECT seq FROM {schema}.sqlite_sequence WHERE name = 'clicks'").fetchone()
+    db.execute(f"DROP TABLE {schema}.clicks")
+    db.execute(f"ALTER TABLE {schema}.clicks_new RENAME TO clicks")
+    if seq is not None:
+        db.execute(f"UPDATE {schema}.sqlite_sequence SET seq = max(seq, ?) WHERE name = 'clicks'", (seq[0],))
+        db.execute(
+            f"INSERT INTO {schema}.sqlite_sequence (name, seq) SELECT 'clicks', ? "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {schema}.sqlite_sequence WHERE name = 'clicks')",
+            (seq[0],),
+        )
+    progress(f"{schema}.clicks: recriando índice")
+    db.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_clicks_link_ts ON clicks(link_id, ts)")
+    return n
+
+def init_app(app):
+    app.extensions["click_strings"] = ClickEncoder(int(app.config.get("STRING_CACHE_SIZE", 10000)))
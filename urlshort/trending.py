@@ -0,0 +1,236 @@
+from __future__ import annotations
+import os, json, time, atexit, logging, threading
+from flask import current_app
+
+log = logging.getLogger("app")
+
+# Links mais clicados em janelas deslizantes, em memória, alimentados pelo redirect.
+# Cada janela é um anel de buckets de tempo; cada bucket é um resumo Space-Saving
+# com no máximo `capacity` links. Memória fixa: soma de buckets x capacity entradas.
+# Janela: (duração, granularidade) em segundos; a janela cobre os buckets que
+# começaram há menos de `duração` (o bucket atual está incompleto).
+WINDOWS = {"5m": (300, 30), "1h": (3600, 300), "24h": (86400, 3600)}
+DEFAULT_WINDOW = "1h"
+
+class SpaceSaving:
+    """
+    Resumo Space-Saving (Metwally et al.): `capacity` contadores; um link novo com o
+    resumo cheio herda o menor contador (que vira o erro máximo dele). Qualquer link
+    com mais de N/capacity cliques no bucket está garantidamente no resumo.
+    """
+
+    __slots__ = ("capacity", "counts", "errors")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: dict[int, int] = {}
+        self.errors: dict[int, int] = {}
+
+    def add(self, key: int, n: int = 1) -> None:
+        counts = self.counts
+        if key in counts:
+            counts[key] += n
+            return
+        if len(counts) < self.capacity:
+            counts[key] = n
+            return
+        # O(capacity), mas só para links fora do resumo; os quentes já estão nele
+        victim = min(counts, key=counts.__getitem__)
+        floor = counts.pop(victim)
+        self.errors.pop(victim, None)
+        counts[key] = floor + n
+        self.errors[key] = floor
+
+    def items(self) -> list[list]:
+        return [[k, c, self.errors.get(k, 0)] for k, c in self.counts.items()]
+
+def merge(summaries: list[list], capacity: int) -> list[tuple[int, int, int]]:
+    """
+    Une resumos (listas [link_id, contagem, erro]) de buckets e processos
+    diferentes: as contagens somam. Num resumo cheio, um link ausente pode ter
+    até o menor contador dele; isso entra no erro. Retorna [(link_id, cliques,
+    erro)] com o valor real em cliques ± erro, do maior para o menor.
+    """
+    counts: dict[int, int] = {}
+    errors: dict[int, int] = {}
+    floors: list[tuple[int, set]] = []
+    for items in summaries:
+        if not items:
+            continue
+        for k, c, e in items:
+            counts[k] = counts.get(k, 0) + c
+            errors[k] = errors.get(k, 0) + e
+        if len(items) >= capacity:
+            floors.append((min(c for _, c, _ in items), {k for k, _, _ in items}))
+    for floor, present in floors:
+        for k in counts:
+            if k not in present:
+                errors[k] += floor
+    out = sorted(((k, c, errors[k]) for k, c in counts.items()), key=lambda t: (-t[1], t[0]))
+    return out[:capacity]
+
+class Trending:
+    """
+    Top-N do processo + (opcional) diretório compartilhado entre workers, como em
+    metrics.py: cada processo grava seus buckets em TRENDING_DIR/trending-<pid>.json
+    a cada `flush_interval` segundos e top() une os arquivos. Buckets velhos saem
+    pela janela, então arquivos de workers encerrados param de contar sozinhos.
+    """
+
+    def __init__(self, capacity: int = 100, directory: str | None = None, flush_interval: float = 5.0):
+        self.capacity = max(1, int(capacity))
+        self.directory = directory
+        self.flush_interval = float(flush_interval)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._rings: dict[str, dict[int, SpaceSaving]] = {w: {} for w in WINDOWS}
+        self._pid = os.getpid()
+        self._last_flush = 0.0
+
+    def _ensure_process(self) -> None:
+        # Depois de um fork o filho começa do zero (o pai grava os próprios buckets)
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._rings = {w: {} for w in WINDOWS}
+            self._last_flush = 0.0
+
+    def record(self, link_id: int, now: float | None = None, flush: bool = True) -> None:
+        """
+        Conta um clique. Com flush=False nunca faz I/O (event loop do ASGI): o
+        chamador confere flush_due() e roda maybe_flush() fora do loop.
+        """
+        self._ensure_process()
+        now = time.time() if now is None else now
+        with self._lock:
+            for name, (span, step) in WINDOWS.items():
+                ring = self._rings[name]
+                start = int(now // step) * step
+                summary = ring.get(start)
+                if summary is None:
+                    for old in [s for s in ring if s <= now - span]:
+                        del ring[old]
+                    summary = ring[start] = SpaceSaving(self.capacity)
+                summary.add(link_id)
+        if flush:
+            self.maybe_flush()
+
+    def local_snapshot(self, now: float | None = None) -> dict:
+        now = time.time() if now is None else now
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "windows": {
+                    name: [[start, s.items()] for start, s in ring.items() if start > now - WINDOWS[name][0]]
+                    for name, ring in self._rings.items()
+                },
+            }
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"trending-{pid}.json")
+
+    def flush(self) -> None:
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(os.getpid())
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.local_snapshot(), f)
+        os.replace(tmp, path)
+        self._last_flush = time.monotonic()
+
+    def flush_due(self) -> bool:
+        return bool(self.directory) and time.monotonic() - self._last_flush >= self.flush_interval
+
+    def maybe_flush(self) -> None:
+        # Um flush por vez (o .tmp é o mesmo); quem chega durante um flush não espera
+        if not self.flush_due() or not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            if self.flush_due():
+                self.flush()
+        except OSError:
+            log.exception("trending flush failed")
+        finally:
+            self._flush_lock.release()
+
+    def _snapshots(self, now: float) -> list[dict]:
+        snapshots = [self.local_snapshot(now)]
+        if not self.directory or not os.path.isdir(self.directory):
+            return snapshots
+        own = os.path.basename(self._path(os.getpid()))
+        oldest = now - max(span for span, _ in WINDOWS.values())
+        for fn in os.listdir(self.directory):
+            if not (fn.startswith("trending-") and fn.endswith(".json")) or fn == own:
+                continue
+            path = os.path.join(self.directory, fn)
+            try:
+                if os.path.getmtime(path) < oldest:
+                    continue
+                with open(path, encoding="utf-8") as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def top(self, window: str = DEFAULT_WINDOW, limit: int = 10, now: float | None = None) -> dict:
+        """
+        {"window", "since", "workers", "items": [(link_id, cliques, erro)]}, com os
+        buckets da janela de todos os processos.
+        """
+        now = time.time() if now is None else now
+        span = WINDOWS[window][0]
+        snapshots = self._snapshots(now)
+        summaries = []
+        since = None
+        for snap in snapshots:
+            for start, items in snap.get("windows", {}).get(window, []):
+                if start > now - span:
+                    summaries.append(items)
+                    since = start if since is None else min(since, start)
+        # Resumos de processos com outra capacidade: une pela menor
+        capacity = min([self.capacity] + [int(s.get("capacity", self.capacity)) for s in snapshots])
+        return {
+            "window": window,
+            "since": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(since)) if since is not None else None,
+            "workers": len(snapshots),
+            "items": merge(summaries, capacity)[:limit],
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = sum(len(s.counts) for ring in self._rings.values() for s in ring.values())
+            buckets = sum(len(ring) for ring in self._rings.values())
+        return {"capacity": self.capacity, "buckets": buckets, "entries": entries}
+
+def get_trending() -> Trending | None:
+    return current_app.extensions.get("trending")
+
+def top_links(db, window: str, limit: int) -> dict:
+    """
+    top() com slug e destino de cada link (uma consulta por chave primária).
+    """
+    result = get_trending().top(window, limit)
+    ids = [k for k, _, _ in result["items"]]
+    links = {}
+    if ids:
+        rows = db.execute(
+            f"SELECT id, slug, target_url FROM links WHERE id IN ({','.join('?' * len(ids))})", ids
+        ).fetchall()
+        links = {r["id"]: r for r in rows}
+    result["items"] = [
+        {"slug": links[k]["slug"], "target_url": links[k]["target_url"], "clicks": c, "error": e}
+        for k, c, e in result["items"] if k in links
+    ]
+    return result
+
+def init_app(app):
+    if not app.config.get("TRENDING_ENABLED", True):
+        return
+    tracker = Trending(
+        capacity=int(app.config.get("TRENDING_CAPACITY", 100)),
+        directory=app.config.get("TRENDING_DIR") or None,
+        flush_interval=float(app.config.get("TRENDING_FLUSH_INTERVAL", 5)),
+    )
+    app.extensions["trending"] = tracker
+    atexit.register(lambda: tracker.directory and tracker._pid == os.getpid() and tracker.flush())